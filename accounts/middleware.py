@@ -0,0 +1,30 @@
+from django.utils.functional import SimpleLazyObject
+
+from .models import ClientSubscription
+
+
+def subscription_for(user):
+    """
+    The ClientSubscription a user works in: the one they're a member of,
+    else the one they own, else None. The user row already carries
+    subscription_id, so this is a single primary-key or owner lookup.
+    """
+    if user is None or not user.is_authenticated:
+        return None
+    if user.subscription_id:
+        return ClientSubscription.objects.filter(pk=user.subscription_id).first()
+    return ClientSubscription.objects.filter(owner_id=user.pk).first()
+
+
+class CurrentSubscriptionMiddleware:
+    """
+    Sets request.subscription, resolved from the database on first use and
+    memoised for the rest of the request. It is lazy because DRF
+    authenticates token requests inside the view, after middleware has run.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.subscription = SimpleLazyObject(lambda: subscription_for(request.user))
+        return self.get_response(request)
@@ -12,4 +12,11 @@ class IsCashier(permissions.BasePermission):
     Allows access only to cashier users.
     """
     def has_permission(self, request, view):
-        return request.user.is_authenticated and request.user.role == 'cashier'
\ No newline at end of file
+        return request.user.is_authenticated and request.user.role == 'cashier'
+
+class IsOwnerOrAdmin(permissions.BasePermission):
+    """
+    Allows access only to subscription owners and admin users.
+    """
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and request.user.role in ['owner', 'admin']
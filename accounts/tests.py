@@ -1,3 +1,44 @@
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from products.models import Category, Product
+
+from .middleware import subscription_for
+from .models import ClientSubscription, User
+
+
+class CurrentSubscriptionTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email='owner@example.com', password='pass',
+            first_name='Own', last_name='Er', role='owner',
+        )
+        self.sub = ClientSubscription.objects.create(owner=self.owner, business_name='Shop')
+        self.cashier = User.objects.create_user(
+            email='cashier@example.com', password='pass',
+            first_name='Cash', last_name='Ier', role='cashier',
+        )
+        self.cashier.subscription = self.sub
+        self.cashier.save()
+
+    def test_owner_and_member_resolve_in_one_query(self):
+        for user in (self.owner, self.cashier):
+            user = User.objects.get(pk=user.pk)
+            with self.assertNumQueries(1):
+                self.assertEqual(subscription_for(user), self.sub)
+
+    def test_changes_are_seen_on_the_next_request(self):
+        ClientSubscription.objects.filter(pk=self.sub.pk).update(active=False)
+        self.assertFalse(subscription_for(self.owner).active)
+
+        self.cashier.subscription = None
+        self.cashier.save()
+        self.assertIsNone(subscription_for(self.cashier))
+
+    def test_api_views_use_request_subscription(self):
+        Product.objects.create(subscription=self.sub, name='Tea', sku='TEA',
+                               category=Category.objects.create(name='Drinks'), price='1.00')
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.cashier.pk))
+        response = client.get('/api/products/low-stock/')
+        self.assertEqual([p['sku'] for p in response.json()['results']], ['TEA'])
@@ -12,6 +12,7 @@ from decouple import config
 import dj_database_url
 
 from datetime import timedelta
+from celery.schedules import crontab
 from django.urls import reverse_lazy
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -54,6 +55,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add this line
+    'accounts.middleware.CurrentSubscriptionMiddleware',
     'subscriptions.middleware.SubscriptionRequiredMiddleware',
 ]
 
@@ -167,7 +169,7 @@ AUTHENTICATION_BACKENDS = [
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
-        "LOCATION": "redis://127.0.0.1:6379/1",
+        "LOCATION": config('REDIS_CACHE_URL', default='redis://127.0.0.1:6379/1'),
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
         },
@@ -176,16 +178,79 @@ CACHES = {
 }
 
 # Celery
-CELERY_BROKER_URL = 'redis://localhost:6379/0'
-CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
+CELERY_RESULT_BACKEND = CELERY_BROKER_URL
 CELERY_TIMEZONE = "UTC"
+# Report exports run on their own queue: celery -A core worker -Q exports
+CELERY_TASK_ROUTES = {
+    'reports.tasks.run_export_job': {'queue': 'exports'},
+}
+# Periodic tasks: celery -A core beat
+CELERY_BEAT_SCHEDULE = {
+    'suggest-reorders': {
+        'task': 'products.tasks.refresh_reorder_suggestions',
+        'schedule': crontab(hour=2, minute=0),
+    },
+    'forecast-demand': {
+        'task': 'products.tasks.refresh_forecasts',
+        'schedule': crontab(hour=2, minute=30),
+    },
+    'stock-snapshots': {
+        'task': 'reports.tasks.snapshot_stock',
+        'schedule': crontab(hour=0, minute=5),
+    },
+    'refresh-sales-rollups': {
+        'task': 'reports.tasks.refresh_rollups',
+        'schedule': crontab(hour=1, minute=0),
+    },
+    'purge-exports': {
+        'task': 'reports.tasks.purge_exports',
+        'schedule': crontab(hour=4, minute=0),
+    },
+    'check-stock-ledger': {
+        'task': 'products.tasks.check_stock_ledger',
+        'schedule': crontab(hour=3, minute=0),
+    },
+}
+
+# Finished report exports and import error reports. Workers write them and
+# the web service serves them, so deployments with separate services set
+# EXPORT_BUCKET to an S3-compatible bucket (needs django-storages; the AWS_*
+# settings below are read by its S3Storage). Without it files go to EXPORT_ROOT.
+EXPORT_ROOT = config('EXPORT_ROOT', default=os.path.join(BASE_DIR, 'exports'))
+EXPORT_BUCKET = config('EXPORT_BUCKET', default='')
+AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID', default=None)
+AWS_SECRET_ACCESS_KEY = config('AWS_SECRET_ACCESS_KEY', default=None)
+AWS_S3_ENDPOINT_URL = config('AWS_S3_ENDPOINT_URL', default=None)
+AWS_S3_REGION_NAME = config('AWS_S3_REGION_NAME', default=None)
+# Days an export job and its file are kept before the nightly purge
+EXPORT_RETENTION_DAYS = config('EXPORT_RETENTION_DAYS', default=7, cast=int)
 
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY')
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY')
 STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET', default='')
 
 DEFAULT_TAX_RATE = config('DEFAULT_TAX_RATE', default=0.08, cast=float)
+# Default reorder level for new products
 LOW_STOCK_THRESHOLD = config('LOW_STOCK_THRESHOLD', default=5, cast=int)
+# Nightly reorder suggestions: sales history used, and days of sales to cover
+REORDER_LOOKBACK_DAYS = config('REORDER_LOOKBACK_DAYS', default=28, cast=int)
+REORDER_COVER_DAYS = config('REORDER_COVER_DAYS', default=14, cast=int)
+# Demand forecasts: days of sales history, days averaged for the level,
+# and how far ahead stock-outs are projected
+FORECAST_HISTORY_DAYS = config('FORECAST_HISTORY_DAYS', default=56, cast=int)
+FORECAST_WINDOW_DAYS = config('FORECAST_WINDOW_DAYS', default=28, cast=int)
+FORECAST_HORIZON_DAYS = config('FORECAST_HORIZON_DAYS', default=60, cast=int)
+# End-of-day stock snapshots: days kept daily before thinning to weekly,
+# and days kept at all
+STOCK_SNAPSHOT_DAILY_DAYS = config('STOCK_SNAPSHOT_DAILY_DAYS', default=90, cast=int)
+STOCK_SNAPSHOT_RETENTION_DAYS = config('STOCK_SNAPSHOT_RETENTION_DAYS', default=730, cast=int)
+# Closed days of sales rollups rebuilt from the orders each night
+SALES_ROLLUP_REFRESH_DAYS = config('SALES_ROLLUP_REFRESH_DAYS', default=7, cast=int)
+IDEMPOTENCY_KEY_TTL_HOURS = config('IDEMPOTENCY_KEY_TTL_HOURS', default=24, cast=int)
+# Per-worker SKU scan cache (products.sku_index)
+SKU_INDEX_MAX_SUBSCRIPTIONS = config('SKU_INDEX_MAX_SUBSCRIPTIONS', default=32, cast=int)
+SKU_INDEX_TTL_SECONDS = config('SKU_INDEX_TTL_SECONDS', default=60, cast=int)
 
 SUBSCRIPTION_REQUIRED = config('SUBSCRIPTION_REQUIRED', default=False, cast=bool)
 
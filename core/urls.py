@@ -28,6 +28,7 @@ urlpatterns = [
     # API
     path('api/auth/', include('accounts.api.urls')),
     path('api/sales/', include('sales.api_urls')),
+    path('api/products/', include('products.api_urls')),
 
     # Admin
     path('admin/', admin.site.urls),
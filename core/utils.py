@@ -26,4 +26,31 @@ def currency(value):
         return f"{symbol}{formatted_number}"
     except Exception:
         # Ultimate fallback formatting
-        return f"{symbol}{float(amt):.2f}"
\ No newline at end of file
+        return f"{symbol}{float(amt):.2f}"
+
+def currency_number_format():
+    """
+    Spreadsheet number format that displays amounts like currency() while
+    keeping the cell numeric.
+    """
+    places = getattr(settings, 'DECIMAL_PLACES', 2)
+    symbol = getattr(settings, 'CURRENCY_SYMBOL', 'P')
+    decimals = f".{'0' * places}" if places else ''
+    return f'"{symbol}"#,##0{decimals}'
+
+def generated_file_storage():
+    """
+    Storage for generated files (report exports, import error reports).
+    The exports worker writes them and the web service serves them, so with
+    EXPORT_BUCKET set they go to that S3-compatible bucket both can reach;
+    otherwise they stay under EXPORT_ROOT on local disk.
+    """
+    if getattr(settings, 'EXPORT_BUCKET', ''):
+        from storages.backends.s3 import S3Storage  # only needed with a bucket
+
+        return S3Storage(bucket_name=settings.EXPORT_BUCKET, location='generated',
+                         default_acl='private', file_overwrite=False)
+
+    from django.core.files.storage import FileSystemStorage
+
+    return FileSystemStorage(location=settings.EXPORT_ROOT)
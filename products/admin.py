@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Product
+from .models import Category, Product, ProductForecast, ProductImport, ReorderSuggestion, StockMovement, StocktakeSession
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -11,3 +11,41 @@ class ProductAdmin(admin.ModelAdmin):
     list_display = ('name', 'category', 'price', 'stock', 'subscription')
     search_fields = ('name', 'sku', 'category__name')
     list_filter = ('subscription', 'category', 'is_active')
+    # Stock changes go through restocks, sales and stocktakes so each one
+    # lands in the StockMovement ledger
+    readonly_fields = ('stock',)
+
+@admin.register(ProductImport)
+class ProductImportAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'subscription', 'status', 'created_count', 'updated_count', 'rejected_count', 'created_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'finished_at')
+
+@admin.register(ReorderSuggestion)
+class ReorderSuggestionAdmin(admin.ModelAdmin):
+    list_display = ('product', 'subscription', 'stock', 'daily_velocity', 'suggested_quantity', 'computed_at')
+    list_filter = ('subscription',)
+
+@admin.register(ProductForecast)
+class ProductForecastAdmin(admin.ModelAdmin):
+    list_display = ('product', 'subscription', 'daily_demand', 'projected_stockout', 'recommended_quantity', 'computed_at')
+    list_filter = ('subscription',)
+
+@admin.register(StocktakeSession)
+class StocktakeSessionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subscription', 'status', 'started_by', 'created_at', 'applied_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'applied_at')
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('product', 'kind', 'quantity', 'stock_after', 'reference', 'user', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('product__sku', 'reference')
+    raw_id_fields = ('product', 'user')
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,27 @@
+from django.urls import path
+from .views import (
+    CatalogView, InventoryValuationView, LowStockView, ProductBulkUpdateView,
+    ProductScanView, ProductSearchView, ReceiveStockView, StocktakeApplyView,
+    StocktakeCancelView, StocktakeDetailView, StocktakeListView, StocktakeScanView,
+    StocktakeVarianceView, StockAtView, StockMovementListView,
+)
+
+app_name = 'products_api'
+
+urlpatterns = [
+    path('', CatalogView.as_view(), name='catalog'),
+    path('search/', ProductSearchView.as_view(), name='search'),
+    path('low-stock/', LowStockView.as_view(), name='low-stock'),
+    path('bulk-update/', ProductBulkUpdateView.as_view(), name='bulk-update'),
+    path('receive/', ReceiveStockView.as_view(), name='receive'),
+    path('valuation/', InventoryValuationView.as_view(), name='valuation'),
+    path('movements/', StockMovementListView.as_view(), name='movements'),
+    path('stock-at/', StockAtView.as_view(), name='stock-at'),
+    path('stocktakes/', StocktakeListView.as_view(), name='stocktake-list'),
+    path('stocktakes/<int:pk>/', StocktakeDetailView.as_view(), name='stocktake-detail'),
+    path('stocktakes/<int:pk>/scans/', StocktakeScanView.as_view(), name='stocktake-scans'),
+    path('stocktakes/<int:pk>/variances/', StocktakeVarianceView.as_view(), name='stocktake-variances'),
+    path('stocktakes/<int:pk>/apply/', StocktakeApplyView.as_view(), name='stocktake-apply'),
+    path('stocktakes/<int:pk>/cancel/', StocktakeCancelView.as_view(), name='stocktake-cancel'),
+    path('scan/<str:sku>/', ProductScanView.as_view(), name='scan'),
+]
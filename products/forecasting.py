@@ -0,0 +1,138 @@
+# products/forecasting.py
+# Demand forecasts for replenishment: each subscription's daily product sales
+# are loaded into one products x days matrix and forecast with array maths,
+# so the cost barely grows with the number of SKUs.
+
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Product, ProductForecast
+
+FORECAST_WRITE_BATCH_SIZE = 5000
+
+
+def load_sales(subscription, start_date, end_date):
+    """
+    Units sold per product per day from the daily product rollups, as a
+    DataFrame indexed by product id with one column per day (zero-filled).
+    """
+    from reports.models import DailyProductRollup  # reports imports this app
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT product_id, date, units
+            FROM {DailyProductRollup._meta.db_table}
+            WHERE subscription_id = %s AND date BETWEEN %s AND %s
+            """,
+            [subscription.id, start_date, end_date],
+        )
+        frame = pd.DataFrame(cursor.fetchall(), columns=['product_id', 'date', 'units'])
+
+    days = pd.date_range(start_date, end_date, freq='D')
+    if frame.empty:
+        return pd.DataFrame(columns=days, dtype=float)
+    frame['date'] = pd.to_datetime(frame['date'])
+    return frame.pivot_table(
+        index='product_id', columns='date', values='units', aggfunc='sum', fill_value=0
+    ).reindex(columns=days, fill_value=0).astype(float)
+
+
+def forecast_demand(sales, first_day, horizon, window):
+    """
+    Forecast daily demand for `horizon` days from first_day.
+
+    The level is each product's average over the last `window` days; it is
+    shaped by a day-of-week factor (that weekday's average over the whole
+    history relative to the overall average), so weekend-heavy products get
+    weekend-heavy forecasts. Returns an array of shape (products, horizon).
+    """
+    history = sales.to_numpy()
+    if not len(history):
+        return np.zeros((0, horizon))
+
+    level = history[:, -window:].mean(axis=1)
+
+    weekdays = sales.columns.dayofweek.to_numpy()
+    overall = history.mean(axis=1)
+    by_weekday = np.stack([
+        history[:, weekdays == day].mean(axis=1) if (weekdays == day).any() else overall
+        for day in range(7)
+    ], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        seasonality = np.where(overall[:, None] > 0, by_weekday / overall[:, None], 1.0)
+
+    horizon_weekdays = pd.date_range(first_day, periods=horizon, freq='D').dayofweek.to_numpy()
+    return level[:, None] * seasonality[:, horizon_weekdays]
+
+
+def forecast_subscription(subscription, today=None):
+    """
+    Forecast every active product of the subscription and store the result
+    in ProductForecast: average daily demand, projected stock-out date within
+    FORECAST_HORIZON_DAYS, and the quantity to order to stay above the
+    reorder level for REORDER_COVER_DAYS. Returns the number of products.
+    """
+    today = today or timezone.localdate()
+    history_days = settings.FORECAST_HISTORY_DAYS
+    horizon = max(settings.FORECAST_HORIZON_DAYS, settings.REORDER_COVER_DAYS)
+    cover = settings.REORDER_COVER_DAYS
+
+    products = pd.DataFrame(
+        list(
+            Product.objects.filter(subscription=subscription, is_active=True)
+            .order_by('id')
+            .values_list('id', 'stock', 'reorder_level')
+        ),
+        columns=['product_id', 'stock', 'reorder_level'],
+    ).set_index('product_id')
+    if products.empty:
+        ProductForecast.objects.filter(subscription=subscription).delete()
+        return 0
+
+    sales = load_sales(subscription, today - timedelta(days=history_days), today - timedelta(days=1))
+    sales = sales.reindex(products.index, fill_value=0)
+    demand = forecast_demand(sales, today, horizon, window=min(settings.FORECAST_WINDOW_DAYS, history_days))
+
+    stock = products['stock'].to_numpy(dtype=float)
+    reorder_level = products['reorder_level'].to_numpy(dtype=float)
+    cumulative = demand.cumsum(axis=1)
+
+    # First day the forecast demand uses up the stock on hand
+    runs_out = cumulative >= np.maximum(stock, 0)[:, None]
+    stocks_out = runs_out.any(axis=1) & (cumulative[:, -1] > 0)
+    stockout_offset = runs_out.argmax(axis=1)
+
+    recommended = np.ceil(np.clip(cumulative[:, cover - 1] + reorder_level - stock, 0, None))
+
+    computed_at = timezone.now()
+    forecasts = [
+        ProductForecast(
+            subscription=subscription,
+            product_id=product_id,
+            daily_demand=round(float(daily), 3),
+            projected_stockout=today + timedelta(days=int(offset)) if out else None,
+            recommended_quantity=int(quantity),
+            computed_at=computed_at,
+        )
+        for product_id, daily, out, offset, quantity in zip(
+            products.index.tolist(), demand.mean(axis=1), stocks_out, stockout_offset, recommended
+        )
+    ]
+
+    with transaction.atomic():
+        ProductForecast.objects.bulk_create(
+            forecasts,
+            batch_size=FORECAST_WRITE_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['daily_demand', 'projected_stockout', 'recommended_quantity', 'computed_at'],
+        )
+        ProductForecast.objects.filter(subscription=subscription, computed_at__lt=computed_at).delete()
+    return len(forecasts)
@@ -0,0 +1,286 @@
+# products/importer.py
+# Bulk catalog import: stream CSV/XLSX rows, validate in batches, stage them
+# with COPY and upsert into products_product in a few set-based statements.
+
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Category, Product, RestockHistory, StockMovement
+from .sku_index import sku_index
+
+IMPORT_BATCH_SIZE = 5000
+
+REQUIRED_COLUMNS = ('name', 'sku', 'price')
+OPTIONAL_COLUMNS = ('category', 'description', 'cost_price', 'stock', 'reorder_level', 'is_active')
+STAGE_COLUMNS = ('line',) + REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+
+DEFAULT_CATEGORY = 'Uncategorized'
+MAX_PRICE = Decimal('99999999.99')
+MAX_INTEGER = 2 ** 31 - 1  # integer columns are int4
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'active'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'inactive'}
+
+
+class ImportFileError(ValueError):
+    """The file as a whole can't be imported (bad format or header)."""
+
+
+class ImportResult:
+    def __init__(self):
+        self.total = 0
+        self.created = 0
+        self.updated = 0
+        self.rejected = []  # (line, sku, error)
+
+
+def read_rows(fileobj, filename):
+    """
+    Return (columns, rows) for a CSV or XLSX file: the recognised header
+    columns, and an iterator of (line_number, {column: value}) that reads
+    the file lazily. Header names are matched case-insensitively.
+    """
+    if filename.lower().endswith('.xlsx'):
+        import openpyxl
+
+        wb = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+        rows = wb.active.iter_rows(values_only=True)
+    elif filename.lower().endswith('.csv'):
+        rows = csv.reader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''))
+    else:
+        raise ImportFileError("Upload a .csv or .xlsx file.")
+
+    try:
+        header = [str(h or '').strip().lower().replace(' ', '_') for h in next(rows)]
+    except StopIteration:
+        raise ImportFileError("The file is empty.")
+    missing = [c for c in REQUIRED_COLUMNS if c not in header]
+    if missing:
+        raise ImportFileError(f"Missing required column(s): {', '.join(missing)}.")
+
+    positions = {c: header.index(c) for c in REQUIRED_COLUMNS + OPTIONAL_COLUMNS if c in header}
+
+    def iterate():
+        # Line 1 is the header
+        for line, row in enumerate(rows, 2):
+            if not any(v not in (None, '') for v in row):
+                continue
+            yield line, {c: (row[i] if i < len(row) else None) for c, i in positions.items()}
+
+    return set(positions), iterate()
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _number(text):
+    """Parse a cell as a finite Decimal, or return None."""
+    try:
+        number = Decimal(text)
+    except InvalidOperation:
+        return None
+    return number if number.is_finite() else None
+
+
+def _decimal(value, field, errors, minimum):
+    text = _text(value)
+    if not text:
+        return None
+    amount = _number(text)
+    if amount is None:
+        errors.append(f"{field} '{text}' is not a number")
+        return None
+    if not minimum <= amount <= MAX_PRICE:
+        errors.append(f"{field} must be between {minimum} and {MAX_PRICE}")
+        return None
+    return amount.quantize(Decimal('0.01'))
+
+
+def _integer(value, field, errors):
+    text = _text(value)
+    if not text:
+        return None
+    number = _number(text)
+    if number is None or number != number.to_integral_value():
+        errors.append(f"{field} '{text}' is not a whole number")
+        return None
+    if not 0 <= number <= MAX_INTEGER:
+        errors.append(f"{field} must be between 0 and {MAX_INTEGER}")
+        return None
+    return int(number)
+
+
+def clean_row(raw):
+    """
+    Validate one row against Product's field rules. Returns (values, errors).
+    """
+    errors = []
+    name = _text(raw.get('name'))
+    sku = _text(raw.get('sku'))
+    category = _text(raw.get('category')) or DEFAULT_CATEGORY
+    if not name:
+        errors.append("name is required")
+    elif len(name) > 255:
+        errors.append("name is longer than 255 characters")
+    if not sku:
+        errors.append("sku is required")
+    elif len(sku) > 50:
+        errors.append("sku is longer than 50 characters")
+    if len(category) > 100:
+        errors.append("category is longer than 100 characters")
+
+    price = _decimal(raw.get('price'), 'price', errors, Decimal('0.01'))
+    if price is None and not errors:
+        errors.append("price is required")
+    cost_price = _decimal(raw.get('cost_price'), 'cost_price', errors, Decimal('0.00'))
+    stock = _integer(raw.get('stock'), 'stock', errors)
+    reorder_level = _integer(raw.get('reorder_level'), 'reorder_level', errors)
+
+    is_active = _text(raw.get('is_active')).lower() or None
+    if is_active is not None:
+        if is_active not in TRUE_VALUES | FALSE_VALUES:
+            errors.append(f"is_active '{is_active}' should be yes or no")
+        is_active = is_active in TRUE_VALUES
+
+    description = _text(raw.get('description')) or None
+    return (name, sku, price, category, description, cost_price, stock, reorder_level, is_active), errors
+
+
+def _copy_batch(cursor, batch):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in batch:
+        writer.writerow(['\\N' if v is None else v for v in row])
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY product_import_stage ({', '.join(STAGE_COLUMNS)}) "
+        "FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+        buffer,
+    )
+
+
+def import_products(subscription, fileobj, filename, user=None):
+    """
+    Upsert the file's products into the subscription by SKU. Valid rows are
+    applied in one transaction; invalid ones are returned in result.rejected
+    with the reason.
+    """
+    result = ImportResult()
+    columns, rows = read_rows(fileobj, filename)
+    product_table = Product._meta.db_table
+    category_table = Category._meta.db_table
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("""
+            CREATE TEMP TABLE product_import_stage (
+                line integer PRIMARY KEY,
+                name varchar(255) NOT NULL,
+                sku varchar(50) NOT NULL UNIQUE,
+                price numeric(10, 2) NOT NULL,
+                category varchar(100) NOT NULL,
+                description text,
+                cost_price numeric(10, 2),
+                stock integer,
+                reorder_level integer,
+                is_active boolean
+            ) ON COMMIT DROP
+        """)
+
+        first_seen = {}
+        batch = []
+        for line, raw in rows:
+            result.total += 1
+            values, errors = clean_row(raw)
+            sku = values[1]
+            if sku in first_seen and not errors:
+                errors.append(f"duplicate sku, first seen on line {first_seen[sku]}")
+            if errors:
+                result.rejected.append((line, sku, '; '.join(errors)))
+                continue
+            first_seen[sku] = line
+            batch.append((line,) + values)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                _copy_batch(cursor, batch)
+                batch = []
+        if batch:
+            _copy_batch(cursor, batch)
+        del first_seen
+
+        # SKUs are unique across stores; one owned elsewhere can't be taken over
+        cursor.execute(f"""
+            DELETE FROM product_import_stage s
+            USING {product_table} p
+            WHERE p.sku = s.sku AND p.subscription_id IS DISTINCT FROM %s
+            RETURNING s.line, s.sku
+        """, [subscription.id])
+        result.rejected.extend(
+            (line, sku, "sku is already used by another store") for line, sku in cursor.fetchall()
+        )
+
+        cursor.execute(f"""
+            INSERT INTO {category_table} (name, is_active, created_at, updated_at)
+            SELECT DISTINCT category, true, now(), now() FROM product_import_stage
+            ON CONFLICT (name) DO NOTHING
+        """)
+
+        # Existing products: only columns present in the file, and only
+        # non-blank cells, overwrite what's there
+        updates = ['name = s.name', 'price = s.price']
+        if 'category' in columns:
+            updates.append('category_id = c.id')
+        updates += [
+            f"{c} = COALESCE(s.{c}, p.{c})"
+            for c in OPTIONAL_COLUMNS if c in columns and c != 'category'
+        ]
+        # Lock the rows being updated in id order first, so concurrent
+        # checkouts and imports queue behind each other instead of
+        # deadlocking, and `old` below sees the latest committed stock
+        cursor.execute(f"""
+            SELECT p.id FROM {product_table} p
+            JOIN product_import_stage s ON s.sku = p.sku
+            WHERE p.subscription_id = %s
+            ORDER BY p.id
+            FOR UPDATE OF p
+        """, [subscription.id])
+
+        # `old` is read before the update, giving each row's stock change
+        cursor.execute(f"""
+            UPDATE {product_table} p
+            SET {', '.join(updates)}, updated_at = now()
+            FROM product_import_stage s
+            JOIN {category_table} c ON c.name = s.category
+            JOIN {product_table} old ON old.sku = s.sku
+            WHERE p.id = old.id AND p.subscription_id = %s
+            RETURNING p.id, p.stock - old.stock, p.stock
+        """, [subscription.id])
+        result.updated = cursor.rowcount
+        movements = [(pk, delta, stock, '') for pk, delta, stock in cursor.fetchall() if delta]
+        # Lowered stock leaves the oldest cost layers, as a sale would
+        RestockHistory.consume_fifo({pk: -delta for pk, delta, _, _ in movements if delta < 0})
+
+        cursor.execute(f"""
+            INSERT INTO {product_table} (
+                subscription_id, name, sku, category_id, description, price, cost_price,
+                stock, reorder_level, is_active, created_by_id, created_at, updated_at, catalog_version
+            )
+            SELECT %s, s.name, s.sku, c.id, s.description, s.price, COALESCE(s.cost_price, 0),
+                   COALESCE(s.stock, 0), COALESCE(s.reorder_level, %s), COALESCE(s.is_active, true),
+                   %s, now(), now(), 0
+            FROM product_import_stage s
+            JOIN {category_table} c ON c.name = s.category
+            WHERE NOT EXISTS (SELECT 1 FROM {product_table} p WHERE p.sku = s.sku)
+            ON CONFLICT (sku) DO NOTHING
+            RETURNING id, stock
+        """, [subscription.id, settings.LOW_STOCK_THRESHOLD, user.id if user else None])
+        result.created = cursor.rowcount
+        movements += [(pk, stock, stock, '') for pk, stock in cursor.fetchall()]
+        StockMovement.record('import', movements, user=user)
+
+        transaction.on_commit(lambda: sku_index.invalidate(subscription.id))
+
+    result.rejected.sort()
+    return result
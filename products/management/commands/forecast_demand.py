@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import ClientSubscription
+from products.forecasting import forecast_subscription
+
+
+class Command(BaseCommand):
+    help = 'Forecasts product demand, stock-out dates and order quantities from recent sales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscription', type=int, help='Only forecast this subscription id')
+
+    def handle(self, *args, **options):
+        subscriptions = ClientSubscription.objects.filter(products__isnull=False).distinct()
+        if options['subscription']:
+            subscriptions = ClientSubscription.objects.filter(id=options['subscription'])
+            if not subscriptions.exists():
+                raise CommandError(f"Subscription {options['subscription']} does not exist")
+
+        for subscription in subscriptions.iterator():
+            started = time.monotonic()
+            count = forecast_subscription(subscription)
+            self.stdout.write(f'{subscription}: {count} products in {time.monotonic() - started:.1f}s')
+        self.stdout.write(self.style.SUCCESS('Forecasts updated'))
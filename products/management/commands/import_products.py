@@ -0,0 +1,47 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import ClientSubscription, User
+from products.models import ProductImport
+
+
+class Command(BaseCommand):
+    help = 'Creates or updates a subscription\'s products from a CSV or XLSX catalog file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX file to import')
+        parser.add_argument('--subscription', type=int, required=True, help='Subscription id to import into')
+        parser.add_argument('--user', help='Email recorded as the uploader and product creator')
+
+    def handle(self, *args, **options):
+        try:
+            subscription = ClientSubscription.objects.get(id=options['subscription'])
+        except ClientSubscription.DoesNotExist:
+            raise CommandError(f"Subscription {options['subscription']} does not exist")
+
+        user = None
+        if options['user']:
+            user = User.objects.filter(email=options['user']).first()
+            if not user:
+                raise CommandError(f"User {options['user']} does not exist")
+
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError(f"{path} is not a file")
+
+        product_import = ProductImport.objects.create(
+            subscription=subscription, uploaded_by=user, filename=os.path.basename(path),
+        )
+        with open(path, 'rb') as fileobj:
+            product_import.run(fileobj)
+
+        if product_import.status == 'failed':
+            raise CommandError(product_import.error)
+        self.stdout.write(
+            f'{product_import.total_rows} rows: {product_import.created_count} created, '
+            f'{product_import.updated_count} updated, {product_import.rejected_count} rejected'
+        )
+        if product_import.error_report:
+            self.stdout.write(f'Rejected rows: {product_import.error_report.path}')
+        self.stdout.write(self.style.SUCCESS('Import finished'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts.models import ClientSubscription
+from products.models import Product, StockMovement, reconcile_stock
+
+
+class Command(BaseCommand):
+    help = 'Checks product stock against the stock movement ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscription', type=int, help='Only this subscription id')
+        parser.add_argument('--fix', action='store_true',
+                            help='Record an adjustment bringing the ledger in line with current stock')
+
+    def handle(self, *args, **options):
+        subscription = None
+        if options['subscription']:
+            subscription = ClientSubscription.objects.filter(id=options['subscription']).first()
+            if not subscription:
+                raise CommandError(f"Subscription {options['subscription']} does not exist")
+
+        with transaction.atomic():
+            mismatches = reconcile_stock(subscription)
+            if options['fix'] and mismatches:
+                # Lock so no sale lands between the check and the correction
+                Product.lock_stock([pk for pk, _, _, _ in mismatches])
+                mismatches = reconcile_stock(subscription)
+                StockMovement.record('adjustment', [
+                    (pk, stock - ledger, stock, 'reconcile') for pk, _, stock, ledger in mismatches
+                ])
+
+        for _, sku, stock, ledger in mismatches:
+            self.stdout.write(f'{sku}: stock {stock}, ledger {ledger}')
+        verb = 'corrected' if options['fix'] else 'found'
+        self.stdout.write(self.style.SUCCESS(f'{len(mismatches)} mismatches {verb}'))
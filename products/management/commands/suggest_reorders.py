@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import ClientSubscription
+from products.models import suggest_reorders
+
+
+class Command(BaseCommand):
+    help = 'Recomputes reorder suggestions from recent sales velocity'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscription', type=int, help='Only this subscription id')
+
+    def handle(self, *args, **options):
+        subscription = None
+        if options['subscription']:
+            subscription = ClientSubscription.objects.filter(id=options['subscription']).first()
+            if not subscription:
+                raise CommandError(f"Subscription {options['subscription']} does not exist")
+
+        written = suggest_reorders(subscription)
+        self.stdout.write(self.style.SUCCESS(f'{written} reorder suggestions written'))
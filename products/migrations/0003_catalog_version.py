@@ -0,0 +1,73 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+CATALOG_TRIGGERS = """
+CREATE FUNCTION products_product_catalog_version() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND OLD.subscription_id IS DISTINCT FROM NEW.subscription_id) THEN
+        IF OLD.subscription_id IS NOT NULL THEN
+            INSERT INTO products_deletedproduct (subscription_id, product_id, catalog_version, deleted_at)
+            VALUES (OLD.subscription_id, OLD.id, txid_current(), now());
+        END IF;
+        IF TG_OP = 'DELETE' THEN
+            RETURN OLD;
+        END IF;
+    END IF;
+    NEW.catalog_version := txid_current();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER products_product_catalog_version_upsert
+    BEFORE INSERT OR UPDATE ON products_product
+    FOR EACH ROW EXECUTE FUNCTION products_product_catalog_version();
+
+CREATE TRIGGER products_product_catalog_version_delete
+    AFTER DELETE ON products_product
+    FOR EACH ROW EXECUTE FUNCTION products_product_catalog_version();
+"""
+
+DROP_CATALOG_TRIGGERS = """
+DROP TRIGGER IF EXISTS products_product_catalog_version_delete ON products_product;
+DROP TRIGGER IF EXISTS products_product_catalog_version_upsert ON products_product;
+DROP FUNCTION IF EXISTS products_product_catalog_version();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_alter_clientsubscription_expires_at'),
+        ('products', '0002_product_subscription'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subscription_id', models.BigIntegerField()),
+                ('product_id', models.BigIntegerField()),
+                ('catalog_version', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='catalog_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['subscription', 'catalog_version'], name='products_pr_subscri_ef8027_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deletedproduct',
+            index=models.Index(fields=['subscription_id', 'catalog_version'], name='products_de_subscri_5f6c70_idx'),
+        ),
+        migrations.RunSQL(CATALOG_TRIGGERS, DROP_CATALOG_TRIGGERS),
+    ]
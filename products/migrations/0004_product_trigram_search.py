@@ -0,0 +1,73 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:16
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations
+
+# (index name, column) for Product.search
+TRIGRAM_INDEXES = [
+    ('products_name_trgm', 'name'),
+    ('products_sku_trgm', 'sku'),
+    ('products_desc_trgm', 'description'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """
+    Install pg_trgm and build the GIN indexes where the server offers them.
+    Hosts without the extension (or without its GIN operator class) still
+    migrate; Product.search then detects the missing extension and falls
+    back to an unindexed substring match.
+    """
+    table = apps.get_model('products', 'Product')._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute("SELECT 1 FROM pg_opclass WHERE opcname = 'gin_trgm_ops'")
+        if cursor.fetchone() is None:
+            return
+        for name, column in TRIGRAM_INDEXES:
+            cursor.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING gin ({column} gin_trgm_ops)"
+            )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for name, _ in TRIGRAM_INDEXES:
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+    # Build the indexes without blocking checkout writes to products
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0012_alter_clientsubscription_expires_at'),
+        ('products', '0003_catalog_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='product',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='products_name_trgm', opclasses=['gin_trgm_ops']),
+                ),
+                migrations.AddIndex(
+                    model_name='product',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['sku'], name='products_sku_trgm', opclasses=['gin_trgm_ops']),
+                ),
+                migrations.AddIndex(
+                    model_name='product',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['description'], name='products_desc_trgm', opclasses=['gin_trgm_ops']),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:26
+
+import django.core.validators
+import django.db.models.deletion
+import products.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_alter_clientsubscription_expires_at'),
+        ('products', '0005_product_import'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReorderSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField()),
+                ('daily_velocity', models.DecimalField(decimal_places=3, max_digits=10)),
+                ('suggested_quantity', models.PositiveIntegerField()),
+                ('computed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='reorder_level',
+            field=models.IntegerField(default=products.models.default_reorder_level, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.AddField(
+            model_name='reordersuggestion',
+            name='product',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reorder_suggestion', to='products.product'),
+        ),
+        migrations.AddField(
+            model_name='reordersuggestion',
+            name='subscription',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reorder_suggestions', to='accounts.clientsubscription'),
+        ),
+        migrations.AddIndex(
+            model_name='reordersuggestion',
+            index=models.Index(fields=['subscription', 'computed_at'], name='products_re_subscri_8fd2fd_idx'),
+        ),
+    ]
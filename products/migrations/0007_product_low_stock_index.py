@@ -0,0 +1,20 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:26
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the index without blocking checkout writes to products
+    atomic = False
+
+    dependencies = [
+        ('products', '0006_reorder_suggestion'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True), ('stock__lte', models.F('reorder_level'))), fields=['subscription', 'name'], name='products_low_stock'),
+        ),
+    ]
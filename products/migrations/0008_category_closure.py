@@ -0,0 +1,108 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+CLOSURE_TRIGGERS = """
+CREATE FUNCTION products_category_closure() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO products_categoryclosure (ancestor_id, descendant_id, depth)
+        SELECT NEW.id, NEW.id, 0
+        UNION ALL
+        SELECT ancestor_id, NEW.id, depth + 1
+        FROM products_categoryclosure WHERE descendant_id = NEW.parent_id;
+        RETURN NEW;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM products_categoryclosure
+        WHERE ancestor_id = OLD.id OR descendant_id = OLD.id;
+        RETURN OLD;
+    END IF;
+
+    IF NEW.parent_id IS NOT DISTINCT FROM OLD.parent_id THEN
+        RETURN NEW;
+    END IF;
+    IF EXISTS (
+        SELECT 1 FROM products_categoryclosure
+        WHERE ancestor_id = NEW.id AND descendant_id = NEW.parent_id
+    ) THEN
+        RAISE EXCEPTION 'Category % cannot be moved under its own sub-category', NEW.id;
+    END IF;
+
+    -- Detach the moved subtree from its old ancestors...
+    DELETE FROM products_categoryclosure d
+    USING products_categoryclosure sub, products_categoryclosure anc
+    WHERE sub.ancestor_id = NEW.id AND d.descendant_id = sub.descendant_id
+      AND anc.descendant_id = NEW.id AND anc.depth > 0 AND d.ancestor_id = anc.ancestor_id;
+
+    -- ...and link it under the new parent's ancestors
+    INSERT INTO products_categoryclosure (ancestor_id, descendant_id, depth)
+    SELECT p.ancestor_id, sub.descendant_id, p.depth + sub.depth + 1
+    FROM products_categoryclosure p
+    JOIN products_categoryclosure sub ON sub.ancestor_id = NEW.id
+    WHERE p.descendant_id = NEW.parent_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER products_category_closure_insert
+    AFTER INSERT ON products_category
+    FOR EACH ROW EXECUTE FUNCTION products_category_closure();
+
+CREATE TRIGGER products_category_closure_move
+    AFTER UPDATE OF parent_id ON products_category
+    FOR EACH ROW EXECUTE FUNCTION products_category_closure();
+
+CREATE TRIGGER products_category_closure_delete
+    BEFORE DELETE ON products_category
+    FOR EACH ROW EXECUTE FUNCTION products_category_closure();
+"""
+
+DROP_CLOSURE_TRIGGERS = """
+DROP TRIGGER IF EXISTS products_category_closure_delete ON products_category;
+DROP TRIGGER IF EXISTS products_category_closure_move ON products_category;
+DROP TRIGGER IF EXISTS products_category_closure_insert ON products_category;
+DROP FUNCTION IF EXISTS products_category_closure();
+"""
+
+# Existing trees; the depth guard stops on any cycle already in the data
+BACKFILL_CLOSURE = """
+INSERT INTO products_categoryclosure (ancestor_id, descendant_id, depth)
+WITH RECURSIVE tree (ancestor_id, descendant_id, depth) AS (
+    SELECT id, id, 0 FROM products_category
+    UNION ALL
+    SELECT tree.ancestor_id, c.id, tree.depth + 1
+    FROM tree JOIN products_category c ON c.parent_id = tree.descendant_id
+    WHERE tree.depth < 50
+)
+SELECT DISTINCT ON (ancestor_id, descendant_id) ancestor_id, descendant_id, depth
+FROM tree ORDER BY ancestor_id, descendant_id, depth
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_low_stock_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='products.category')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='products.category')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='products_ca_descend_c38652_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='products_category_closure_uniq')],
+            },
+        ),
+        migrations.RunSQL(BACKFILL_CLOSURE, migrations.RunSQL.noop),
+        migrations.RunSQL(CLOSURE_TRIGGERS, DROP_CLOSURE_TRIGGERS),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_alter_clientsubscription_expires_at'),
+        ('products', '0008_category_closure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('daily_demand', models.DecimalField(decimal_places=3, max_digits=10)),
+                ('projected_stockout', models.DateField(blank=True, null=True)),
+                ('recommended_quantity', models.PositiveIntegerField()),
+                ('computed_at', models.DateTimeField()),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='forecast', to='products.product')),
+                ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_forecasts', to='accounts.clientsubscription')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['subscription', 'projected_stockout'], name='products_pr_subscri_5dff5f_idx')],
+            },
+        ),
+    ]
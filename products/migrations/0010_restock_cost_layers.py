@@ -0,0 +1,41 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:32
+
+import django.core.validators
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Stock already on hand becomes one opening layer per product at its cost_price
+OPENING_LAYERS = """
+INSERT INTO products_restockhistory (product_id, quantity, remaining, unit_cost, restocked_at, note)
+SELECT id, stock, stock, cost_price, now(), 'Opening balance'
+FROM products_product
+WHERE stock > 0
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_forecast'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restockhistory',
+            name='remaining',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='restockhistory',
+            name='unit_cost',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, validators=[django.core.validators.MinValueValidator(Decimal('0.00'))]),
+        ),
+        migrations.AddIndex(
+            model_name='restockhistory',
+            index=models.Index(condition=models.Q(('remaining__gt', 0)), fields=['product', 'restocked_at', 'id'], name='products_restock_open_fifo'),
+        ),
+        migrations.RunSQL(OPENING_LAYERS, migrations.RunSQL.noop),
+    ]
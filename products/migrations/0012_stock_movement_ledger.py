@@ -0,0 +1,64 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:43
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Every product starts the ledger with its current stock
+OPENING_BALANCES = """
+INSERT INTO products_stockmovement (product_id, kind, quantity, stock_after, reference, created_at)
+SELECT id, 'opening', stock, stock, '', now()
+FROM products_product
+WHERE stock <> 0
+"""
+
+# The ledger is append-only. Rows may still be deleted with their product,
+# and user_id may be nulled when a user is deleted.
+APPEND_ONLY = """
+CREATE FUNCTION products_stockmovement_append_only() RETURNS trigger AS $$
+BEGIN
+    RAISE EXCEPTION 'Stock movements are append-only';
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER products_stockmovement_append_only
+    BEFORE UPDATE OF product_id, kind, quantity, stock_after, reference, created_at
+    ON products_stockmovement
+    FOR EACH ROW EXECUTE FUNCTION products_stockmovement_append_only();
+"""
+
+DROP_APPEND_ONLY = """
+DROP TRIGGER IF EXISTS products_stockmovement_append_only ON products_stockmovement;
+DROP FUNCTION IF EXISTS products_stockmovement_append_only();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_stocktake'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('opening', 'Opening balance'), ('sale', 'Sale'), ('restock', 'Restock'), ('adjustment', 'Adjustment'), ('stocktake', 'Stocktake'), ('return', 'Return'), ('import', 'Import')], max_length=10)),
+                ('quantity', models.IntegerField()),
+                ('stock_after', models.IntegerField()),
+                ('reference', models.CharField(blank=True, max_length=50)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='products.product')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'created_at', 'id'], name='products_movement_history'), models.Index(fields=['created_at'], name='products_movement_created')],
+            },
+        ),
+        migrations.RunSQL(OPENING_BALANCES, migrations.RunSQL.noop),
+        migrations.RunSQL(APPEND_ONLY, DROP_APPEND_ONLY),
+    ]
@@ -1,8 +1,24 @@
-from django.db import models
+import csv
+import io
+import logging
+
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import DatabaseError, connection, models, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce, Greatest
+from django.core.files.base import ContentFile
+from django.utils import timezone
 from django.core.validators import MinValueValidator
+from datetime import timedelta
 from decimal import Decimal
+from functools import partial
 from accounts.models import User
 from accounts.models import User, ClientSubscription
+from core.utils import generated_file_storage
+
+logger = logging.getLogger(__name__)
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -23,6 +39,41 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def subtree_ids(cls, category_id):
+        """
+        Ids of the category and all its sub-categories, as a subquery for
+        category_id__in filters: one indexed lookup on the closure table.
+        """
+        return CategoryClosure.objects.filter(ancestor_id=category_id).values('descendant_id')
+
+
+class CategoryClosure(models.Model):
+    """
+    Every (ancestor, descendant) pair in the category tree, including each
+    category paired with itself at depth 0. Maintained by database triggers
+    on products_category inserts and parent changes.
+    """
+    ancestor = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='products_category_closure_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'depth']),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} > {self.descendant_id} ({self.depth})"
+
+
+def default_reorder_level():
+    return settings.LOW_STOCK_THRESHOLD
+
+
 class Product(models.Model):
     subscription = models.ForeignKey(ClientSubscription, on_delete=models.CASCADE, related_name='products', null=True, blank=True)
     name = models.CharField(max_length=255)
@@ -32,32 +83,959 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
     cost_price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.00'))], default=0)
     stock = models.IntegerField(default=0, validators=[MinValueValidator(0)])
-    reorder_level = models.IntegerField(default=5, validators=[MinValueValidator(0)])
+    reorder_level = models.IntegerField(default=default_reorder_level, validators=[MinValueValidator(0)])
     is_active = models.BooleanField(default=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Set by a database trigger to the writing transaction's id on every
+    # insert/update, so raw and bulk stock updates bump it too.
+    catalog_version = models.BigIntegerField(default=0, editable=False)
+
+    # Cached result of trigram_available()
+    _trigram_available = None
 
     class Meta:
         ordering = ['name']
         indexes = [
             models.Index(fields=['sku']),
             models.Index(fields=['price']),
+            models.Index(fields=['subscription', 'catalog_version']),
+            # pg_trgm indexes for Product.search (also serve icontains)
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='products_name_trgm'),
+            GinIndex(fields=['sku'], opclasses=['gin_trgm_ops'], name='products_sku_trgm'),
+            GinIndex(fields=['description'], opclasses=['gin_trgm_ops'], name='products_desc_trgm'),
+            # Only low-stock rows are indexed, so the check stays cheap however
+            # big the catalog is; Postgres maintains it on every stock update.
+            models.Index(
+                fields=['subscription', 'name'],
+                condition=Q(is_active=True, stock__lte=F('reorder_level')),
+                name='products_low_stock',
+            ),
         ]
 
     def __str__(self):
         return f"{self.name} (SKU: {self.sku})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The SKU index key as loaded, so a save that changes the SKU or
+        # subscription can evict the old entry too
+        instance._loaded_sku_key = (instance.__dict__.get('subscription_id'), instance.__dict__.get('sku'))
+        return instance
+
     @property
     def needs_restock(self):
         return self.stock <= self.reorder_level
 
+    @classmethod
+    def trigram_available(cls):
+        """
+        Whether pg_trgm is installed in this database. Migration 0004 skips
+        it on hosts that don't offer the extension; checked once per process.
+        """
+        if cls._trigram_available is None:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                cls._trigram_available = cursor.fetchone() is not None
+        return cls._trigram_available
+
+    @classmethod
+    def search(cls, subscription, term):
+        """
+        Rank the subscription's products against a search term, best match
+        first. Trigram word similarity over name, SKU and description makes
+        it typo tolerant; every filter can use the pg_trgm GIN indexes.
+        Without pg_trgm it falls back to a plain substring match by name.
+        """
+        term = term.strip()
+        qs = cls.objects.filter(subscription=subscription)
+        if len(term) < 3:
+            # Too short for trigrams to discriminate; prefix match instead
+            return qs.filter(
+                Q(name__istartswith=term) | Q(sku__istartswith=term)
+            ).order_by('name')
+        if not cls.trigram_available():
+            return qs.filter(
+                Q(name__icontains=term) | Q(sku__icontains=term) | Q(description__icontains=term)
+            ).order_by('name')
+
+        return qs.filter(
+            Q(name__icontains=term)
+            | Q(sku__icontains=term)
+            | Q(name__trigram_word_similar=term)
+            | Q(description__trigram_word_similar=term)
+        ).annotate(
+            rank=Greatest(
+                TrigramWordSimilarity(term, 'name'),
+                TrigramWordSimilarity(term, 'sku'),
+                TrigramWordSimilarity(term, 'description') * 0.5,
+            )
+        ).order_by('-rank', 'name')
+
+    @classmethod
+    def low_stock(cls, subscription):
+        """
+        Active products at or below their reorder level, served by the
+        products_low_stock partial index.
+        """
+        return cls.objects.filter(
+            subscription=subscription, is_active=True, stock__lte=F('reorder_level')
+        ).order_by('name')
+
+    @classmethod
+    def lock_stock(cls, ids):
+        """
+        Lock the given product rows in primary-key order and return them keyed
+        by id. Locking in a fixed order means concurrent carts that share SKUs
+        queue behind each other instead of deadlocking.
+        """
+        return {
+            p.id: p
+            for p in cls.objects.select_for_update()
+            .filter(id__in=ids)
+            .order_by('id')
+            .only('id', 'name', 'stock')
+        }
+
+    @classmethod
+    def apply_stock_decrement(cls, quantities):
+        """
+        Decrement stock for every {product_id: quantity} pair with a single
+        guarded UPDATE ... RETURNING and return {product_id: new_stock}.
+        Callers lock the rows with lock_stock() first.
+        """
+        if not quantities:
+            return {}
+
+        ids = sorted(quantities)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {cls._meta.db_table} AS p
+                SET stock = p.stock - v.qty
+                FROM unnest(%s::bigint[], %s::integer[]) AS v(id, qty)
+                WHERE p.id = v.id AND p.stock >= v.qty
+                RETURNING p.id, p.stock
+                """,
+                [ids, [quantities[pk] for pk in ids]],
+            )
+            stock_levels = dict(cursor.fetchall())
+
+        if len(stock_levels) != len(ids):
+            # Rows are locked, so this only happens if the guard was bypassed
+            raise DatabaseError("Stock decrement updated fewer rows than were locked.")
+
+        from .sku_index import sku_index  # sku_index imports this module
+        transaction.on_commit(partial(sku_index.apply_stock, stock_levels))
+        return stock_levels
+
+    @classmethod
+    def reserve_stock(cls, quantities):
+        """
+        Decrement stock for every {product_id: quantity} pair as one unit:
+        lock the rows in primary-key order, then apply one guarded UPDATE.
+
+        Returns (stock_levels, shortfalls): stock_levels maps product id to its
+        stock after the decrement, shortfalls lists the locked products that
+        cannot cover their quantity. Nothing is decremented if any line falls
+        short. Must run inside the caller's transaction.
+        """
+        if not quantities:
+            return {}, []
+
+        with transaction.atomic(savepoint=False):
+            locked = cls.lock_stock(quantities.keys())
+            shortfalls = [p for p in locked.values() if p.stock < quantities[p.id]]
+            shortfalls += [
+                cls(id=pk, name='', stock=0) for pk in quantities if pk not in locked
+            ]
+            if shortfalls:
+                return {}, shortfalls
+            return cls.apply_stock_decrement(quantities), []
+
+    @classmethod
+    def bulk_update_catalog(cls, subscription, changes=(), rules=(), user=None):
+        """
+        Apply price rules and per-SKU changes to a subscription's products in
+        one transaction.
+
+        rules are dicts of field ('price' or 'cost_price'), an optional
+        category id and either percent or amount, applied in order to every
+        matching product; a category covers its sub-categories too. changes are dicts keyed by sku with any of price,
+        cost_price, stock_delta and is_active, applied after the rules.
+
+        Returns (updated_count, errors). errors lists {'sku', 'error'} for
+        unknown SKUs and stock deltas that would go negative; if there are
+        any, nothing is changed. Every touched row gets the same
+        catalog_version, so registers pick the batch up as one delta.
+        """
+        table = cls._meta.db_table
+        closure_table = CategoryClosure._meta.db_table
+        skus = [change['sku'] for change in changes]
+        rule_categories = [rule.get('category') for rule in rules]
+        all_products = any(category is None for category in rule_categories)
+        category_ids = [category for category in rule_categories if category is not None]
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Lock in primary-key order, like checkout, so the two can't deadlock
+            cursor.execute(
+                f"""
+                SELECT id, sku, stock FROM {table}
+                WHERE subscription_id = %s
+                  AND (%s OR sku = ANY(%s) OR category_id IN (
+                      SELECT descendant_id FROM {closure_table} WHERE ancestor_id = ANY(%s)
+                  ))
+                ORDER BY id
+                FOR UPDATE
+                """,
+                [subscription.id, all_products, skus, category_ids],
+            )
+            stock_by_sku = {sku: stock for _, sku, stock in cursor.fetchall()}
+
+            errors = []
+            for change in changes:
+                stock = stock_by_sku.get(change['sku'])
+                if stock is None:
+                    errors.append({'sku': change['sku'], 'error': 'Unknown SKU.'})
+                elif stock + change.get('stock_delta', 0) < 0:
+                    errors.append({'sku': change['sku'], 'error': f'Only {stock} in stock.'})
+            if errors:
+                return 0, errors
+
+            updated = set()
+            for rule in rules:
+                field = rule['field']
+                if rule.get('percent') is not None:
+                    new_value = f"ROUND({field} * (1 + %s / 100.0), 2)"
+                    operand = rule['percent']
+                else:
+                    new_value = f"{field} + %s"
+                    operand = rule['amount']
+                floor = '0.01' if field == 'price' else '0.00'
+                cursor.execute(
+                    f"""
+                    UPDATE {table}
+                    SET {field} = GREATEST({new_value}, {floor}), updated_at = now()
+                    WHERE subscription_id = %s AND (%s::bigint IS NULL OR category_id IN (
+                        SELECT descendant_id FROM {closure_table} WHERE ancestor_id = %s
+                    ))
+                    RETURNING id
+                    """,
+                    [operand, subscription.id, rule.get('category'), rule.get('category')],
+                )
+                updated.update(pk for pk, in cursor.fetchall())
+
+            if changes:
+                cursor.execute(
+                    f"""
+                    UPDATE {table} AS p
+                    SET price = COALESCE(v.price, p.price),
+                        cost_price = COALESCE(v.cost_price, p.cost_price),
+                        stock = p.stock + v.stock_delta,
+                        is_active = COALESCE(v.is_active, p.is_active),
+                        updated_at = now()
+                    FROM unnest(%s::varchar[], %s::numeric[], %s::numeric[], %s::integer[], %s::boolean[])
+                        AS v(sku, price, cost_price, stock_delta, is_active)
+                    WHERE p.sku = v.sku AND p.subscription_id = %s
+                    RETURNING p.id, v.stock_delta, p.stock
+                    """,
+                    [
+                        skus,
+                        [change.get('price') for change in changes],
+                        [change.get('cost_price') for change in changes],
+                        [change.get('stock_delta', 0) for change in changes],
+                        [change.get('is_active') for change in changes],
+                        subscription.id,
+                    ],
+                )
+                rows = cursor.fetchall()
+                updated.update(pk for pk, _, _ in rows)
+                # Units taken off stock leave the oldest cost layers, as a sale would
+                RestockHistory.consume_fifo({pk: -delta for pk, delta, _ in rows if delta < 0})
+                StockMovement.record('adjustment', [(pk, delta, stock, 'bulk-update') for pk, delta, stock in rows],
+                                     user=user)
+
+            from .sku_index import sku_index  # sku_index imports this module
+            transaction.on_commit(partial(sku_index.invalidate, subscription.id))
+
+        return len(updated), []
+
+    @classmethod
+    def catalog_state(cls, subscription):
+        """
+        Return (version, cursor) for a subscription's catalog in one query.
+
+        version is the newest catalog_version among its products and deletions
+        and changes whenever the catalog does. cursor is the value a client
+        should send back as ?since=: it never passes a transaction that is
+        still running, so a change that commits late is picked up by the next
+        delta instead of being skipped.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT GREATEST(
+                    (SELECT MAX(catalog_version) FROM {cls._meta.db_table} WHERE subscription_id = %s),
+                    (SELECT MAX(catalog_version) FROM {DeletedProduct._meta.db_table} WHERE subscription_id = %s),
+                    0
+                ), txid_snapshot_xmin(txid_current_snapshot()) - 1
+                """,
+                [subscription.id, subscription.id],
+            )
+            version, horizon = cursor.fetchone()
+        return version, min(version, horizon)
+
+
+class DeletedProduct(models.Model):
+    """
+    Tombstone written by a database trigger when a product is deleted or
+    moved to another subscription, so catalog deltas can report removals.
+    Plain id columns: the subscription may be deleted along with it.
+    """
+    subscription_id = models.BigIntegerField()
+    product_id = models.BigIntegerField()
+    catalog_version = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['subscription_id', 'catalog_version']),
+        ]
+
+    def __str__(self):
+        return f"Deleted product #{self.product_id}"
+
+
 class RestockHistory(models.Model):
+    """
+    One receipt of stock, and the FIFO cost layer it creates: `remaining`
+    units are still on hand at `unit_cost` until sales consume them.
+    """
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='restocks')
     quantity = models.IntegerField(validators=[MinValueValidator(1)])
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0, validators=[MinValueValidator(Decimal('0.00'))])
+    remaining = models.PositiveIntegerField(default=0)
     restocked_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     restocked_at = models.DateTimeField(auto_now_add=True)
     note = models.TextField(blank=True)
 
     class Meta:
         ordering = ['-restocked_at']
+        indexes = [
+            # Open layers in FIFO order; consumed layers drop out of the index
+            models.Index(
+                fields=['product', 'restocked_at', 'id'],
+                condition=Q(remaining__gt=0),
+                name='products_restock_open_fifo',
+            ),
+        ]
+
+    @classmethod
+    def receive(cls, receipts, user=None, note=''):
+        """
+        Receive stock: receipts maps product id to (quantity, unit_cost). Adds
+        a cost layer per product, increases stock and makes unit_cost the
+        product's current cost_price. Returns {product_id: new_stock}.
+        """
+        if not receipts:
+            return {}
+
+        ids = sorted(receipts)
+        with transaction.atomic():
+            Product.lock_stock(ids)
+            layers = cls.objects.bulk_create([
+                cls(product_id=pk, quantity=receipts[pk][0], remaining=receipts[pk][0],
+                    unit_cost=receipts[pk][1], restocked_by=user, note=note)
+                for pk in ids
+            ])
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    UPDATE {Product._meta.db_table} AS p
+                    SET stock = p.stock + v.qty, cost_price = v.unit_cost, updated_at = now()
+                    FROM unnest(%s::bigint[], %s::integer[], %s::numeric[]) AS v(id, qty, unit_cost)
+                    WHERE p.id = v.id
+                    RETURNING p.id, p.stock
+                    """,
+                    [ids, [receipts[pk][0] for pk in ids], [receipts[pk][1] for pk in ids]],
+                )
+                stock_levels = dict(cursor.fetchall())
+            StockMovement.record('restock', [
+                (layer.product_id, layer.quantity, stock_levels[layer.product_id], f'restock:{layer.id}')
+                for layer in layers
+            ], user=user)
+
+        from .sku_index import sku_index  # sku_index imports this module
+        transaction.on_commit(partial(sku_index.apply_stock, stock_levels))
+        return stock_levels
+
+    @classmethod
+    def consume_fifo(cls, quantities):
+        """
+        Take {product_id: quantity} units out of the oldest open cost layers
+        in one statement and return {product_id: cost_of_goods}. Units not
+        covered by layers (stock added without a receipt) are costed at the
+        product's cost_price. Callers hold the product row locks, as for
+        Product.apply_stock_decrement().
+        """
+        if not quantities:
+            return {}
+
+        ids = sorted(quantities)
+        table = cls._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH wanted AS (
+                    SELECT * FROM unnest(%s::bigint[], %s::integer[]) AS w(product_id, qty)
+                ),
+                layers AS (
+                    SELECT r.id, r.product_id, r.unit_cost, r.remaining,
+                           SUM(r.remaining) OVER (
+                               PARTITION BY r.product_id ORDER BY r.restocked_at, r.id
+                           ) - r.remaining AS before
+                    FROM {table} r
+                    JOIN wanted w ON w.product_id = r.product_id
+                    WHERE r.remaining > 0
+                ),
+                taken AS (
+                    SELECT l.id, l.product_id, l.unit_cost, LEAST(l.remaining, w.qty - l.before) AS used
+                    FROM layers l
+                    JOIN wanted w ON w.product_id = l.product_id
+                    WHERE l.before < w.qty
+                ),
+                consumed AS (
+                    UPDATE {table} r SET remaining = r.remaining - t.used
+                    FROM taken t WHERE r.id = t.id
+                    RETURNING r.id
+                )
+                SELECT w.product_id,
+                       COALESCE(SUM(t.used * t.unit_cost), 0)
+                       + (w.qty - COALESCE(SUM(t.used), 0)) * p.cost_price
+                FROM wanted w
+                JOIN {Product._meta.db_table} p ON p.id = w.product_id
+                LEFT JOIN taken t ON t.product_id = w.product_id
+                GROUP BY w.product_id, w.qty, p.cost_price
+                """,
+                [ids, [quantities[pk] for pk in ids]],
+            )
+            return {pk: cost.quantize(Decimal('0.01')) for pk, cost in cursor.fetchall()}
+
+    @classmethod
+    def inventory_value(cls, subscription):
+        """
+        Return (units, value) of the subscription's stock on hand: open cost
+        layers at their unit cost, plus any stock without layers at the
+        product's cost_price.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT COALESCE(SUM(p.stock), 0),
+                       COALESCE(SUM(COALESCE(l.value, 0)
+                                    + GREATEST(p.stock - COALESCE(l.units, 0), 0) * p.cost_price), 0)
+                FROM {Product._meta.db_table} p
+                LEFT JOIN (
+                    SELECT product_id, SUM(remaining) AS units, SUM(remaining * unit_cost) AS value
+                    FROM {cls._meta.db_table}
+                    WHERE remaining > 0
+                    GROUP BY product_id
+                ) l ON l.product_id = p.id
+                WHERE p.subscription_id = %s AND p.stock > 0
+                """,
+                [subscription.id],
+            )
+            units, value = cursor.fetchone()
+        return units, value
+
+
+class StockMovement(models.Model):
+    """
+    Append-only ledger of stock changes. quantity is signed and stock_after
+    is the product's stock once the movement was applied, so a product's
+    stock at any moment is its latest stock_after up to then, and the sum
+    of quantities always equals Product.stock (see reconcile_stock()).
+    Writers insert one batch per operation with record().
+    """
+    KIND_CHOICES = [
+        ('opening', 'Opening balance'),
+        ('sale', 'Sale'),
+        ('restock', 'Restock'),
+        ('adjustment', 'Adjustment'),
+        ('stocktake', 'Stocktake'),
+        ('return', 'Return'),
+        ('import', 'Import'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='movements')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    quantity = models.IntegerField()
+    stock_after = models.IntegerField()
+    reference = models.CharField(max_length=50, blank=True)  # e.g. "order:42"
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Per-product history and "stock at" lookups walk this backwards
+            models.Index(fields=['product', 'created_at', 'id'], name='products_movement_history'),
+            models.Index(fields=['created_at'], name='products_movement_created'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.quantity:+} of product {self.product_id}"
+
+    @classmethod
+    def record(cls, kind, rows, user=None):
+        """
+        Write a batch of (product_id, quantity, stock_after, reference)
+        movements in one INSERT; zero quantities are skipped.
+        """
+        now = timezone.now()
+        return cls.objects.bulk_create([
+            cls(product_id=pk, kind=kind, quantity=quantity, stock_after=stock_after,
+                reference=reference, user=user, created_at=now)
+            for pk, quantity, stock_after, reference in rows if quantity
+        ])
+
+    @classmethod
+    def stock_at(cls, subscription, when):
+        """
+        {product_id: stock} for the subscription's products as of `when`,
+        from one index probe per product rather than a ledger scan.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT p.id, COALESCE(m.stock_after, 0)
+                FROM {Product._meta.db_table} p
+                LEFT JOIN LATERAL (
+                    SELECT stock_after FROM {cls._meta.db_table}
+                    WHERE product_id = p.id AND created_at <= %s
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT 1
+                ) m ON true
+                WHERE p.subscription_id = %s
+                """,
+                [when, subscription.id],
+            )
+            return dict(cursor.fetchall())
+
+
+def reconcile_stock(subscription=None):
+    """
+    Products whose stock doesn't match the sum of their ledger, found with
+    one grouped query that only sums the subscription's own movements when
+    one is given. Returns a list of (product_id, sku, stock, ledger).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT p.id, p.sku, p.stock, COALESCE(m.total, 0)
+            FROM {Product._meta.db_table} p
+            LEFT JOIN (
+                SELECT sm.product_id, SUM(sm.quantity) AS total
+                FROM {StockMovement._meta.db_table} sm
+                JOIN {Product._meta.db_table} sp ON sp.id = sm.product_id
+                WHERE %s::bigint IS NULL OR sp.subscription_id = %s
+                GROUP BY sm.product_id
+            ) m ON m.product_id = p.id
+            WHERE p.stock <> COALESCE(m.total, 0)
+              AND (%s::bigint IS NULL OR p.subscription_id = %s)
+            ORDER BY p.id
+            """,
+            [subscription and subscription.id] * 4,
+        )
+        return cursor.fetchall()
+
+
+def import_storage():
+    return generated_file_storage()
+
+
+class ProductImport(models.Model):
+    """
+    One bulk catalog upload (CSV/XLSX) and its outcome. Rejected rows are
+    kept as a downloadable CSV error report.
+    """
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    subscription = models.ForeignKey(ClientSubscription, on_delete=models.CASCADE, related_name='product_imports')
+    uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running')
+    total_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    rejected_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    error_report = models.FileField(upload_to='imports/', storage=import_storage, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Import {self.filename} ({self.status})"
+
+    def run(self, fileobj):
+        """
+        Import the file into this subscription and record the counts.
+        """
+        from .importer import ImportFileError, import_products  # importer imports this module
+
+        try:
+            result = import_products(self.subscription, fileobj, self.filename, user=self.uploaded_by)
+        except ImportFileError as e:
+            self.status = 'failed'
+            self.error = str(e)
+        except Exception as e:
+            logger.exception(f"Product import #{self.id} failed")
+            self.status = 'failed'
+            self.error = f"Import failed: {e}"
+        else:
+            self.status = 'done'
+            self.total_rows = result.total
+            self.created_count = result.created
+            self.updated_count = result.updated
+            self.rejected_count = len(result.rejected)
+            if result.rejected:
+                report = io.StringIO()
+                writer = csv.writer(report)
+                writer.writerow(['Line', 'SKU', 'Error'])
+                writer.writerows(result.rejected)
+                self.error_report.save(
+                    f"import_{self.id}_errors.csv",
+                    ContentFile(report.getvalue().encode('utf-8')),
+                    save=False,
+                )
+
+        self.finished_at = timezone.now()
+        self.save()
+        return self
+
+
+class ReorderSuggestion(models.Model):
+    """
+    Suggested reorder quantity for a product that is low or will run low
+    within settings.REORDER_COVER_DAYS at its recent sales velocity.
+    Rebuilt nightly by suggest_reorders().
+    """
+    subscription = models.ForeignKey(ClientSubscription, on_delete=models.CASCADE, related_name='reorder_suggestions')
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='reorder_suggestion')
+    stock = models.IntegerField()
+    daily_velocity = models.DecimalField(max_digits=10, decimal_places=3)
+    suggested_quantity = models.PositiveIntegerField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['subscription', 'computed_at']),
+        ]
+
+    def __str__(self):
+        return f"Reorder {self.suggested_quantity} x {self.product_id}"
+
+
+class ProductForecast(models.Model):
+    """
+    Latest demand forecast for a product, written by
+    products.forecasting.forecast_subscription(). Kept off the product row
+    so the nightly run doesn't bump every product's catalog_version.
+    """
+    subscription = models.ForeignKey(ClientSubscription, on_delete=models.CASCADE, related_name='product_forecasts')
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='forecast')
+    daily_demand = models.DecimalField(max_digits=10, decimal_places=3)
+    projected_stockout = models.DateField(null=True, blank=True)
+    recommended_quantity = models.PositiveIntegerField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['subscription', 'projected_stockout']),
+        ]
+
+    def __str__(self):
+        return f"Forecast for {self.product_id}: {self.daily_demand}/day"
+
+
+def suggest_reorders(subscription=None):
+    """
+    Recompute ReorderSuggestions from the last REORDER_LOOKBACK_DAYS of
+    DailyProductRollup sales: the suggestion tops a product up to its
+    reorder level plus REORDER_COVER_DAYS of average daily sales. Products
+    that no longer need reordering lose their suggestion. Returns the number
+    of suggestions written.
+    """
+    from reports.models import DailyProductRollup  # reports imports this module
+
+    today = timezone.localdate()
+    lookback = settings.REORDER_LOOKBACK_DAYS
+    cover = settings.REORDER_COVER_DAYS
+    now = timezone.now()
+    scope = 'AND p.subscription_id = %s' if subscription else ''
+    scope_params = [subscription.id] if subscription else []
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH velocity AS (
+                SELECT product_id, SUM(units)::numeric / %s AS per_day
+                FROM {DailyProductRollup._meta.db_table}
+                WHERE date >= %s AND date < %s
+                GROUP BY product_id
+            )
+            INSERT INTO {ReorderSuggestion._meta.db_table} AS r
+                (subscription_id, product_id, stock, daily_velocity, suggested_quantity, computed_at)
+            SELECT p.subscription_id, p.id, p.stock, ROUND(COALESCE(v.per_day, 0), 3),
+                   GREATEST(p.reorder_level + CEIL(COALESCE(v.per_day, 0) * %s) - p.stock, 1), %s
+            FROM {Product._meta.db_table} p
+            LEFT JOIN velocity v ON v.product_id = p.id
+            WHERE p.subscription_id IS NOT NULL AND p.is_active
+              AND p.stock - COALESCE(v.per_day, 0) * %s <= p.reorder_level
+              {scope}
+            ON CONFLICT (product_id) DO UPDATE SET
+                stock = EXCLUDED.stock,
+                daily_velocity = EXCLUDED.daily_velocity,
+                suggested_quantity = EXCLUDED.suggested_quantity,
+                computed_at = EXCLUDED.computed_at
+            """,
+            [lookback, today - timedelta(days=lookback), today, cover, now, cover] + scope_params,
+        )
+        written = cursor.rowcount
+        stale = ReorderSuggestion.objects.filter(computed_at__lt=now)
+        if subscription:
+            stale = stale.filter(subscription=subscription)
+        stale.delete()
+    return written
+
+
+class StocktakeSession(models.Model):
+    """
+    A stock count. Opening it lists every product; devices then upload
+    counted scans in batches. Each product's stock is snapshotted when it is
+    first scanned and applying adjusts it by (counted - snapshot), so sales
+    made while the count runs are kept.
+    """
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('applied', 'Applied'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    subscription = models.ForeignKey(ClientSubscription, on_delete=models.CASCADE, related_name='stocktakes')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
+    note = models.CharField(max_length=255, blank=True)
+    started_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    applied_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    applied_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Stocktake #{self.id} ({self.status})"
+
+    @classmethod
+    def open(cls, subscription, user=None, note=''):
+        """
+        Start a session with a line for every product in one INSERT ...
+        SELECT. Takes no row locks, so checkout carries on.
+        """
+        with transaction.atomic():
+            session = cls.objects.create(subscription=subscription, started_by=user, note=note)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    INSERT INTO {StocktakeLine._meta.db_table} (session_id, product_id, expected)
+                    SELECT %s, id, stock FROM {Product._meta.db_table}
+                    WHERE subscription_id = %s
+                    """,
+                    [session.id, subscription.id],
+                )
+        return session
+
+    def record_scans(self, counts, batch_id=None):
+        """
+        Add {sku: quantity} counts to the session in one statement. A batch_id
+        already recorded for this session is ignored, so a device can safely
+        resend a batch. Returns (status, unknown_skus) where status is
+        'recorded' or 'duplicate'.
+        """
+        skus = sorted(counts)
+        with transaction.atomic():
+            # FOR SHARE lets devices upload side by side while apply() waits
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT status FROM {StocktakeSession._meta.db_table} WHERE id = %s FOR SHARE",
+                    [self.id],
+                )
+                status, = cursor.fetchone()
+            if status != 'open':
+                raise ValueError(f"Stocktake #{self.id} is {status}.")
+
+            if batch_id is not None:
+                _, created = StocktakeBatch.objects.get_or_create(
+                    session=self, batch_id=batch_id, defaults={'scans': len(skus)}
+                )
+                if not created:
+                    return 'duplicate', []
+
+            with connection.cursor() as cursor:
+                # Products added after the session opened join it at their
+                # current stock
+                cursor.execute(
+                    f"""
+                    WITH scanned AS (
+                        SELECT p.id, p.stock, v.sku, v.qty
+                        FROM unnest(%s::varchar[], %s::integer[]) AS v(sku, qty)
+                        JOIN {Product._meta.db_table} p ON p.sku = v.sku AND p.subscription_id = %s
+                    ), counted AS (
+                        INSERT INTO {StocktakeLine._meta.db_table} AS l (session_id, product_id, expected, counted)
+                        SELECT %s, id, stock, qty FROM scanned ORDER BY id
+                        ON CONFLICT (session_id, product_id)
+                        DO UPDATE SET
+                            counted = COALESCE(l.counted, 0) + EXCLUDED.counted,
+                            expected = CASE WHEN l.counted IS NULL THEN EXCLUDED.expected ELSE l.expected END
+                    )
+                    SELECT sku FROM scanned
+                    """,
+                    [skus, [counts[sku] for sku in skus], self.subscription_id, self.id],
+                )
+                found = {sku for sku, in cursor.fetchall()}
+        return 'recorded', [sku for sku in skus if sku not in found]
+
+    def variances(self, zero_uncounted=False):
+        """
+        Lines whose count differs from the snapshot, with variance annotated.
+        With zero_uncounted, products nobody scanned count as zero (against
+        their stock when the session opened; apply() uses current stock).
+        """
+        lines = self.lines.all()
+        if zero_uncounted:
+            counted = Coalesce('counted', 0)
+        else:
+            counted = F('counted')
+            lines = lines.filter(counted__isnull=False)
+        return lines.annotate(variance=counted - F('expected')).exclude(variance=0)
+
+    def summary(self):
+        """
+        Progress and net variance of the count, in one query. Value is at
+        each product's current cost_price.
+        """
+        variance = F('counted') - F('expected')
+        totals = self.lines.aggregate(
+            products=models.Count('id'),
+            scanned=models.Count('id', filter=Q(counted__isnull=False)),
+            discrepancies=models.Count('id', filter=Q(counted__isnull=False) & ~Q(counted=F('expected'))),
+            units=Coalesce(models.Sum(variance), 0),
+            value=Coalesce(
+                models.Sum(variance * F('product__cost_price'), output_field=models.DecimalField()),
+                Decimal('0.00'),
+            ),
+        )
+        return totals
+
+    def apply(self, user=None, zero_uncounted=False):
+        """
+        Adjust stock by every variance in one transaction: lock the products
+        in id order, then one UPDATE ... FROM. Shrinkage is drawn from the
+        FIFO cost layers, surplus becomes a layer at cost_price. Returns the
+        number of products adjusted.
+        """
+        with transaction.atomic():
+            session = StocktakeSession.objects.select_for_update().get(pk=self.pk)
+            if session.status != 'open':
+                raise ValueError(f"Stocktake #{self.id} is {session.status}.")
+
+            lines = self.variances(zero_uncounted).values_list('product_id', 'counted', 'variance')
+            counts = {pk: (counted, variance) for pk, counted, variance in lines}
+            if counts:
+                locked = Product.lock_stock(counts)
+                # Unscanned products go to zero whatever they sold meanwhile,
+                # and no count takes stock below zero
+                deltas = {
+                    pk: -locked[pk].stock if counted is None else max(variance, -locked[pk].stock)
+                    for pk, (counted, variance) in counts.items() if pk in locked
+                }
+                ids = sorted(pk for pk, delta in deltas.items() if delta)
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"""
+                        UPDATE {Product._meta.db_table} AS p
+                        SET stock = p.stock + v.delta, updated_at = now()
+                        FROM unnest(%s::bigint[], %s::integer[]) AS v(id, delta)
+                        WHERE p.id = v.id
+                        RETURNING p.id, p.stock
+                        """,
+                        [ids, [deltas[pk] for pk in ids]],
+                    )
+                    stock_levels = dict(cursor.fetchall())
+
+                RestockHistory.consume_fifo({pk: -delta for pk, delta in deltas.items() if delta < 0})
+                surplus = [pk for pk in ids if deltas[pk] > 0]
+                prices = dict(Product.objects.filter(id__in=surplus).values_list('id', 'cost_price'))
+                RestockHistory.objects.bulk_create([
+                    RestockHistory(product_id=pk, quantity=deltas[pk], remaining=deltas[pk],
+                                   unit_cost=prices[pk], restocked_by=user,
+                                   note=f"Stocktake #{self.id} surplus")
+                    for pk in surplus
+                ])
+                StockMovement.record('stocktake', [
+                    (pk, deltas[pk], stock_levels[pk], f'stocktake:{self.id}') for pk in ids
+                ], user=user)
+
+                from .sku_index import sku_index  # sku_index imports this module
+                transaction.on_commit(partial(sku_index.apply_stock, stock_levels))
+            else:
+                ids = []
+
+            session.status = 'applied'
+            session.applied_by = user
+            session.applied_at = timezone.now()
+            session.save(update_fields=['status', 'applied_by', 'applied_at'])
+        self.status, self.applied_by, self.applied_at = session.status, user, session.applied_at
+        return len(ids)
+
+    def cancel(self):
+        updated = StocktakeSession.objects.filter(pk=self.pk, status='open').update(status='cancelled')
+        if not updated:
+            raise ValueError(f"Stocktake #{self.id} is not open.")
+        self.status = 'cancelled'
+
+
+class StocktakeLine(models.Model):
+    session = models.ForeignKey(StocktakeSession, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    expected = models.IntegerField()  # stock when opened, reset at the first scan
+    counted = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'product'], name='products_stocktake_line_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.counted}/{self.expected}"
+
+
+class StocktakeBatch(models.Model):
+    """An uploaded batch of scans, recorded so resends aren't counted twice."""
+    session = models.ForeignKey(StocktakeSession, on_delete=models.CASCADE, related_name='batches')
+    batch_id = models.UUIDField()
+    scans = models.PositiveIntegerField(default=0)
+    uploaded_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'batch_id'], name='products_stocktake_batch_uniq'),
+        ]
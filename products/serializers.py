@@ -1,5 +1,7 @@
+from decimal import Decimal
+
 from rest_framework import serializers
-from .models import Category, Product
+from .models import Category, Product, StockMovement, StocktakeLine, StocktakeSession
 from .models import Product
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -18,4 +20,136 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
-        
\ No newline at end of file
+        
+class ProductChangeSerializer(serializers.Serializer):
+    sku = serializers.CharField(max_length=50)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'), required=False)
+    cost_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.00'), required=False)
+    stock_delta = serializers.IntegerField(required=False)
+    is_active = serializers.BooleanField(required=False)
+
+
+class PriceRuleSerializer(serializers.Serializer):
+    """
+    "+5% on category X": percent or amount (negative to lower) applied to
+    price or cost_price of every product in the category and its
+    sub-categories, or all products.
+    """
+    field = serializers.ChoiceField(choices=['price', 'cost_price'], default='price')
+    category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), required=False, allow_null=True)
+    percent = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=Decimal('-99.99'), required=False)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+
+    def validate(self, data):
+        if ('percent' in data) == ('amount' in data):
+            raise serializers.ValidationError('Give either percent or amount.')
+        if data.get('category') is not None:
+            data['category'] = data['category'].id
+        return data
+
+
+class BulkProductUpdateSerializer(serializers.Serializer):
+    max_changes = 20000
+
+    changes = ProductChangeSerializer(many=True, required=False, default=list)
+    rules = PriceRuleSerializer(many=True, required=False, default=list)
+
+    def validate_changes(self, changes):
+        if len(changes) > self.max_changes:
+            raise serializers.ValidationError(f'At most {self.max_changes} changes per request.')
+        skus = [change['sku'] for change in changes]
+        if len(set(skus)) != len(skus):
+            raise serializers.ValidationError('Each SKU may appear only once.')
+        return changes
+
+    def validate(self, data):
+        if not data['changes'] and not data['rules']:
+            raise serializers.ValidationError('Nothing to update.')
+        return data
+
+
+class ReceiptLineSerializer(serializers.Serializer):
+    sku = serializers.CharField(max_length=50)
+    quantity = serializers.IntegerField(min_value=1)
+    unit_cost = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.00'))
+
+
+class ReceiveStockSerializer(serializers.Serializer):
+    items = ReceiptLineSerializer(many=True, allow_empty=False)
+    note = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def validate_items(self, items):
+        skus = [item['sku'] for item in items]
+        if len(set(skus)) != len(skus):
+            raise serializers.ValidationError('Each SKU may appear only once.')
+        return items
+
+
+class LowStockProductSerializer(serializers.ModelSerializer):
+    daily_velocity = serializers.DecimalField(
+        source='reorder_suggestion.daily_velocity', max_digits=10, decimal_places=3, read_only=True, default=None
+    )
+    suggested_quantity = serializers.IntegerField(
+        source='reorder_suggestion.suggested_quantity', read_only=True, default=None
+    )
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'sku', 'stock', 'reorder_level', 'daily_velocity', 'suggested_quantity']
+
+
+class StocktakeSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StocktakeSession
+        fields = ['id', 'status', 'note', 'created_at', 'applied_at']
+        read_only_fields = ['status', 'created_at', 'applied_at']
+
+
+class StocktakeScanSerializer(serializers.Serializer):
+    """
+    A batch of scans: [{"sku", "quantity"}], quantity defaulting to 1 so a
+    handheld can send one entry per beep. Validated in one pass rather than
+    a serializer per scan, since a batch can hold tens of thousands.
+    """
+    max_scans = 50000
+
+    batch_id = serializers.UUIDField(required=False, allow_null=True, default=None)
+    scans = serializers.JSONField()
+
+    def validate_scans(self, scans):
+        if not isinstance(scans, list) or not scans:
+            raise serializers.ValidationError('Send a non-empty list of scans.')
+        if len(scans) > self.max_scans:
+            raise serializers.ValidationError(f'At most {self.max_scans} scans per batch.')
+        counts = {}
+        for position, scan in enumerate(scans):
+            sku = scan.get('sku') if isinstance(scan, dict) else None
+            quantity = scan.get('quantity', 1) if isinstance(scan, dict) else None
+            if not isinstance(sku, str) or not sku or len(sku) > 50:
+                raise serializers.ValidationError(f'Scan {position}: sku must be a string of up to 50 characters.')
+            if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 0:
+                raise serializers.ValidationError(f'Scan {position}: quantity must be a whole number, 0 or more.')
+            counts[sku] = counts.get(sku, 0) + quantity
+        return counts
+
+
+class StocktakeVarianceSerializer(serializers.ModelSerializer):
+    sku = serializers.CharField(source='product.sku', read_only=True)
+    name = serializers.CharField(source='product.name', read_only=True)
+    variance = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = StocktakeLine
+        fields = ['sku', 'name', 'expected', 'counted', 'variance']
+
+
+class StocktakeApplySerializer(serializers.Serializer):
+    zero_uncounted = serializers.BooleanField(default=False)
+
+
+class StockMovementSerializer(serializers.ModelSerializer):
+    sku = serializers.CharField(source='product.sku', read_only=True)
+
+    class Meta:
+        model = StockMovement
+        fields = ['id', 'sku', 'kind', 'quantity', 'stock_after', 'reference', 'user', 'created_at']
@@ -0,0 +1,28 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Product
+from .sku_index import sku_index
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_sku_index(sender, instance, **kwargs):
+    # Evict the SKU as it was loaded and as it is now, once the change commits
+    current = (instance.subscription_id, instance.sku)
+    keys = {current, getattr(instance, '_loaded_sku_key', current)}
+    instance._loaded_sku_key = current
+
+    skus = defaultdict(set)
+    for subscription_id, sku in keys:
+        if subscription_id and sku:
+            skus[subscription_id].add(sku)
+    def evict():
+        for subscription_id, subscription_skus in skus.items():
+            sku_index.evict(subscription_id, subscription_skus)
+
+    if skus:
+        transaction.on_commit(evict)
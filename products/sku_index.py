@@ -0,0 +1,109 @@
+# products/sku_index.py
+# Per-worker SKU -> product lookup so scans at the till skip the database.
+
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+from decimal import Decimal
+
+from django.conf import settings
+
+
+class SkuRecord(NamedTuple):
+    id: int
+    name: str
+    price: Decimal
+    stock: int
+
+
+class SkuIndex:
+    """
+    LRU of per-subscription {sku: SkuRecord} maps, loaded lazily on first
+    scan. Entries expire after ttl seconds so changes made by other workers
+    show up; this worker's own saves, deletes and checkouts evict or update
+    the affected SKUs directly.
+    """
+
+    def __init__(self, max_subscriptions, ttl):
+        self.max_subscriptions = max_subscriptions
+        self.ttl = ttl
+        self._entries = OrderedDict()  # subscription_id -> (loaded_at, {sku: record})
+        self._lock = threading.Lock()
+
+    def lookup(self, subscription_id, sku):
+        """
+        Return the active product with this SKU in the subscription, or None.
+        A SKU missing from the loaded map is checked against the database
+        once and added if found.
+        """
+        skus = self._skus(subscription_id)
+        record = skus.get(sku)
+        if record is None:
+            record = self._fetch(subscription_id, sku=sku)
+            if record is not None:
+                skus[sku] = record
+        return record
+
+    def invalidate(self, subscription_id):
+        with self._lock:
+            self._entries.pop(subscription_id, None)
+
+    def evict(self, subscription_id, skus):
+        """
+        Drop these SKUs from a loaded map; the next scan of each reads it
+        from the database again. The rest of the map stays warm.
+        """
+        with self._lock:
+            entry = self._entries.get(subscription_id)
+        if entry:
+            for sku in skus:
+                entry[1].pop(sku, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def apply_stock(self, stock_levels):
+        """
+        Update cached stock from {product_id: stock} after a checkout.
+        """
+        with self._lock:
+            maps = [skus for _, skus in self._entries.values()]
+        for skus in maps:
+            for sku, record in list(skus.items()):
+                if record.id in stock_levels:
+                    skus[sku] = record._replace(stock=stock_levels[record.id])
+
+    def _skus(self, subscription_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(subscription_id)
+            if entry and now - entry[0] < self.ttl:
+                self._entries.move_to_end(subscription_id)
+                return entry[1]
+
+        skus = {row[0]: SkuRecord(*row[1:]) for row in self._rows(subscription_id)}
+        with self._lock:
+            self._entries[subscription_id] = (now, skus)
+            self._entries.move_to_end(subscription_id)
+            while len(self._entries) > self.max_subscriptions:
+                self._entries.popitem(last=False)
+        return skus
+
+    def _rows(self, subscription_id, **filters):
+        from .models import Product  # models imports this module
+
+        return Product.objects.filter(
+            subscription_id=subscription_id, is_active=True, **filters
+        ).order_by().values_list('sku', 'id', 'name', 'price', 'stock')
+
+    def _fetch(self, subscription_id, sku):
+        rows = self._rows(subscription_id, sku=sku)[:1]
+        return SkuRecord(*rows[0][1:]) if rows else None
+
+
+sku_index = SkuIndex(
+    max_subscriptions=getattr(settings, 'SKU_INDEX_MAX_SUBSCRIPTIONS', 32),
+    ttl=getattr(settings, 'SKU_INDEX_TTL_SECONDS', 60),
+)
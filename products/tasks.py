@@ -0,0 +1,40 @@
+import logging
+
+from celery import shared_task
+
+from accounts.models import ClientSubscription
+from .forecasting import forecast_subscription
+from .models import reconcile_stock, suggest_reorders
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def refresh_reorder_suggestions():
+    """
+    Nightly rebuild of every subscription's reorder suggestions (beat schedule
+    in settings.CELERY_BEAT_SCHEDULE).
+    """
+    suggest_reorders()
+
+
+@shared_task(ignore_result=True)
+def refresh_forecasts():
+    """
+    Nightly demand forecast for every subscription with products.
+    """
+    for subscription in ClientSubscription.objects.filter(products__isnull=False).distinct().iterator():
+        forecast_subscription(subscription)
+
+
+@shared_task(ignore_result=True)
+def check_stock_ledger():
+    """
+    Nightly check that every product's stock equals the sum of its stock
+    movements. Mismatches are logged; `manage.py reconcile_stock --fix`
+    records correcting adjustments.
+    """
+    mismatches = reconcile_stock()
+    for product_id, sku, stock, ledger in mismatches:
+        logger.warning(f"Stock ledger mismatch for {sku} (#{product_id}): stock {stock}, ledger {ledger}")
+    return len(mismatches)
@@ -1,3 +1,621 @@
-from django.test import TestCase
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
+
+import openpyxl
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import ClientSubscription, User
+from .forecasting import forecast_subscription
+from .importer import import_products
+from .models import (
+    Category, CategoryClosure, Product, ProductForecast, ProductImport, ReorderSuggestion,
+    RestockHistory, StockMovement, StocktakeSession, reconcile_stock, suggest_reorders,
+)
+from .sku_index import SkuIndex, sku_index
+
+
+class ProductTestMixin:
+    """
+    An owner with a subscription, a 'General' category and an API client
+    authenticated as the owner.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='owner@example.com', password='pass',
+            first_name='Own', last_name='Er', role='owner',
+        )
+        self.sub = ClientSubscription.objects.create(owner=self.user, business_name='Shop')
+        self.user.subscription = self.sub
+        self.user.save()
+        self.category = Category.objects.create(name='General')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def other_subscription(self):
+        return ClientSubscription.objects.create(
+            owner=User.objects.create_user(
+                email='other@example.com', password='pass',
+                first_name='Ot', last_name='Her', role='owner',
+            ),
+            business_name='Other',
+        )
+
+
+class CatalogApiTests(ProductTestMixin, TransactionTestCase):
+    # Catalog versions are transaction ids, so each change must commit on its own
+    def setUp(self):
+        super().setUp()
+        self.products = [
+            Product.objects.create(
+                subscription=self.sub, name=f'Item {i}', sku=f'SKU-{i}',
+                category=self.category, price=Decimal('2.50'), stock=10,
+            )
+            for i in range(3)
+        ]
+        self.foreign = Product.objects.create(
+            subscription=self.other_subscription(), name='Foreign', sku='SKU-X',
+            category=self.category, price=Decimal('1.00'),
+        )
+
+    def test_full_catalog_and_not_modified(self):
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [p['id'] for p in response.data['products']],
+            [p.id for p in self.products],
+        )
+
+        again = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+        Product.objects.filter(id=self.products[0].id).update(stock=3)
+        changed = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+
+    def test_etag_follows_the_cursor(self):
+        version, _ = Product.catalog_state(self.sub)
+        # A transaction still open when the first request ran held the cursor back
+        with mock.patch.object(Product, 'catalog_state', return_value=(version, version - 1)):
+            lagging = self.client.get('/api/products/')
+        caught_up = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=lagging['ETag'])
+        self.assertEqual(caught_up.status_code, 200)
+        self.assertEqual(caught_up.data['version'], version)
+
+    def test_delta_returns_changes_and_removals(self):
+        version = self.client.get('/api/products/').data['version']
+        kept, deactivated, deleted = self.products
+
+        Product.objects.filter(id=kept.id).update(price=Decimal('3.00'))
+        Product.objects.filter(id=deactivated.id).update(is_active=False)
+        Product.objects.filter(id=deleted.id).delete()
+        Product.objects.filter(id=self.foreign.id).update(stock=99)
+
+        delta = self.client.get('/api/products/', {'since': version}).data
+        self.assertEqual([p['id'] for p in delta['products']], [kept.id])
+        self.assertEqual(delta['products'][0]['price'], Decimal('3.00'))
+        self.assertEqual(delta['deleted'], sorted([deactivated.id, deleted.id]))
+
+        empty = self.client.get('/api/products/', {'since': delta['version']}).data
+        self.assertEqual((empty['products'], empty['deleted']), ([], []))
+
+
+class ProductSearchTests(ProductTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.coffee, self.tea, _ = [
+            Product.objects.create(
+                subscription=self.sub, name=name, sku=sku, description=description,
+                category=self.category, price=Decimal('2.50'),
+            )
+            for name, sku, description in (
+                ('Espresso Coffee Beans', 'BEAN-001', 'Dark roast'),
+                ('Green Tea', 'TEA-002', 'Loose leaf, pairs with coffee'),
+                ('Sugar', 'SUG-003', ''),
+            )
+        ]
+
+    def search(self, term):
+        response = self.client.get('/api/products/search/', {'q': term})
+        self.assertEqual(response.status_code, 200)
+        return [p['id'] for p in response.data['results']]
+
+    def test_typo_tolerant_and_ranked(self):
+        self.assertEqual(self.search('cofee')[0], self.coffee.id)
+        self.assertEqual(self.search('coffee'), [self.coffee.id, self.tea.id])
+
+    def test_sku_and_short_prefix(self):
+        self.assertEqual(self.search('TEA-002'), [self.tea.id])
+        self.assertEqual(self.search('gr'), [self.tea.id])
+
+    def test_falls_back_without_pg_trgm(self):
+        with mock.patch.object(Product, 'trigram_available', return_value=False):
+            self.assertEqual(self.search('coffee'), [self.coffee.id, self.tea.id])
+            self.assertEqual(self.search('cofee'), [])
+
+    def test_limit_is_clamped(self):
+        for limit, expected in (('-1', 1), ('0', 1), ('1000', 2)):
+            response = self.client.get('/api/products/search/', {'q': 'coffee', 'limit': limit})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), expected)
+
+    def test_scoped_to_subscription(self):
+        Product.objects.create(subscription=self.other_subscription(), name='Coffee Filter', sku='X-1',
+                               category=self.category, price=Decimal('1.00'))
+        self.assertNotIn('Coffee Filter', [p.name for p in Product.search(self.sub, 'coffee')])
+
+
+class ProductScanTests(ProductTestMixin, TestCase):
+    def setUp(self):
+        sku_index.clear()
+        super().setUp()
+        self.product = Product.objects.create(
+            subscription=self.sub, name='Cola', sku='5000112637922',
+            category=self.category, price=Decimal('1.20'), stock=12,
+        )
+
+    def scan(self, sku):
+        return self.client.get(f'/api/products/scan/{sku}/')
+
+    def test_hit_skips_database_after_first_load(self):
+        self.assertEqual(self.scan('5000112637922').data['stock'], 12)
+        with self.assertNumQueries(0):
+            response = self.scan('5000112637922')
+        self.assertEqual(response.data['price'], Decimal('1.20'))
+
+    def test_save_evicts_only_its_skus_and_miss_falls_back(self):
+        other = Product.objects.create(
+            subscription=self.sub, name='Lemonade', sku='LEM-1',
+            category=self.product.category, price=Decimal('1.00'),
+        )
+        self.scan('5000112637922')
+        self.scan('LEM-1')
+        product = Product.objects.get(id=self.product.id)
+        product.price = Decimal('1.50')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.scan('5000112637922').data['price'], Decimal('1.50'))
+        with self.assertNumQueries(0):
+            self.scan('LEM-1')
+
+        # A changed SKU stops answering under the old one
+        product.sku = 'COLA-2'
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(self.scan('5000112637922').status_code, 404)
+        self.assertEqual(self.scan('COLA-2').data['id'], product.id)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.scan('UNKNOWN').status_code, 404)
+
+    def test_stock_updates_and_lru_eviction(self):
+        index = SkuIndex(max_subscriptions=1, ttl=60)
+        index.lookup(self.sub.id, '5000112637922')
+        index.apply_stock({self.product.id: 4})
+        self.assertEqual(index.lookup(self.sub.id, '5000112637922').stock, 4)
+
+        index.lookup(self.sub.id + 1, 'anything')
+        self.assertNotIn(self.sub.id, index._entries)
+
+
+@override_settings(EXPORT_ROOT=tempfile.mkdtemp())
+class ProductImportTests(ProductTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.existing = Product.objects.create(
+            subscription=self.sub, name='Old Name', sku='A-1', category=self.category,
+            price=Decimal('1.00'), cost_price=Decimal('0.40'), stock=7,
+        )
+        Product.objects.create(subscription=self.other_subscription(), name='Theirs', sku='X-1',
+                               category=self.category, price=Decimal('1.00'))
+
+    def test_csv_upserts_and_reports_rejected_rows(self):
+        csv_file = BytesIO(
+            b'Name,SKU,Price,Category,Stock\n'
+            b'New Name,A-1,1.25,General,\n'
+            b'Crisps,B-2,0.80,Snacks,30\n'
+            b'Bad Price,C-3,abc,Snacks,1\n'
+            b'Crisps Again,B-2,0.90,Snacks,5\n'
+            b'Taken,X-1,2.00,General,1\n'
+        )
+        result = import_products(self.sub, csv_file, 'catalog.csv', user=self.user)
+
+        self.assertEqual((result.total, result.created, result.updated), (5, 1, 1))
+        self.assertEqual([(line, sku) for line, sku, _ in result.rejected],
+                         [(4, 'C-3'), (5, 'B-2'), (6, 'X-1')])
+
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.name, self.existing.price), ('New Name', Decimal('1.25')))
+        # Columns absent from the file and blank cells are left alone
+        self.assertEqual((self.existing.cost_price, self.existing.stock), (Decimal('0.40'), 7))
+
+        crisps = Product.objects.get(sku='B-2')
+        self.assertEqual((crisps.subscription, crisps.category.name, crisps.stock), (self.sub, 'Snacks', 30))
+        self.assertEqual(Product.objects.get(sku='X-1').name, 'Theirs')
+
+    def test_non_finite_and_out_of_range_values_are_rejected_per_row(self):
+        csv_file = BytesIO(
+            b'name,sku,price,cost_price,stock\n'
+            b'Nan,N-1,NaN,,\n'
+            b'Inf,N-2,Infinity,,\n'
+            b'Huge,N-3,1e30,,\n'
+            b'Dear,N-4,100000000,,\n'
+            b'Cost,N-5,1.00,-inf,\n'
+            b'Many,N-6,1.00,,2147483648\n'
+            b'Half,N-7,1.00,,1.5\n'
+            b'Fine,N-8,1.00,0.50,2147483647\n'
+        )
+        result = import_products(self.sub, csv_file, 'catalog.csv', user=self.user)
+
+        self.assertEqual([sku for _, sku, _ in result.rejected],
+                         ['N-1', 'N-2', 'N-3', 'N-4', 'N-5', 'N-6', 'N-7'])
+        self.assertEqual(result.created, 1)
+        self.assertEqual(Product.objects.get(sku='N-8').stock, 2147483647)
+
+    def test_xlsx_upload_view(self):
+        wb = openpyxl.Workbook()
+        wb.active.append(['name', 'sku', 'price'])
+        wb.active.append(['Water', 'W-1', 0.5])
+        wb.active.append(['', 'W-2', 0.5])
+        content = BytesIO()
+        wb.save(content)
+
+        self.client.force_login(self.user)
+        response = self.client.post('/products/import/', {
+            'file': SimpleUploadedFile('catalog.xlsx', content.getvalue()),
+        })
+        self.assertEqual(response.status_code, 200)
+
+        product_import = ProductImport.objects.get()
+        self.assertEqual((product_import.status, product_import.created_count,
+                          product_import.rejected_count), ('done', 1, 1))
+        self.assertEqual(Product.objects.get(sku='W-1').category.name, 'Uncategorized')
+
+        report = self.client.get(f'/products/import/{product_import.id}/errors/')
+        lines = b''.join(report.streaming_content).decode().splitlines()
+        self.assertEqual(lines[1], '3,W-2,name is required')
+
+    def test_missing_columns_fail_the_import(self):
+        product_import = ProductImport.objects.create(subscription=self.sub, filename='bad.csv')
+        product_import.run(BytesIO(b'name,price\nTea,1.00\n'))
+        self.assertEqual(product_import.status, 'failed')
+        self.assertIn('sku', product_import.error)
+
+
+class ProductBulkUpdateTests(ProductTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.drinks = Category.objects.create(name='Drinks')
+        snacks = Category.objects.create(name='Snacks')
+        self.products = [
+            Product.objects.create(
+                subscription=self.sub, name=f'Item {i}', sku=f'SKU-{i}',
+                category=self.drinks if i < 3 else snacks,
+                price=Decimal('2.00'), stock=10,
+            )
+            for i in range(5)
+        ]
+
+    def post(self, payload):
+        return self.client.post('/api/products/bulk-update/', payload, format='json')
+
+    def prices(self):
+        return dict(Product.objects.values_list('sku', 'price'))
+
+    def test_rules_then_changes_in_one_batch(self):
+        response = self.post({
+            'rules': [{'category': self.drinks.id, 'percent': '5'}],
+            'changes': [
+                {'sku': 'SKU-0', 'price': '9.99'},
+                {'sku': 'SKU-3', 'stock_delta': -4, 'cost_price': '1.10'},
+                {'sku': 'SKU-4', 'is_active': False},
+            ],
+        })
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['updated'], 5)
+
+        prices = self.prices()
+        self.assertEqual(prices['SKU-0'], Decimal('9.99'))
+        self.assertEqual(prices['SKU-1'], Decimal('2.10'))
+        self.assertEqual(prices['SKU-3'], Decimal('2.00'))
+        changed = Product.objects.get(sku='SKU-3')
+        self.assertEqual((changed.stock, changed.cost_price), (6, Decimal('1.10')))
+        self.assertFalse(Product.objects.get(sku='SKU-4').is_active)
+        self.assertEqual(len(set(Product.objects.values_list('catalog_version', flat=True))), 1)
+
+    def test_category_rule_covers_sub_categories(self):
+        juice = Category.objects.create(name='Juice', parent=self.drinks)
+        Product.objects.create(subscription=self.sub, name='Orange', sku='JUICE-1',
+                               category=juice, price=Decimal('2.00'))
+
+        updated, errors = Product.bulk_update_catalog(
+            self.sub, rules=[{'field': 'price', 'category': self.drinks.id, 'amount': Decimal('0.50')}]
+        )
+
+        self.assertEqual((updated, errors), (4, []))
+        prices = self.prices()
+        self.assertEqual((prices['JUICE-1'], prices['SKU-0'], prices['SKU-3']),
+                         (Decimal('2.50'), Decimal('2.50'), Decimal('2.00')))
+
+    def test_statement_count_does_not_grow_with_batch(self):
+        changes = [{'sku': p.sku, 'price': '3.00'} for p in self.products]
+        # lock, rule, changes + savepoint
+        with self.assertNumQueries(5):
+            Product.bulk_update_catalog(self.sub, changes, [{'field': 'price', 'amount': Decimal('1')}])
+
+    def test_bad_rows_reject_the_whole_batch(self):
+        response = self.post({'changes': [
+            {'sku': 'SKU-0', 'price': '5.00'},
+            {'sku': 'SKU-1', 'stock_delta': -11},
+            {'sku': 'NOPE', 'price': '1.00'},
+        ]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([e['sku'] for e in response.data['errors']], ['SKU-1', 'NOPE'])
+        self.assertEqual(set(self.prices().values()), {Decimal('2.00')})
+
+        self.user.role = 'cashier'
+        self.user.save()
+        self.assertEqual(self.post({'changes': [{'sku': 'SKU-0', 'price': '5.00'}]}).status_code, 403)
+
+
+@override_settings(REORDER_LOOKBACK_DAYS=10, REORDER_COVER_DAYS=7)
+class LowStockTests(ProductTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.low, self.selling, self.plenty = [
+            Product.objects.create(
+                subscription=self.sub, name=name, sku=name.upper(), category=self.category,
+                price=Decimal('1.00'), stock=stock, reorder_level=5,
+            )
+            for name, stock in (('Bread', 3), ('Milk', 20), ('Salt', 50))
+        ]
+        Product.objects.create(subscription=self.sub, name='Retired', sku='OLD', category=self.category,
+                               price=Decimal('1.00'), stock=0, is_active=False)
+
+    def test_low_stock_api_is_paginated(self):
+        response = self.client.get('/api/products/low-stock/', {'page_size': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['sku'], 'BREAD')
+        self.assertIsNone(response.data['results'][0]['suggested_quantity'])
+
+    def test_suggestions_follow_sales_velocity(self):
+        from reports.models import DailyProductRollup
+
+        today = timezone.localdate()
+        DailyProductRollup.objects.bulk_create([
+            DailyProductRollup(subscription=self.sub, product=self.selling,
+                               date=today - timedelta(days=day), units=3)
+            for day in range(1, 11)
+        ])
+        self.assertEqual(suggest_reorders(self.sub), 2)
+
+        suggestions = {s.product_id: s for s in ReorderSuggestion.objects.all()}
+        # Milk sells 3/day: 20 in stock won't cover 7 days above the reorder level
+        self.assertEqual(suggestions[self.selling.id].daily_velocity, Decimal('3.000'))
+        self.assertEqual(suggestions[self.selling.id].suggested_quantity, 5 + 21 - 20)
+        self.assertEqual(suggestions[self.low.id].suggested_quantity, 2)
+        self.assertNotIn(self.plenty.id, suggestions)
+
+        Product.objects.filter(id=self.low.id).update(stock=40)
+        suggest_reorders(self.sub)
+        self.assertFalse(ReorderSuggestion.objects.filter(product=self.low).exists())
+
+
+class CategoryTreeTests(ProductTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.electronics = Category.objects.create(name='Electronics')
+        self.phones = Category.objects.create(name='Phones', parent=self.electronics)
+        self.cases = Category.objects.create(name='Cases', parent=self.phones)
+        self.food = Category.objects.create(name='Food')
+
+    def ancestors(self, category):
+        return dict(
+            CategoryClosure.objects.filter(descendant=category).values_list('ancestor__name', 'depth')
+        )
+
+    def test_closure_follows_inserts_and_moves(self):
+        self.assertEqual(self.ancestors(self.cases), {'Cases': 0, 'Phones': 1, 'Electronics': 2})
+
+        self.phones.parent = self.food
+        self.phones.save()
+        self.assertEqual(self.ancestors(self.cases), {'Cases': 0, 'Phones': 1, 'Food': 2})
+        self.assertEqual(
+            set(Category.objects.filter(id__in=Category.subtree_ids(self.electronics.id))
+                .values_list('name', flat=True)),
+            {'Electronics'},
+        )
+
+        self.phones.delete()
+        self.assertEqual(self.ancestors(self.cases), {'Cases': 0})
+
+    def test_moving_under_own_subtree_is_rejected(self):
+        self.electronics.parent = self.cases
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            self.electronics.save()
+
+    def test_product_list_includes_subcategories(self):
+        for name, category in (('Phone', self.phones), ('Case', self.cases), ('Bread', self.food)):
+            Product.objects.create(subscription=self.sub, name=name, sku=name.upper(),
+                                   category=category, price=Decimal('1.00'))
+
+        self.client.force_login(self.user)
+        response = self.client.get('/products/', {'category': self.electronics.id})
+        self.assertEqual([p.name for p in response.context['object_list']], ['Case', 'Phone'])
+
+
+@override_settings(FORECAST_HISTORY_DAYS=28, FORECAST_WINDOW_DAYS=28,
+                   FORECAST_HORIZON_DAYS=30, REORDER_COVER_DAYS=14)
+class ForecastTests(ProductTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.steady, self.weekend, self.idle = [
+            Product.objects.create(
+                subscription=self.sub, name=name, sku=name.upper(), category=self.category,
+                price=Decimal('1.00'), stock=10, reorder_level=5,
+            )
+            for name in ('Milk', 'Wine', 'Candles')
+        ]
+        self.today = date(2026, 6, 1)  # a Monday
+
+    def sell(self, product, units_for_day):
+        from reports.models import DailyProductRollup
+
+        days = [self.today - timedelta(days=n) for n in range(1, 29)]
+        DailyProductRollup.objects.bulk_create([
+            DailyProductRollup(subscription=self.sub, product=product, date=day, units=units_for_day(day))
+            for day in days if units_for_day(day)
+        ])
+
+    def test_moving_average_and_weekly_seasonality(self):
+        self.sell(self.steady, lambda day: 2)
+        self.sell(self.weekend, lambda day: 7 if day.weekday() == 5 else 0)
+
+        self.assertEqual(forecast_subscription(self.sub, today=self.today), 3)
+        forecasts = {f.product_id: f for f in ProductForecast.objects.all()}
+
+        steady = forecasts[self.steady.id]
+        self.assertEqual(steady.daily_demand, Decimal('2.000'))
+        self.assertEqual(steady.projected_stockout, self.today + timedelta(days=4))
+        self.assertEqual(steady.recommended_quantity, 14 * 2 + 5 - 10)
+
+        # All of the wine is sold on Saturdays: 7 on the first one runs out stock of 10 on the second
+        self.assertEqual(forecasts[self.weekend.id].projected_stockout, date(2026, 6, 13))
+
+        idle = forecasts[self.idle.id]
+        self.assertEqual((idle.projected_stockout, idle.recommended_quantity), (None, 0))
+
+
+class StocktakeTests(ProductTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = [
+            Product.objects.create(
+                subscription=self.sub, name=f'Item {i}', sku=f'SKU-{i}', category=self.category,
+                price=Decimal('5.00'), cost_price=Decimal('2.00'), stock=0,
+            )
+            for i in range(3)
+        ]
+        RestockHistory.receive({p.id: (10, Decimal('2.00')) for p in self.products})
+        response = self.client.post('/api/products/stocktakes/', {'note': 'Year end'}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.session = StocktakeSession.objects.get(id=response.json()['id'])
+        self.url = f'/api/products/stocktakes/{self.session.id}/'
+
+    def stock(self):
+        return dict(Product.objects.values_list('sku', 'stock'))
+
+    def test_batches_add_up_and_resends_are_ignored(self):
+        batch = {'batch_id': '1b4e28ba-2fa1-11d2-883f-0016d3cca427',
+                 'scans': [{'sku': 'SKU-0', 'quantity': 6}, {'sku': 'SKU-0'}, {'sku': 'NOPE'}]}
+        first = self.client.post(self.url + 'scans/', batch, format='json').json()
+        self.assertEqual(first, {'status': 'recorded', 'unknown_skus': ['NOPE']})
+        resent = self.client.post(self.url + 'scans/', batch, format='json').json()
+        self.assertEqual(resent['status'], 'duplicate')
+        self.client.post(self.url + 'scans/', {'scans': [{'sku': 'SKU-1', 'quantity': 12}]}, format='json')
+
+        variances = self.client.get(self.url + 'variances/').json()['results']
+        self.assertEqual([(v['sku'], v['variance']) for v in variances], [('SKU-0', -3), ('SKU-1', 2)])
+        summary = self.client.get(self.url).json()
+        self.assertEqual((summary['products'], summary['scanned'], summary['units']), (3, 2, -1))
+
+    def test_apply_keeps_sales_made_during_the_count(self):
+        self.session.record_scans({'SKU-0': 7, 'SKU-1': 13})
+        # Sold after being counted: the count doesn't see it, stock must keep it
+        Product.apply_stock_decrement({self.products[0].id: 2})
+        RestockHistory.consume_fifo({self.products[0].id: 2})
+
+        with self.assertNumQueries(11):
+            adjusted = self.session.apply(self.user)
+
+        self.assertEqual(adjusted, 2)
+        self.assertEqual(self.stock(), {'SKU-0': 5, 'SKU-1': 13, 'SKU-2': 10})
+        self.assertEqual(RestockHistory.inventory_value(self.sub), (28, Decimal('56.00')))
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.status, 'applied')
+        response = self.client.post(self.url + 'scans/', {'scans': [{'sku': 'SKU-2'}]}, format='json')
+        self.assertEqual(response.status_code, 409)
+
+    def test_zero_uncounted_clears_unscanned_products(self):
+        self.session.record_scans({'SKU-0': 10})
+        response = self.client.post(self.url + 'apply/', {'zero_uncounted': True}, format='json')
+        self.assertEqual(response.json(), {'status': 'applied', 'adjusted': 2})
+        self.assertEqual(self.stock(), {'SKU-0': 10, 'SKU-1': 0, 'SKU-2': 0})
+
+
+class StockMovementTests(ProductTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.client.post('/products/create/', {
+            'name': 'Tea', 'sku': 'TEA', 'category': self.category.id,
+            'price': '3.00', 'cost_price': '1.00', 'stock': 4, 'reorder_level': 2, 'is_active': True,
+        })
+        self.product = Product.objects.get(sku='TEA')
+
+    def ledger(self):
+        return list(self.product.movements.order_by('id').values_list('kind', 'quantity', 'stock_after'))
+
+    def test_every_writer_appends_to_the_ledger(self):
+        RestockHistory.receive({self.product.id: (10, Decimal('1.20'))}, user=self.user)
+        Product.bulk_update_catalog(self.sub, [{'sku': 'TEA', 'stock_delta': -3}])
+        form = {'name': 'Tea', 'sku': 'TEA', 'category': self.category.id, 'price': '3.00',
+                'cost_price': '1.20', 'stock': 9, 'reorder_level': 2, 'is_active': True}
+        self.client.post(f'/products/update/{self.product.id}/', form)
+
+        self.assertEqual(self.ledger(), [
+            ('opening', 4, 4), ('restock', 10, 14), ('adjustment', -3, 11), ('adjustment', -2, 9),
+        ])
+        self.assertEqual(reconcile_stock(self.sub), [])
+
+    def test_stock_decreases_draw_down_cost_layers(self):
+        mug = Product.objects.create(subscription=self.sub, name='Mug', sku='MUG', category=self.category,
+                                     price=Decimal('5.00'), stock=0)
+        RestockHistory.receive({mug.id: (10, Decimal('2.00'))})
+        # Tea: 4 units without layers at cost_price 1.00
+        self.assertEqual(RestockHistory.inventory_value(self.sub), (14, Decimal('24.00')))
+
+        Product.bulk_update_catalog(self.sub, [{'sku': 'MUG', 'stock_delta': -7}])
+        self.assertEqual(RestockHistory.inventory_value(self.sub), (7, Decimal('10.00')))
+
+        self.client.post(f'/products/update/{mug.id}/', {
+            'name': 'Mug', 'sku': 'MUG', 'category': self.category.id, 'price': '5.00',
+            'cost_price': '2.00', 'stock': 1, 'reorder_level': 2, 'is_active': True,
+        })
+        self.assertEqual(RestockHistory.inventory_value(self.sub), (5, Decimal('6.00')))
+
+        import_products(self.sub, BytesIO(b'name,sku,price,stock\nMug,MUG,5.00,0\n'), 'stock.csv')
+        self.assertEqual(RestockHistory.inventory_value(self.sub), (4, Decimal('4.00')))
+        self.assertEqual(sum(RestockHistory.objects.filter(product=mug).values_list('remaining', flat=True)), 0)
+
+    def test_stock_at_reads_the_latest_movement(self):
+        before = timezone.now()
+        RestockHistory.receive({self.product.id: (6, Decimal('1.00'))})
+
+        with self.assertNumQueries(1):
+            self.assertEqual(StockMovement.stock_at(self.sub, before), {self.product.id: 4})
+        data = self.client.get('/api/products/stock-at/', {'at': timezone.now().isoformat()}).json()
+        self.assertEqual(data['stock'], {'TEA': 10})
+
+    def test_reconcile_finds_drift_and_ledger_is_append_only(self):
+        Product.objects.filter(id=self.product.id).update(stock=7)
+        self.assertEqual(reconcile_stock(self.sub), [(self.product.id, 'TEA', 7, 4)])
+
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            StockMovement.objects.filter(product=self.product).update(quantity=7)
+        # Deleting a user still nulls their movements
+        clerk = User.objects.create_user(email='clerk@example.com', password='pass',
+                                         first_name='Cl', last_name='Erk', role='admin')
+        RestockHistory.receive({self.product.id: (1, Decimal('1.00'))}, user=clerk)
+        clerk.delete()
+        self.assertEqual(self.ledger()[-1], ('restock', 1, 8))
 
-# Create your tests here.
@@ -3,7 +3,9 @@ from .views import (
     ProductListView,
     ProductCreateView,
     ProductUpdateView,
-    ProductDeleteView
+    ProductDeleteView,
+    ProductImportView,
+    ProductImportErrorsView
 )
 
 urlpatterns = [
@@ -11,4 +13,6 @@ urlpatterns = [
     path('create/', ProductCreateView.as_view(), name='product-create'),
     path('update/<int:pk>/', ProductUpdateView.as_view(), name='product-update'),
     path('delete/<int:pk>/', ProductDeleteView.as_view(), name='product-delete'),
+    path('import/', ProductImportView.as_view(), name='product-import'),
+    path('import/<int:pk>/errors/', ProductImportErrorsView.as_view(), name='product-import-errors'),
 ]
\ No newline at end of file
@@ -1,18 +1,24 @@
-from django.views.generic import ListView, CreateView, UpdateView, DeleteView
+from django.views.generic import ListView, CreateView, UpdateView, DeleteView, FormView, View
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.db import transaction
 from django.urls import reverse_lazy
-from django.db.models import F
-from .models import Product, Category
-from .forms import ProductForm
-
-def get_user_subscription(user):
-    """
-    Return the ClientSubscription for this user, whether
-    they're a member or the owner.
-    """
-    if hasattr(user, 'subscription') and user.subscription:
-        return user.subscription
-    return getattr(user, 'owned_subscription', None)
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import generics, status
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from accounts.permissions import IsOwnerOrAdmin
+from .models import DeletedProduct, Product, Category, ProductImport, RestockHistory, StockMovement, StocktakeSession
+from .sku_index import sku_index
+from .forms import ProductForm, ProductImportForm
+from .serializers import (
+    BulkProductUpdateSerializer, LowStockProductSerializer, ReceiveStockSerializer,
+    StockMovementSerializer, StocktakeApplySerializer, StocktakeScanSerializer, StocktakeSessionSerializer,
+    StocktakeVarianceSerializer,
+)
 
 
 class ProductListView(LoginRequiredMixin, ListView):
@@ -21,33 +27,31 @@ class ProductListView(LoginRequiredMixin, ListView):
     paginate_by = 20
 
     def get_queryset(self):
-        sub = get_user_subscription(self.request.user)
+        sub = self.request.subscription
         # if no subscription, return empty
         if not sub:
             return Product.objects.none()
 
-        qs = Product.objects.filter(subscription=sub)
-
         search = self.request.GET.get('search')
         if search:
-            qs = qs.filter(name__icontains=search)
+            qs = Product.search(sub, search)
+        else:
+            qs = Product.objects.filter(subscription=sub).order_by('name')
 
         category_id = self.request.GET.get('category')
-        if category_id:
-            qs = qs.filter(category_id=category_id)
+        if category_id and category_id.isdigit():
+            # The category and all of its sub-categories
+            qs = qs.filter(category_id__in=Category.subtree_ids(category_id))
 
-        return qs.order_by('name')
+        return qs
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['categories'] = Category.objects.all()
 
-        sub = get_user_subscription(self.request.user)
+        sub = self.request.subscription
         if sub:
-            context['low_stock'] = Product.objects.filter(
-                subscription=sub,
-                stock__lte=F('reorder_level')
-            )
+            context['low_stock'] = Product.low_stock(sub)
         else:
             context['low_stock'] = Product.objects.none()
 
@@ -65,10 +69,14 @@ class ProductCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
 
     def form_valid(self, form):
         user = self.request.user
-        sub = get_user_subscription(user)
+        sub = self.request.subscription
         form.instance.created_by = user
-        form.instance.subscription = sub
-        return super().form_valid(form)
+        form.instance.subscription = sub or None
+        with transaction.atomic():
+            response = super().form_valid(form)
+            stock = self.object.stock
+            StockMovement.record('opening', [(self.object.id, stock, stock, '')], user=user)
+        return response
 
 
 class ProductUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
@@ -79,13 +87,27 @@ class ProductUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
 
     def test_func(self):
         prod = self.get_object()
-        sub = get_user_subscription(self.request.user)
+        sub = self.request.subscription
         return (
             self.request.user.role in ['owner', 'admin'] and
-            sub is not None and
+            bool(sub) and
             prod.subscription == sub
         )
 
+    def form_valid(self, form):
+        # The form sets stock outright; lock the row so the ledger records
+        # the change from what's actually on hand, sales included
+        with transaction.atomic():
+            before = Product.lock_stock([self.object.id])[self.object.id].stock
+            response = super().form_valid(form)
+            delta = self.object.stock - before
+            StockMovement.record('adjustment', [
+                (self.object.id, delta, self.object.stock, 'edit')
+            ], user=self.request.user)
+            if delta < 0:
+                RestockHistory.consume_fifo({self.object.id: -delta})
+        return response
+
 
 class ProductDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     model = Product
@@ -94,9 +116,429 @@ class ProductDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
 
     def test_func(self):
         prod = self.get_object()
-        sub = get_user_subscription(self.request.user)
+        sub = self.request.subscription
         return (
             self.request.user.role in ['owner', 'admin'] and
-            sub is not None and
+            bool(sub) and
             prod.subscription == sub
         )
+
+
+class ProductImportView(LoginRequiredMixin, UserPassesTestMixin, FormView):
+    """
+    Upload a CSV/XLSX catalog; products are created or updated by SKU and
+    the page shows the outcome with a link to the rejected rows.
+    """
+    form_class = ProductImportForm
+    template_name = 'products/import.html'
+
+    def test_func(self):
+        return (
+            self.request.user.role in ['owner', 'admin'] and
+            bool(self.request.subscription)
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['recent_imports'] = ProductImport.objects.filter(
+            subscription=self.request.subscription
+        )[:5]
+        return context
+
+    def form_valid(self, form):
+        upload = form.cleaned_data['file']
+        product_import = ProductImport.objects.create(
+            subscription=self.request.subscription,
+            uploaded_by=self.request.user,
+            filename=upload.name,
+        )
+        product_import.run(upload)
+        return self.render_to_response(self.get_context_data(form=form, result=product_import))
+
+
+class ProductImportErrorsView(LoginRequiredMixin, UserPassesTestMixin, View):
+    def test_func(self):
+        return self.request.user.role in ['owner', 'admin']
+
+    def get(self, request, pk, *args, **kwargs):
+        product_import = get_object_or_404(
+            ProductImport, pk=pk, subscription=request.subscription or None
+        )
+        if not product_import.error_report:
+            raise Http404("This import has no rejected rows")
+        return FileResponse(
+            product_import.error_report.open('rb'),
+            as_attachment=True,
+            filename=f'import_{product_import.id}_errors.csv',
+            content_type='text/csv'
+        )
+
+
+CATALOG_FIELDS = ('id', 'name', 'sku', 'price', 'stock', 'category_id', 'reorder_level')
+
+
+class CatalogView(generics.GenericAPIView):
+    """
+    Product catalog for POS registers, scoped by subscription.
+
+    GET returns {"version", "products", "deleted"}. Pass the returned version
+    back as ?since=<version> to receive only products changed since then and
+    the ids of products deleted or deactivated. Responses carry an ETag, and a
+    matching If-None-Match gets 304 Not Modified.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        sub = request.subscription
+        if not sub:
+            return Response({'version': 0, 'products': [], 'deleted': []})
+
+        version, cursor = Product.catalog_state(sub)
+        since = request.query_params.get('since')
+        try:
+            since = int(since) if since else None
+        except ValueError:
+            return Response({'error': 'since must be an integer version.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # The body carries the cursor, which can lag the version while a
+        # transaction is open, so both go into the tag: a 304 must never
+        # leave a register holding a stale cursor
+        etag = f'"catalog-{sub.id}-{version}-{cursor}-{since if since is not None else "full"}"'
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in [tag.strip() for tag in if_none_match.split(',')]:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        products = Product.objects.filter(subscription=sub).order_by('id')
+        deleted = []
+        if since is None:
+            products = products.filter(is_active=True)
+        else:
+            products = products.filter(catalog_version__gt=since)
+            deleted = list(
+                DeletedProduct.objects.filter(
+                    subscription_id=sub.id, catalog_version__gt=since
+                ).values_list('product_id', flat=True)
+            )
+
+        rows = []
+        for row in products.values(*CATALOG_FIELDS, 'is_active'):
+            if row.pop('is_active'):
+                rows.append(row)
+            else:
+                deleted.append(row['id'])
+
+        return Response(
+            {'version': cursor, 'products': rows, 'deleted': sorted(set(deleted))},
+            headers=headers,
+        )
+
+
+class ProductSearchView(generics.GenericAPIView):
+    """
+    Ranked, typo-tolerant product search for type-ahead: ?q=<term>&limit=<n>,
+    optionally within a category subtree with &category=<id>.
+    """
+    permission_classes = [IsAuthenticated]
+    max_limit = 50
+
+    def get(self, request, *args, **kwargs):
+        sub = request.subscription
+        term = request.query_params.get('q', '').strip()
+        if not sub or not term:
+            return Response({'results': []})
+
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 20)), self.max_limit))
+        except ValueError:
+            limit = 20
+
+        results = Product.search(sub, term).filter(is_active=True)
+        category_id = request.query_params.get('category')
+        if category_id and category_id.isdigit():
+            results = results.filter(category_id__in=Category.subtree_ids(category_id))
+        results = results.values(*CATALOG_FIELDS)[:limit]
+        return Response({'results': list(results)})
+
+
+class ProductScanView(generics.GenericAPIView):
+    """
+    Resolve a scanned barcode/SKU to price and stock from the worker's
+    in-process SKU index; unknown SKUs fall back to the indexed sku column.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, sku, *args, **kwargs):
+        # The FK id avoids loading the subscription row on every scan
+        subscription_id = request.user.subscription_id
+        if not subscription_id:
+            sub = request.subscription
+            subscription_id = sub.id if sub else None
+        record = sku_index.lookup(subscription_id, sku) if subscription_id else None
+        if record is None:
+            return Response({'error': f"No product with SKU '{sku}'."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'sku': sku, **record._asdict()})
+
+
+class ProductBulkUpdateView(generics.GenericAPIView):
+    """
+    Reprice and restock many products at once. POST
+    {"changes": [{"sku", "price", "cost_price", "stock_delta", "is_active"}],
+     "rules": [{"field", "category", "percent" | "amount"}]}; rules run first,
+    then the per-SKU changes, all in one transaction. Any unknown SKU or
+    negative resulting stock rejects the whole batch.
+    """
+    permission_classes = [IsOwnerOrAdmin]
+    serializer_class = BulkProductUpdateSerializer
+
+    def post(self, request, *args, **kwargs):
+        sub = request.subscription
+        if not sub:
+            return Response({'error': 'No subscription.'}, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        updated, errors = Product.bulk_update_catalog(
+            sub, serializer.validated_data['changes'], serializer.validated_data['rules'], user=request.user
+        )
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        _, version = Product.catalog_state(sub)
+        return Response({'updated': updated, 'version': version})
+
+
+class LowStockPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class LowStockView(generics.ListAPIView):
+    """
+    Active products at or below their reorder level, by name, with the
+    latest nightly reorder suggestion when there is one. ?category=<id>
+    limits it to that category and its sub-categories.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = LowStockProductSerializer
+    pagination_class = LowStockPagination
+
+    def get_queryset(self):
+        sub = self.request.subscription
+        if not sub:
+            return Product.objects.none()
+        qs = Product.low_stock(sub).select_related('reorder_suggestion')
+        category_id = self.request.query_params.get('category')
+        if category_id and category_id.isdigit():
+            qs = qs.filter(category_id__in=Category.subtree_ids(category_id))
+        return qs
+
+
+class ReceiveStockView(generics.GenericAPIView):
+    """
+    Record a delivery: POST {"items": [{"sku", "quantity", "unit_cost"}], "note"}.
+    Each line adds a FIFO cost layer and increases stock.
+    """
+    permission_classes = [IsOwnerOrAdmin]
+    serializer_class = ReceiveStockSerializer
+
+    def post(self, request, *args, **kwargs):
+        sub = request.subscription
+        if not sub:
+            return Response({'error': 'No subscription.'}, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['items']
+        ids = dict(
+            Product.objects.filter(subscription=sub, sku__in=[item['sku'] for item in items])
+            .values_list('sku', 'id')
+        )
+        unknown = [item['sku'] for item in items if item['sku'] not in ids]
+        if unknown:
+            return Response({'errors': [{'sku': sku, 'error': 'Unknown SKU.'} for sku in unknown]},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        stock_levels = RestockHistory.receive(
+            {ids[item['sku']]: (item['quantity'], item['unit_cost']) for item in items},
+            user=request.user,
+            note=serializer.validated_data['note'],
+        )
+        return Response({
+            'stock': {sku: stock_levels[pk] for sku, pk in ids.items()},
+        }, status=status.HTTP_201_CREATED)
+
+
+class InventoryValuationView(generics.GenericAPIView):
+    """
+    Units and FIFO cost value of the stock on hand.
+    """
+    permission_classes = [IsOwnerOrAdmin]
+
+    def get(self, request, *args, **kwargs):
+        sub = request.subscription
+        if not sub:
+            return Response({'units': 0, 'value': 0})
+        units, value = RestockHistory.inventory_value(sub)
+        return Response({'units': units, 'value': value})
+
+
+class StocktakeListView(generics.ListCreateAPIView):
+    """
+    GET lists the subscription's stocktakes; POST {"note"} opens one.
+    """
+    permission_classes = [IsOwnerOrAdmin]
+    serializer_class = StocktakeSessionSerializer
+
+    def get_queryset(self):
+        sub = self.request.subscription
+        if not sub:
+            return StocktakeSession.objects.none()
+        return StocktakeSession.objects.filter(subscription=sub)
+
+    def create(self, request, *args, **kwargs):
+        sub = request.subscription
+        if not sub:
+            return Response({'error': 'No subscription.'}, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        session = StocktakeSession.open(sub, user=request.user, note=serializer.validated_data.get('note', ''))
+        return Response(self.get_serializer(session).data, status=status.HTTP_201_CREATED)
+
+
+class StocktakeMixin:
+    def get_session(self):
+        sub = self.request.subscription
+        if not sub:
+            raise Http404("No subscription.")
+        return get_object_or_404(StocktakeSession, pk=self.kwargs['pk'], subscription=sub)
+
+
+class StocktakeDetailView(StocktakeMixin, generics.GenericAPIView):
+    """
+    A stocktake with its progress: products counted, discrepancies and the
+    net variance in units and cost value.
+    """
+    permission_classes = [IsOwnerOrAdmin]
+    serializer_class = StocktakeSessionSerializer
+
+    def get(self, request, *args, **kwargs):
+        session = self.get_session()
+        return Response({**self.get_serializer(session).data, **session.summary()})
+
+
+class StocktakeScanView(StocktakeMixin, generics.GenericAPIView):
+    """
+    Upload a batch of counted scans from a device: POST {"batch_id",
+    "scans": [{"sku", "quantity"}]}. Counts add up across batches; resending
+    a batch_id is a no-op. Staff can count; only owners and admins apply.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = StocktakeScanSerializer
+
+    def post(self, request, *args, **kwargs):
+        session = self.get_session()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            result, unknown = session.record_scans(
+                serializer.validated_data['scans'], batch_id=serializer.validated_data['batch_id']
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response({'status': result, 'unknown_skus': unknown})
+
+
+class StocktakeVarianceView(StocktakeMixin, generics.ListAPIView):
+    """
+    Counted products that differ from their snapshot, largest shortfall
+    first. ?zero_uncounted=1 includes products nobody scanned as counted 0.
+    """
+    permission_classes = [IsOwnerOrAdmin]
+    serializer_class = StocktakeVarianceSerializer
+    pagination_class = LowStockPagination
+
+    def get_queryset(self):
+        zero_uncounted = self.request.query_params.get('zero_uncounted') in ('1', 'true')
+        return (
+            self.get_session().variances(zero_uncounted)
+            .select_related('product')
+            .order_by('variance', 'product__sku')
+        )
+
+
+class StocktakeApplyView(StocktakeMixin, generics.GenericAPIView):
+    """
+    Apply every variance to stock in one transaction: POST {"zero_uncounted"}.
+    """
+    permission_classes = [IsOwnerOrAdmin]
+    serializer_class = StocktakeApplySerializer
+
+    def post(self, request, *args, **kwargs):
+        session = self.get_session()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            adjusted = session.apply(user=request.user, zero_uncounted=serializer.validated_data['zero_uncounted'])
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response({'status': session.status, 'adjusted': adjusted})
+
+
+class StocktakeCancelView(StocktakeMixin, generics.GenericAPIView):
+    permission_classes = [IsOwnerOrAdmin]
+
+    def post(self, request, *args, **kwargs):
+        session = self.get_session()
+        try:
+            session.cancel()
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response({'status': session.status})
+
+
+class StockMovementListView(generics.ListAPIView):
+    """
+    The stock ledger, newest first. ?sku= narrows it to one product,
+    ?kind= to one kind of movement.
+    """
+    permission_classes = [IsOwnerOrAdmin]
+    serializer_class = StockMovementSerializer
+    pagination_class = LowStockPagination
+
+    def get_queryset(self):
+        sub = self.request.subscription
+        if not sub:
+            return StockMovement.objects.none()
+        qs = StockMovement.objects.filter(product__subscription=sub).select_related('product')
+        sku = self.request.query_params.get('sku')
+        if sku:
+            qs = qs.filter(product__sku=sku)
+        kind = self.request.query_params.get('kind')
+        if kind:
+            qs = qs.filter(kind=kind)
+        return qs.order_by('-created_at', '-id')
+
+
+class StockAtView(generics.GenericAPIView):
+    """
+    Stock of every product as of ?at=<ISO datetime>, from the ledger.
+    """
+    permission_classes = [IsOwnerOrAdmin]
+
+    def get(self, request, *args, **kwargs):
+        sub = request.subscription
+        if not sub:
+            return Response({'error': 'No subscription.'}, status=status.HTTP_403_FORBIDDEN)
+        at = parse_datetime(request.query_params.get('at', ''))
+        if at is None:
+            return Response({'error': 'Give ?at= as an ISO datetime.'}, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+
+        levels = StockMovement.stock_at(sub, at)
+        skus = dict(Product.objects.filter(id__in=levels).values_list('id', 'sku'))
+        return Response({'at': at, 'stock': {skus[pk]: stock for pk, stock in levels.items()}})
@@ -1,9 +1,36 @@
 from django.contrib import admin
-from .models import SalesReport
+from .models import DailyProductRollup, DailySalesRollup, DailyStockSnapshot, ExportJob, SalesReport
 
 @admin.register(SalesReport)
 class SalesReportAdmin(admin.ModelAdmin):
     list_display = ('report_date', 'start_date', 'end_date', 'total_sales', 'total_orders')
     list_filter = ('report_date',)
     search_fields = ('report_date',)
-    readonly_fields = ('created_at',)
\ No newline at end of file
+    readonly_fields = ('created_at',)
+
+@admin.register(DailySalesRollup)
+class DailySalesRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'subscription', 'revenue', 'order_count', 'units')
+    list_filter = ('date',)
+    readonly_fields = ('date', 'subscription')
+
+
+@admin.register(DailyProductRollup)
+class DailyProductRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'subscription', 'product', 'revenue', 'units')
+    list_filter = ('date',)
+    raw_id_fields = ('product',)
+
+
+@admin.register(DailyStockSnapshot)
+class DailyStockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('date', 'subscription', 'product', 'stock', 'value')
+    list_filter = ('date',)
+    raw_id_fields = ('product',)
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subscription', 'export_format', 'status', 'total_rows', 'created_at', 'finished_at')
+    list_filter = ('status', 'export_format')
+    readonly_fields = ('created_at', 'finished_at')
@@ -0,0 +1,268 @@
+# reports/exports.py
+# File writers shared by the sales report downloads and background ExportJobs.
+
+import csv
+
+from django.db import transaction
+from django.db.models import Count, QuerySet, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import Frame, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus.doctemplate import LayoutError
+
+try:
+    import openpyxl
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+except ImportError:
+    openpyxl = None
+
+from core.utils import currency, currency_number_format
+from sales.models import Order
+
+EXPORT_CHUNK_SIZE = 2000
+
+ORDER_COLUMNS = ['Order ID', 'Date', 'Total', 'Items Count', 'Customer']
+
+
+class Echo:
+    """
+    File-like object whose write() returns the value, so csv.writer can
+    produce lines for a StreamingHttpResponse.
+    """
+    def write(self, value):
+        return value
+
+
+def sales_report(subscription, start_date, end_date):
+    """
+    Return (summary, rows) for completed orders in the range. summary holds
+    the period and totals; rows is a lazy values queryset of
+    (order_id, date, total, items_count, customer) tuples, newest first.
+    """
+    summary = {
+        'period': f"{start_date} to {end_date}",
+        'total_sales': 0,
+        'total_orders': 0,
+        'total_items': 0,
+    }
+    if not subscription:
+        return summary, ()
+
+    orders_qs = Order.objects.filter(
+        status='completed',
+        created_at__date__range=(start_date, end_date),
+        subscription=subscription
+    )
+    totals = orders_qs.aggregate(
+        total=Sum('total'), total_items=Sum('item_count'), count=Count('id')
+    )
+    summary.update({
+        'total_sales': float(totals['total'] or 0),
+        'total_orders': totals['count'],
+        'total_items': totals['total_items'] or 0,
+    })
+    return summary, order_rows(orders_qs)
+
+
+def order_rows(orders_qs):
+    """
+    (order_id, date, total, items_count, customer) tuples, newest first,
+    with the date and customer name resolved in the same query.
+    """
+    return orders_qs.order_by('-created_at', '-id').annotate(
+        day=TruncDate('created_at'),
+        customer_name=Coalesce('customer__name', Value('Walk-in')),
+    ).values_list('id', 'day', 'total', 'item_count', 'customer_name')
+
+
+def iterate_rows(rows):
+    """
+    Iterate rows; a queryset is read through a server-side cursor. The pooled
+    connection only keeps that cursor alive inside a transaction, so one is
+    held for the whole iteration.
+    """
+    if isinstance(rows, QuerySet):
+        with transaction.atomic():
+            yield from rows.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    else:
+        yield from rows
+
+
+def csv_chunks(summary, rows):
+    """
+    Yield the CSV a block of rows at a time so memory stays flat.
+    """
+    writer = csv.writer(Echo())
+    yield ''.join([
+        writer.writerow(['Sales Report Summary']),
+        writer.writerow(['Period', summary['period']]),
+        writer.writerow(['Total Sales', currency(summary['total_sales'])]),  # Use currency formatting
+        writer.writerow(['Total Orders', summary['total_orders']]),
+        writer.writerow(['Total Items', summary['total_items']]),
+        writer.writerow([]),
+        writer.writerow(ORDER_COLUMNS),
+    ])
+    block = []
+    for order_id, day, total, items_count, customer in iterate_rows(rows):
+        block.append(writer.writerow([
+            order_id,
+            str(day),
+            currency(total),  # Use currency formatting
+            items_count,
+            customer
+        ]))
+        if len(block) >= EXPORT_CHUNK_SIZE:
+            yield ''.join(block)
+            block = []
+    if block:
+        yield ''.join(block)
+
+
+def write_csv(fileobj, summary, rows):
+    for chunk in csv_chunks(summary, rows):
+        fileobj.write(chunk.encode('utf-8'))
+
+
+def write_excel(fileobj, summary, rows):
+    """
+    Write an .xlsx in openpyxl write-only mode: rows go to openpyxl's temp
+    storage instead of staying in memory as cell objects.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sales Report")
+    money_format = currency_number_format()
+
+    def cell(value, number_format=None, bold=False):
+        c = WriteOnlyCell(ws, value=value)
+        if number_format:
+            c.number_format = number_format
+        if bold:
+            c.font = Font(bold=True)
+        return c
+
+    # Summary
+    ws.append([cell('Sales Report Summary', bold=True)])
+    ws.append(['Period', summary['period']])
+    ws.append(['Total Sales', cell(summary['total_sales'], money_format)])
+    ws.append(['Total Orders', summary['total_orders']])
+    ws.append(['Total Items', summary['total_items']])
+
+    # Header
+    ws.append([])
+    ws.append([cell(title, bold=True) for title in ORDER_COLUMNS])
+
+    for order_id, day, total, items_count, customer in iterate_rows(rows):
+        ws.append([
+            order_id,
+            cell(day, 'yyyy-mm-dd'),
+            cell(total, money_format),
+            items_count,
+            customer
+        ])
+
+    wb.save(fileobj)
+
+
+PDF_ROWS_PER_TABLE = 40
+PDF_MARGIN = 50
+
+
+class PdfPages:
+    """
+    Lays flowables onto a canvas one page at a time, so only the page being
+    filled is held as flowables; finished pages are kept by the canvas only
+    as their drawing operators until save(). A flowable that doesn't fit is
+    split across pages.
+    """
+    def __init__(self, fileobj, title):
+        self.canvas = Canvas(fileobj, pagesize=letter, pageCompression=1)
+        self.canvas.setTitle(title)
+        self.frame = self.new_frame()
+
+    @staticmethod
+    def new_frame():
+        width, height = letter
+        return Frame(PDF_MARGIN, PDF_MARGIN, width - 2 * PDF_MARGIN, height - 2 * PDF_MARGIN,
+                     leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0)
+
+    def add(self, flowable):
+        pending = [flowable]
+        while pending:
+            flowable = pending.pop(0)
+            if self.frame.add(flowable, self.canvas):
+                continue
+            parts = self.frame.split(flowable, self.canvas)
+            if parts:
+                self.frame.add(parts[0], self.canvas)
+                pending[:0] = parts[1:]
+            elif self.frame._atTop:
+                raise LayoutError(f"{flowable.identity()} is too large for a page")
+            else:
+                pending.insert(0, flowable)
+            self.canvas.showPage()
+            self.frame = self.new_frame()
+
+    def save(self):
+        self.canvas.save()
+
+
+def write_pdf(fileobj, summary, rows):
+    """
+    Write every order as a multi-page PDF. Rows are read from the stream
+    one page-sized table at a time and laid out straight onto the canvas,
+    so no story of flowables is built up front; the header row repeats on
+    each page.
+    """
+    styles = getSampleStyleSheet()
+    pages = PdfPages(fileobj, title=f"Sales Report: {summary['period']}")
+    avg_val = summary['total_sales'] / max(summary['total_orders'], 1)
+    pages.add(Paragraph(f"Sales Report: {summary['period']}", styles['Title']))
+    pages.add(Table([
+        ['Total Sales', currency(summary['total_sales'])],  # Use currency formatting
+        ['Total Orders', f"{summary['total_orders']:,}"],
+        ['Total Items Sold', f"{summary['total_items']:,}"],
+        ['Average Order Value', currency(avg_val)],
+    ], hAlign='LEFT', style=[('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold')]))
+    pages.add(Spacer(1, 20))
+
+    table_style = TableStyle([
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('LINEBELOW', (0, 0), (-1, 0), 0.5, colors.grey),
+        ('ALIGN', (2, 0), (3, -1), 'RIGHT'),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.whitesmoke]),
+    ])
+    col_widths = [70, 80, 90, 60, 212]
+
+    def add_table(block):
+        pages.add(Table([ORDER_COLUMNS] + block, colWidths=col_widths,
+                        repeatRows=1, style=table_style, hAlign='LEFT'))
+
+    block = []
+    tables = 0
+    for order_id, day, total, items_count, customer in iterate_rows(rows):
+        block.append([str(order_id), str(day), currency(total), str(items_count), customer])
+        if len(block) >= PDF_ROWS_PER_TABLE:
+            add_table(block)
+            tables += 1
+            block = []
+    if block or not tables:
+        add_table(block)
+
+    pages.save()
+
+
+# format -> (writer, file extension, content type)
+EXPORT_FORMATS = {
+    'csv': (write_csv, 'csv', 'text/csv'),
+    'excel': (write_excel, 'xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'pdf': (write_pdf, 'pdf', 'application/pdf'),
+}
+if not openpyxl:
+    EXPORT_FORMATS['excel'] = EXPORT_FORMATS['csv']
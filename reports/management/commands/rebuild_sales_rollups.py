@@ -0,0 +1,35 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts.models import ClientSubscription
+from reports.models import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the daily sales and product rollups from completed orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscription', type=int, help='Only rebuild this subscription id')
+        parser.add_argument('--start', type=date.fromisoformat, help='First day (YYYY-MM-DD)')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last day (YYYY-MM-DD), defaults to today')
+
+    def handle(self, *args, **options):
+        subscriptions = ClientSubscription.objects.all()
+        if options['subscription']:
+            subscriptions = subscriptions.filter(id=options['subscription'])
+            if not subscriptions.exists():
+                raise CommandError(f"Subscription {options['subscription']} does not exist")
+
+        start = options['start'] or date(2000, 1, 1)
+        end = options['end'] or timezone.localdate()
+        if start > end:
+            raise CommandError('--start must not be after --end')
+
+        for subscription in subscriptions.iterator():
+            days, product_rows = rebuild_sales_rollups(subscription, start, end)
+            self.stdout.write(
+                f'{subscription}: {days} daily rows, {product_rows} product rows'
+            )
+        self.stdout.write(self.style.SUCCESS('Sales rollups rebuilt'))
@@ -0,0 +1,28 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import ClientSubscription
+from reports.models import prune_stock_snapshots, take_stock_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Records end-of-day stock snapshots and thins out old ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscription', type=int, help='Only this subscription id')
+        parser.add_argument('--date', type=date.fromisoformat, help='Day to record (YYYY-MM-DD), defaults to yesterday')
+        parser.add_argument('--no-prune', action='store_true', help='Skip thinning old snapshots')
+
+    def handle(self, *args, **options):
+        subscription = None
+        if options['subscription']:
+            subscription = ClientSubscription.objects.filter(id=options['subscription']).first()
+            if not subscription:
+                raise CommandError(f"Subscription {options['subscription']} does not exist")
+
+        written = take_stock_snapshots(options['date'], subscription)
+        self.stdout.write(f'{written} snapshot rows written')
+        if not options['no_prune']:
+            self.stdout.write(f'{prune_stock_snapshots()} old snapshot rows pruned')
+        self.stdout.write(self.style.SUCCESS('Stock snapshots done'))
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_alter_clientsubscription_expires_at'),
+        ('products', '0002_product_subscription'),
+        ('reports', '0002_remove_salesreport_reports_sal_report__92f498_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyProductRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='products.product')),
+                ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_product_rollups', to='accounts.clientsubscription')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'date'], name='reports_dai_product_88bb9e_idx')],
+                'constraints': [models.UniqueConstraint(fields=('subscription', 'date', 'product'), name='reports_daily_product_sub_date_product_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cash_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('card_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('transfer_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('mobile_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales_rollups', to='accounts.clientsubscription')),
+            ],
+            options={
+                'ordering': ['date'],
+                'constraints': [models.UniqueConstraint(fields=('subscription', 'date'), name='reports_daily_sales_sub_date_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_alter_clientsubscription_expires_at'),
+        ('reports', '0004_export_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='exportjob',
+            index=models.Index(fields=['subscription', 'start_date', 'end_date'], name='reports_exp_subscri_a38bae_idx'),
+        ),
+    ]
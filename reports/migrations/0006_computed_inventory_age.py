@@ -0,0 +1,21 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:35
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0005_export_job_range_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='inventoryagingreport',
+            name='reports_inv_days_in_3db74e_idx',
+        ),
+        migrations.RemoveField(
+            model_name='inventoryagingreport',
+            name='days_in_stock',
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_alter_clientsubscription_expires_at'),
+        ('products', '0012_stock_movement_ledger'),
+        ('reports', '0006_computed_inventory_age'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('stock', models.PositiveIntegerField()),
+                ('value', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='products.product')),
+                ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='accounts.clientsubscription')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'date'], name='reports_dai_product_b3f0b8_idx')],
+                'constraints': [models.UniqueConstraint(fields=('subscription', 'date', 'product'), name='reports_stock_snapshot_sub_date_product_uniq')],
+            },
+        ),
+    ]
@@ -1,13 +1,26 @@
 # reports/models.py
 
-from django.db import models, transaction
+import logging
+import tempfile
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db import connection, models, transaction
 from django.utils import timezone
-from django.db.models import Sum, F
+from django.db.models import Count, Min, Sum, F, Q
+from django.db.models.functions import TruncDate
 from decimal import Decimal
 
-from sales.models import Order
-from products.models import Product
+from sales.models import Order, OrderItem
+from products.models import Category, CategoryClosure, Product, RestockHistory
 from accounts.models import ClientSubscription
+from core.utils import generated_file_storage
+from .exports import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, iterate_rows, sales_report
+
+logger = logging.getLogger(__name__)
 
 class SalesReport(models.Model):
     subscription = models.ForeignKey(
@@ -32,27 +45,33 @@ class SalesReport(models.Model):
             models.Index(fields=['subscription', 'start_date', 'end_date']),
         ]
 
+    @staticmethod
+    def rollup_totals(subscription, start_date, end_date):
+        """
+        Return (total_sales, total_orders, total_items, average_order_value)
+        for the range, summed from the daily rollups.
+        """
+        totals = DailySalesRollup.objects.filter(
+            subscription=subscription,
+            date__range=(start_date, end_date)
+        ).aggregate(sales=Sum('revenue'), orders=Sum('order_count'), items=Sum('units'))
+        total_sales = totals['sales'] or Decimal('0')
+        total_orders = totals['orders'] or 0
+        total_items = totals['items'] or 0
+        avg_order = (total_sales / total_orders) if total_orders > 0 else Decimal('0')
+        return total_sales, total_orders, total_items, avg_order
+
     @classmethod
     def generate_daily_report(cls, subscription):
         """
         Generate (and save) a daily report for 'today' for the given subscription.
         """
-        today = timezone.now().date()
-        # Filter orders by subscription and completed today
-        orders = Order.objects.filter(
-            created_at__date=today,
-            status='completed',
-            subscription=subscription
+        today = timezone.localdate()
+        total_sales, total_orders, total_items, avg_order = cls.rollup_totals(
+            subscription, today, today
         )
 
-        total_sales = orders.aggregate(total=Sum('total'))['total'] or Decimal('0')
-        total_orders = orders.count()
-        total_items = orders.aggregate(items=Sum('items__quantity'))['items'] or 0
-        avg_order = (total_sales / total_orders) if total_orders > 0 else Decimal('0')
-
         with transaction.atomic():
-            # Example: if you track days_in_stock on Product, you'd update only for this subscription’s products:
-            # Product.objects.filter(subscription=subscription).update(days_in_stock=F('days_in_stock') + 1)
             return cls.objects.create(
                 subscription=subscription,
                 start_date=today,
@@ -68,15 +87,9 @@ class SalesReport(models.Model):
         """
         Generate a report for arbitrary date range for this subscription.
         """
-        orders = Order.objects.filter(
-            created_at__date__range=(start_date, end_date),
-            status='completed',
-            subscription=subscription
+        total_sales, total_orders, total_items, avg_order = cls.rollup_totals(
+            subscription, start_date, end_date
         )
-        total_sales = orders.aggregate(total=Sum('total'))['total'] or Decimal('0')
-        total_orders = orders.count()
-        total_items = orders.aggregate(items=Sum('items__quantity'))['items'] or 0
-        avg_order = (total_sales / total_orders) if total_orders > 0 else Decimal('0')
 
         return cls.objects.create(
             subscription=subscription,
@@ -97,28 +110,659 @@ class InventoryAgingReport(models.Model):
     )
     date_received = models.DateField()
     quantity = models.IntegerField()
-    days_in_stock = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-date_received']
         indexes = [
-            models.Index(fields=['days_in_stock']),
             models.Index(fields=['product', 'date_received']),
         ]
 
+    @property
+    def days_in_stock(self):
+        # Derived from date_received so nothing has to be rewritten daily
+        return (timezone.localdate() - self.date_received).days
+
+
+# (label, first day, last day or None) of each inventory aging bucket
+AGING_BUCKETS = [
+    ('0-30', 0, 30),
+    ('31-60', 31, 60),
+    ('61-90', 61, 90),
+    ('90+', 91, None),
+]
+
+
+def inventory_aging(subscription, min_days=0):
+    """
+    Stock on hand per product with the date its oldest units were received,
+    read from the open FIFO cost layers: product_id, name, sku, stock,
+    date_received, quantity (units in layers) and value. Only products whose
+    oldest units are at least min_days old; oldest first.
+    """
+    layers = RestockHistory.objects.filter(product__subscription=subscription, remaining__gt=0)
+    rows = layers.values('product_id', 'product__name', 'product__sku', 'product__stock').annotate(
+        received_at=Min('restocked_at'),
+        quantity=Sum('remaining'),
+        value=Sum(F('remaining') * F('unit_cost')),
+    ).order_by('received_at', 'product_id')
+    if min_days:
+        # Received on or before today - min_days (local dates)
+        cutoff = timezone.localdate() - timedelta(days=min_days - 1)
+        rows = rows.filter(received_at__lt=timezone.make_aware(datetime.combine(cutoff, time.min)))
+    return rows
+
+
+def inventory_aging_buckets(subscription):
+    """
+    Units and cost value of the open FIFO layers in each AGING_BUCKETS
+    range, by age of the receipt. One grouped query over the open-layer
+    partial index.
+    """
+    today = timezone.localdate()
+    bucket_sql = ' '.join(
+        f"WHEN age <= {last} THEN {i}" for i, (_, _, last) in enumerate(AGING_BUCKETS) if last is not None
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT CASE {bucket_sql} ELSE {len(AGING_BUCKETS) - 1} END AS bucket,
+                   SUM(remaining), SUM(remaining * unit_cost)
+            FROM (
+                SELECT r.remaining, r.unit_cost,
+                       %s::date - (r.restocked_at AT TIME ZONE %s)::date AS age
+                FROM {RestockHistory._meta.db_table} r
+                JOIN {Product._meta.db_table} p ON p.id = r.product_id
+                WHERE p.subscription_id = %s AND r.remaining > 0
+            ) layers
+            GROUP BY bucket
+            """,
+            [today, timezone.get_current_timezone_name(), subscription.id],
+        )
+        totals = {bucket: (units, value) for bucket, units, value in cursor.fetchall()}
+    return [
+        {
+            'label': label,
+            'units': totals.get(i, (0, 0))[0],
+            'value': totals.get(i, (0, Decimal('0')))[1],
+        }
+        for i, (label, _, _) in enumerate(AGING_BUCKETS)
+    ]
+
+
+class DailySalesRollup(models.Model):
+    """
+    Completed-sales totals per subscription per local day, kept current by
+    checkout, cancel and delete, and reconciled nightly for recent days by
+    refresh_sales_rollups() or on demand by the rebuild_sales_rollups command.
+    """
+    subscription = models.ForeignKey(
+        ClientSubscription,
+        on_delete=models.CASCADE,
+        related_name='daily_sales_rollups'
+    )
+    date = models.DateField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cash_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    card_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    transfer_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    mobile_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['subscription', 'date'], name='reports_daily_sales_sub_date_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.subscription_id} {self.date}: {self.revenue}"
+
+
+class DailyProductRollup(models.Model):
+    """
+    Per-product line totals (before order discount and tax) per subscription per day.
+    """
+    subscription = models.ForeignKey(
+        ClientSubscription,
+        on_delete=models.CASCADE,
+        related_name='daily_product_rollups'
+    )
+    date = models.DateField()
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='daily_rollups'
+    )
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.PositiveIntegerField(default=0)
+    cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['subscription', 'date', 'product'], name='reports_daily_product_sub_date_product_uniq'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.date}: {self.units}"
+
+
+PAYMENT_ROLLUP_FIELDS = {
+    'cash': 'cash_revenue',
+    'card': 'card_revenue',
+    'transfer': 'transfer_revenue',
+    'mobile': 'mobile_revenue',
+}
+
+
+def _upsert_increments(model, key_fields, value_fields, rows):
+    """
+    INSERT rows, adding value_fields onto any existing row with the same key
+    (one INSERT ... ON CONFLICT DO UPDATE). rows maps key tuples to dicts of
+    value_fields.
+    """
+    if not rows:
+        return
+    columns = [model._meta.get_field(f).column for f in key_fields + value_fields]
+    key_columns = columns[:len(key_fields)]
+    value_columns = columns[len(key_fields):]
+    table = model._meta.db_table
+
+    placeholders = ', '.join(['(' + ', '.join(['%s'] * len(columns)) + ')'] * len(rows))
+    params = []
+    # Sorted keys give concurrent checkouts the same row-lock order
+    for key in sorted(rows):
+        params.extend(key)
+        params.extend(rows[key][f] for f in value_fields)
+    updates = ', '.join(f'{c} = {table}.{c} + EXCLUDED.{c}' for c in value_columns)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES {placeholders} "
+            f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {updates}",
+            params,
+        )
+
+
+def _apply_decrements(model, key_fields, value_fields, rows):
+    """
+    Subtract value_fields from the existing rows with the same key in one
+    UPDATE ... FROM (VALUES ...), never going below zero. Keys with no row
+    are skipped. rows maps key tuples to dicts of value_fields.
+    """
+    if not rows:
+        return
+    columns = [model._meta.get_field(f).column for f in key_fields + value_fields]
+    key_columns = columns[:len(key_fields)]
+    value_columns = columns[len(key_fields):]
+    table = model._meta.db_table
+
+    placeholders = ', '.join(['(' + ', '.join(['%s'] * len(columns)) + ')'] * len(rows))
+    params = []
+    for key in sorted(rows):
+        params.extend(key)
+        params.extend(rows[key][f] for f in value_fields)
+    updates = ', '.join(f'{c} = GREATEST({table}.{c} - v.{c}, 0)' for c in value_columns)
+    matches = ' AND '.join(f'{table}.{c} = v.{c}' for c in key_columns)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET {updates} "
+            f"FROM (VALUES {placeholders}) AS v({', '.join(columns)}) WHERE {matches}",
+            params,
+        )
+
+
+DAILY_ROLLUP_FIELDS = ['revenue', 'order_count', 'units', 'cost'] + list(PAYMENT_ROLLUP_FIELDS.values())
+PRODUCT_ROLLUP_FIELDS = ['revenue', 'units', 'cost']
+
+
+def _sales_totals(entries):
+    """
+    Sum (order, lines) entries into rollup rows keyed like the rollup
+    tables. Orders that aren't completed are skipped.
+    """
+    daily = defaultdict(lambda: dict.fromkeys(DAILY_ROLLUP_FIELDS, 0))
+    products = defaultdict(lambda: dict.fromkeys(PRODUCT_ROLLUP_FIELDS, 0))
+
+    for order, lines in entries:
+        if order.status != 'completed' or not order.subscription_id:
+            continue
+        day = timezone.localdate(order.created_at)
+        totals = daily[(order.subscription_id, day)]
+        totals['revenue'] += order.total
+        totals['order_count'] += 1
+        if order.payment_method in PAYMENT_ROLLUP_FIELDS:
+            totals[PAYMENT_ROLLUP_FIELDS[order.payment_method]] += order.total
+        for line in lines:
+            line_cost = line.cost
+            totals['units'] += line.quantity
+            totals['cost'] += line_cost
+            product_totals = products[(order.subscription_id, day, line.product_id)]
+            product_totals['revenue'] += line.price * line.quantity
+            product_totals['units'] += line.quantity
+            product_totals['cost'] += line_cost
+    return daily, products
+
+
+def record_completed_sales(entries):
+    """
+    Add completed orders to the daily rollups. entries is an iterable of
+    (order, lines) where lines are the order's OrderItems with their cost
+    of goods set. Costs two statements however many orders are passed.
+    """
+    daily, products = _sales_totals(entries)
+    _upsert_increments(DailySalesRollup, ['subscription', 'date'], DAILY_ROLLUP_FIELDS, daily)
+    _upsert_increments(DailyProductRollup, ['subscription', 'date', 'product'], PRODUCT_ROLLUP_FIELDS, products)
+
+
+def remove_completed_sales(entries):
+    """
+    Take orders back out of the daily rollups before they are canceled or
+    deleted. entries are (order, lines) as for record_completed_sales, with
+    each order still in its completed state.
+    """
+    daily, products = _sales_totals(entries)
+    _apply_decrements(DailySalesRollup, ['subscription', 'date'], DAILY_ROLLUP_FIELDS, daily)
+    _apply_decrements(DailyProductRollup, ['subscription', 'date', 'product'], PRODUCT_ROLLUP_FIELDS, products)
+
+
+def refresh_sales_rollups(days=None, today=None):
+    """
+    Rebuild the last `days` closed days (default SALES_ROLLUP_REFRESH_DAYS)
+    for every subscription from the raw orders, catching drift from admin
+    edits and backdated orders. Today is left to the live increments.
+    Returns the number of subscriptions rebuilt.
+    """
+    days = days or settings.SALES_ROLLUP_REFRESH_DAYS
+    end = (today or timezone.localdate()) - timedelta(days=1)
+    start = end - timedelta(days=days - 1)
+    count = 0
+    for subscription in ClientSubscription.objects.iterator():
+        rebuild_sales_rollups(subscription, start, end)
+        count += 1
+    logger.info(f"Rebuilt sales rollups {start}..{end} for {count} subscription(s).")
+    return count
+
+
+@transaction.atomic
+def rebuild_sales_rollups(subscription, start_date, end_date):
+    """
+    Recompute both rollup tables for one subscription and date range from the
+    raw orders, replacing whatever is stored. Returns (daily rows, product rows).
+    """
+    DailySalesRollup.objects.filter(
+        subscription=subscription, date__range=(start_date, end_date)
+    ).delete()
+    DailyProductRollup.objects.filter(
+        subscription=subscription, date__range=(start_date, end_date)
+    ).delete()
+
+    orders = Order.objects.filter(
+        subscription=subscription,
+        status='completed',
+        created_at__date__range=(start_date, end_date),
+    ).order_by()
+
+    product_rows = [
+        DailyProductRollup(subscription=subscription, date=row.pop('day'), **row)
+        for row in OrderItem.objects.filter(order__in=orders)
+        .annotate(day=TruncDate('order__created_at'))
+        .values('day', 'product_id')
+        .annotate(
+            revenue=Sum(F('price') * F('quantity')),
+            units=Sum('quantity'),
+            cost=Sum('cost'),
+        )
+        .order_by()
+    ]
+    line_totals = defaultdict(lambda: {'units': 0, 'cost': Decimal('0')})
+    for row in product_rows:
+        line_totals[row.date]['units'] += row.units
+        line_totals[row.date]['cost'] += row.cost
+
+    daily_rows = []
+    for row in orders.annotate(day=TruncDate('created_at')).values('day').annotate(
+        revenue=Sum('total'),
+        order_count=Count('id'),
+        **{
+            field: Sum('total', filter=Q(payment_method=method))
+            for method, field in PAYMENT_ROLLUP_FIELDS.items()
+        }
+    ):
+        day = row.pop('day')
+        daily_rows.append(DailySalesRollup(
+            subscription=subscription,
+            date=day,
+            **line_totals[day],
+            **{field: value or 0 for field, value in row.items()}
+        ))
+
+    DailySalesRollup.objects.bulk_create(daily_rows, batch_size=1000)
+    DailyProductRollup.objects.bulk_create(product_rows, batch_size=1000)
+    return len(daily_rows), len(product_rows)
+
+
+def category_sales(subscription, start_date, end_date, parent=None):
+    """
+    Line revenue and units per category over the range, each category
+    including everything sold in its sub-categories. Covers the children of
+    parent, or the top-level categories when parent is None. Returns dicts
+    of category_id, name, revenue and units, best selling first.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT c.id, c.name, SUM(r.revenue), SUM(r.units)
+            FROM {DailyProductRollup._meta.db_table} r
+            JOIN {Product._meta.db_table} p ON p.id = r.product_id
+            JOIN {CategoryClosure._meta.db_table} cc ON cc.descendant_id = p.category_id
+            JOIN {Category._meta.db_table} c ON c.id = cc.ancestor_id
+            WHERE r.subscription_id = %s AND r.date BETWEEN %s AND %s
+              AND c.parent_id IS NOT DISTINCT FROM %s
+            GROUP BY c.id, c.name
+            ORDER BY SUM(r.revenue) DESC, c.name
+            """,
+            [subscription.id, start_date, end_date, parent],
+        )
+        return [
+            {'category_id': pk, 'name': name, 'revenue': revenue, 'units': units}
+            for pk, name, revenue, units in cursor.fetchall()
+        ]
+
+
+class DailyStockSnapshot(models.Model):
+    """
+    Stock on hand per product at the end of a day, with its FIFO value.
+    Written nightly by take_stock_snapshots(); products with no stock get no
+    row. Older days are thinned to one snapshot per week by
+    prune_stock_snapshots().
+    """
+    subscription = models.ForeignKey(
+        ClientSubscription,
+        on_delete=models.CASCADE,
+        related_name='stock_snapshots'
+    )
+    date = models.DateField()
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='stock_snapshots'
+    )
+    stock = models.PositiveIntegerField()
+    value = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['subscription', 'date', 'product'], name='reports_stock_snapshot_sub_date_product_uniq'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.date}: {self.stock}"
+
+
+def take_stock_snapshots(day=None, subscription=None):
+    """
+    Snapshot stock and FIFO value as the stock of `day` (default yesterday:
+    the job runs just after midnight), for one subscription or all of them,
+    in one DELETE and one INSERT ... SELECT. Returns the rows written.
+    """
+    day = day or timezone.localdate() - timedelta(days=1)
+    sub_id = subscription.id if subscription else None
+    table = DailyStockSnapshot._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Re-running a day replaces it, including products sold out since
+        cursor.execute(
+            f"DELETE FROM {table} WHERE date = %s AND (%s::bigint IS NULL OR subscription_id = %s)",
+            [day, sub_id, sub_id],
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (subscription_id, date, product_id, stock, value)
+            SELECT p.subscription_id, %s, p.id, p.stock,
+                   COALESCE(l.value, 0) + GREATEST(p.stock - COALESCE(l.units, 0), 0) * p.cost_price
+            FROM {Product._meta.db_table} p
+            LEFT JOIN (
+                SELECT product_id, SUM(remaining) AS units, SUM(remaining * unit_cost) AS value
+                FROM {RestockHistory._meta.db_table}
+                WHERE remaining > 0
+                GROUP BY product_id
+            ) l ON l.product_id = p.id
+            WHERE p.stock > 0 AND p.subscription_id IS NOT NULL
+              AND (%s::bigint IS NULL OR p.subscription_id = %s)
+            """,
+            [day, sub_id, sub_id],
+        )
+        return cursor.rowcount
+
+
+def prune_stock_snapshots(today=None):
+    """
+    Keep daily snapshots for STOCK_SNAPSHOT_DAILY_DAYS, then only the last
+    snapshot of each week, and drop everything older than
+    STOCK_SNAPSHOT_RETENTION_DAYS. Returns the rows deleted.
+    """
+    today = today or timezone.localdate()
+    daily_cutoff = today - timedelta(days=settings.STOCK_SNAPSHOT_DAILY_DAYS)
+    retention_cutoff = today - timedelta(days=settings.STOCK_SNAPSHOT_RETENTION_DAYS)
+    table = DailyStockSnapshot._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE date < %s", [retention_cutoff])
+        deleted = cursor.rowcount
+        cursor.execute(
+            f"""
+            DELETE FROM {table} s
+            USING (
+                SELECT subscription_id, date_trunc('week', date) AS week, MAX(date) AS keep
+                FROM {table}
+                WHERE date < %s
+                GROUP BY subscription_id, date_trunc('week', date)
+            ) w
+            WHERE s.subscription_id = w.subscription_id
+              AND date_trunc('week', s.date) = w.week
+              AND s.date < w.keep
+            """,
+            [daily_cutoff],
+        )
+        return deleted + cursor.rowcount
+
+
+def stock_snapshot_date(subscription, day):
+    """
+    The snapshot that answers "what was on hand on `day`": the latest one
+    on or before it (after pruning, the end of that week). None if there
+    is none.
+    """
+    return (
+        DailyStockSnapshot.objects.filter(subscription=subscription, date__lte=day)
+        .order_by('-date').values_list('date', flat=True).first()
+    )
+
+
+def stock_valuation_on(subscription, day):
+    """
+    (snapshot_date, units, value) of the stock on hand on `day`, read from
+    a single snapshot in one query. snapshot_date is None without one.
+    """
+    table = DailyStockSnapshot._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT d.date, COALESCE(SUM(s.stock), 0), COALESCE(SUM(s.value), 0)
+            FROM (
+                SELECT MAX(date) AS date FROM {table}
+                WHERE subscription_id = %s AND date <= %s
+            ) d
+            LEFT JOIN {table} s ON s.subscription_id = %s AND s.date = d.date
+            GROUP BY d.date
+            """,
+            [subscription.id, day, subscription.id],
+        )
+        return cursor.fetchone()
+
+
+def export_storage():
+    return generated_file_storage()
+
+
+class ExportJob(models.Model):
+    """
+    A sales report export built by a Celery worker instead of the web
+    request. Progress is polled by the client until the file is ready.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('excel', 'Excel'),
+        ('pdf', 'PDF'),
+    ]
+
+    subscription = models.ForeignKey(
+        ClientSubscription,
+        on_delete=models.CASCADE,
+        related_name='export_jobs'
+    )
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='export_jobs'
+    )
+    export_format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    file = models.FileField(upload_to='sales/', storage=export_storage, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['subscription', 'created_at']),
+            models.Index(fields=['subscription', 'start_date', 'end_date']),
+        ]
+
+    def __str__(self):
+        return f"Export #{self.id} ({self.export_format}, {self.status})"
+
     @classmethod
-    def update_aging_for_subscription(cls, subscription):
+    def closed_period_export(cls, subscription, export_format, start_date, end_date):
         """
-        Increment days_in_stock only for aging records whose products belong to this subscription.
+        Return a finished export of the same report that was built after the
+        period closed and after the last change to any of its orders, so it
+        is served again instead of being rebuilt. Offline syncs backdate
+        orders into closed periods; their updated_at is the sync time, so
+        they invalidate older files. Deleted orders leave no updated_at, so
+        the file is also rebuilt when the completed order count no longer
+        matches the rows it was built from.
         """
-        # Fetch products in this subscription
-        qs = cls.objects.filter(product__subscription=subscription)
-        qs.update(days_in_stock=F('days_in_stock') + 1)
+        if end_date >= timezone.localdate():
+            return None
+        job = cls.objects.filter(
+            subscription=subscription,
+            export_format=export_format,
+            start_date=start_date,
+            end_date=end_date,
+            status='done',
+            finished_at__date__gt=end_date,
+        ).order_by('-finished_at').first()
+        if job is None:
+            return None
+        orders = Order.objects.filter(
+            subscription=subscription,
+            created_at__date__range=(start_date, end_date),
+        ).aggregate(
+            changed=Count('id', filter=Q(updated_at__gte=job.created_at)),
+            completed=Count('id', filter=Q(status='completed')),
+        )
+        if orders['changed'] or orders['completed'] != job.total_rows:
+            return None
+        return job
 
     @classmethod
-    def update_aging_all(cls):
+    def purge_expired(cls, now=None):
+        """
+        Delete jobs older than EXPORT_RETENTION_DAYS along with their files
+        in export storage, and return how many jobs were removed.
         """
-        Increment days_in_stock for all records (if you want global update).
+        cutoff = (now or timezone.now()) - timedelta(days=settings.EXPORT_RETENTION_DAYS)
+        expired = list(cls.objects.filter(created_at__lt=cutoff).only('id', 'file'))
+        for job in expired:
+            if job.file:
+                job.file.delete(save=False)
+        cls.objects.filter(id__in=[job.id for job in expired]).delete()
+        return len(expired)
+
+    @property
+    def progress_cache_key(self):
+        return f"reports:export-job:{self.id}:rows"
+
+    @property
+    def progress(self):
+        """
+        Percent complete. While running, rows written so far are read from
+        the cache, since the job's own row isn't updated mid-export.
         """
-        cls.objects.update(days_in_stock=F('days_in_stock') + 1)
+        if self.status == 'done':
+            return 100
+        if self.status != 'running' or not self.total_rows:
+            return 0
+        processed = cache.get(self.progress_cache_key, self.processed_rows)
+        return min(99, processed * 100 // self.total_rows)
+
+    def track_progress(self, rows):
+        for count, row in enumerate(rows, 1):
+            if count % EXPORT_CHUNK_SIZE == 0:
+                cache.set(self.progress_cache_key, count, timeout=60 * 60)
+            yield row
+
+    def run(self):
+        """
+        Build the export file into storage, recording the outcome on the job.
+        """
+        writer, extension, _ = EXPORT_FORMATS[self.export_format]
+        summary, rows = sales_report(self.subscription, self.start_date, self.end_date)
+        self.status = 'running'
+        self.total_rows = summary['total_orders']
+        self.save(update_fields=['status', 'total_rows'])
+
+        tracked = self.track_progress(iterate_rows(rows))
+        try:
+            with tempfile.TemporaryFile() as tmp:
+                writer(tmp, summary, tracked)
+                self.file.save(f"sales_report_{self.id}.{extension}", File(tmp), save=False)
+        except Exception as e:
+            logger.exception(f"Export job #{self.id} failed")
+            self.status = 'failed'
+            self.error = str(e)
+        else:
+            self.status = 'done'
+            self.processed_rows = self.total_rows
+        finally:
+            tracked.close()
+            cache.delete(self.progress_cache_key)
+
+        self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'processed_rows', 'file', 'error', 'finished_at'])
@@ -1,22 +1,35 @@
+from django.utils import timezone
 from rest_framework import serializers
-from .models import SalesReport, InventoryAgingReport
+from .models import DailyStockSnapshot, SalesReport, InventoryAgingReport
 from products.models import Product, Category
 
-class InventoryAgingSerializer(serializers.ModelSerializer):
-    product_name = serializers.CharField(source='product.name')
-    sku = serializers.CharField(source='product.sku')
-    current_stock = serializers.IntegerField(source='product.stock')
+class InventoryAgingSerializer(serializers.Serializer):
+    """
+    One row of reports.models.inventory_aging(); days_in_stock is worked out
+    at read time from the oldest receipt.
+    """
+    product_id = serializers.IntegerField()
+    product_name = serializers.CharField(source='product__name')
+    sku = serializers.CharField(source='product__sku')
+    current_stock = serializers.IntegerField(source='product__stock')
+    date_received = serializers.SerializerMethodField()
+    days_in_stock = serializers.SerializerMethodField()
+    quantity = serializers.IntegerField()
+    value = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+    def get_date_received(self, row):
+        return timezone.localdate(row['received_at'])
+
+    def get_days_in_stock(self, row):
+        return (timezone.localdate() - timezone.localdate(row['received_at'])).days
+
+class StockSnapshotSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    sku = serializers.CharField(source='product.sku', read_only=True)
 
     class Meta:
-        model = InventoryAgingReport
-        fields = [
-            'product_name', 
-            'sku',
-            'date_received',
-            'days_in_stock',
-            'quantity',
-            'current_stock'
-        ]
+        model = DailyStockSnapshot
+        fields = ['date', 'product_id', 'product_name', 'sku', 'stock', 'value']
 
 class SalesReportExportSerializer(serializers.ModelSerializer):
     class Meta:
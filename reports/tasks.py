@@ -0,0 +1,42 @@
+from celery import shared_task
+
+from .models import ExportJob, prune_stock_snapshots, refresh_sales_rollups, take_stock_snapshots
+
+
+@shared_task(ignore_result=True)
+def run_export_job(job_id):
+    """
+    Build the file for a pending ExportJob. Routed to the 'exports' queue.
+    """
+    job = ExportJob.objects.select_related('subscription').filter(
+        id=job_id, status='pending'
+    ).first()
+    if job:
+        job.run()
+
+
+@shared_task(ignore_result=True)
+def snapshot_stock():
+    """
+    Just after midnight: record yesterday's closing stock for every
+    subscription, then thin out old snapshots.
+    """
+    take_stock_snapshots()
+    prune_stock_snapshots()
+
+
+@shared_task(ignore_result=True)
+def refresh_rollups():
+    """
+    Nightly: rebuild the sales rollups for the last few closed days so admin
+    edits and backdated orders show up in reports.
+    """
+    refresh_sales_rollups()
+
+
+@shared_task(ignore_result=True)
+def purge_exports():
+    """
+    Nightly: delete expired export jobs and their files.
+    """
+    ExportJob.purge_expired()
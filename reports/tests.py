@@ -1,3 +1,401 @@
-from django.test import TestCase
+import re
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import BytesIO
+
+import openpyxl
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import ClientSubscription, User
+from core.celery import app as celery_app
+from products.models import Category, Product, RestockHistory
+from sales.models import Order, OrderItem
+from .models import (
+    DailyProductRollup, DailySalesRollup, DailyStockSnapshot, ExportJob, SalesReport,
+    category_sales, inventory_aging_buckets, prune_stock_snapshots, rebuild_sales_rollups,
+    record_completed_sales, refresh_sales_rollups, stock_valuation_on, take_stock_snapshots,
+)
+from .exports import write_pdf
+from .views import sales_chart_series
+
+
+class SalesChartSeriesTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user(
+            email='owner@example.com', password='pass',
+            first_name='Own', last_name='Er', role='owner',
+        )
+        self.sub = ClientSubscription.objects.create(owner=owner, business_name='Shop')
+
+    def add_order(self, when, total):
+        order = Order.objects.create(subscription=self.sub, status='completed', total=total)
+        Order.objects.filter(id=order.id).update(
+            created_at=timezone.make_aware(datetime.combine(when, datetime.min.time())) + timedelta(hours=10)
+        )
+
+    def orders(self):
+        return Order.objects.filter(subscription=self.sub, status='completed')
+
+    def test_daily_series_fills_gaps(self):
+        self.add_order(date(2026, 3, 2), Decimal('10.00'))
+        self.add_order(date(2026, 3, 2), Decimal('5.50'))
+        self.add_order(date(2026, 3, 4), Decimal('1.00'))
+
+        with self.assertNumQueries(1):
+            series = sales_chart_series(self.orders(), date(2026, 3, 1), date(2026, 3, 5), 'day')
+
+        self.assertEqual([point['sales'] for point in series], [0.0, 15.5, 0.0, 1.0, 0.0])
+        self.assertEqual(series[0]['date'], '03-01')
+
+    def test_year_range_costs_one_query_per_bucket_size(self):
+        self.add_order(date(2026, 1, 15), Decimal('3.00'))
+        self.add_order(date(2026, 12, 1), Decimal('4.00'))
+        start, end = date(2026, 1, 1), date(2026, 12, 31)
+
+        for bucket, points in (('hour', 8760), ('day', 365), ('week', 53), ('month', 12)):
+            with self.assertNumQueries(1):
+                series = sales_chart_series(self.orders(), start, end, bucket)
+            self.assertEqual(len(series), points)
+            self.assertEqual(sum(point['sales'] for point in series), 7.0)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user(
+            email='owner@example.com', password='pass',
+            first_name='Own', last_name='Er', role='owner',
+        )
+        self.sub = ClientSubscription.objects.create(owner=owner, business_name='Shop')
+        owner.subscription = self.sub
+        owner.save()
+        self.owner = owner
+        self.product = Product.objects.create(
+            subscription=self.sub, name='Tea', sku='TEA',
+            category=Category.objects.create(name='Drinks'),
+            price=Decimal('3.00'), cost_price=Decimal('1.00'), stock=50,
+        )
+
+    def sell(self, quantity, payment_method='cash'):
+        order = Order.objects.create(
+            subscription=self.sub, user=self.owner, status='completed', payment_method=payment_method,
+        )
+        line = OrderItem.objects.create(
+            order=order, product=self.product, quantity=quantity, price=self.product.price,
+            cost=self.product.cost_price * quantity,
+        )
+        order.calculate_total()
+        return order, [line]
+
+    def test_increments_match_rebuild(self):
+        entries = [self.sell(2), self.sell(3, payment_method='card')]
+        with self.assertNumQueries(2):
+            record_completed_sales(entries)
+
+        today = timezone.localdate()
+        incremental = DailySalesRollup.objects.get(subscription=self.sub, date=today)
+        self.assertEqual(incremental.order_count, 2)
+        self.assertEqual(incremental.units, 5)
+        self.assertEqual(incremental.cost, Decimal('5.00'))
+        self.assertEqual(incremental.card_revenue, entries[1][0].total)
+
+        rebuild_sales_rollups(self.sub, today, today)
+        rebuilt = DailySalesRollup.objects.get(subscription=self.sub, date=today)
+        for field in ('revenue', 'order_count', 'units', 'cost', 'cash_revenue', 'card_revenue'):
+            self.assertEqual(getattr(rebuilt, field), getattr(incremental, field), field)
+        product_row = DailyProductRollup.objects.get(subscription=self.sub, date=today)
+        self.assertEqual(product_row.units, 5)
+        self.assertEqual(product_row.revenue, Decimal('15.00'))
+
+    def test_cancel_and_delete_take_orders_out(self):
+        canceled, deleted, kept = self.sell(2), self.sell(3, payment_method='card'), self.sell(4)
+        record_completed_sales([canceled, deleted, kept])
+        client = APIClient()
+        client.force_authenticate(self.owner)
+
+        response = client.patch(f'/api/sales/orders/{canceled[0].id}/', {'status': 'canceled'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        # A second edit of the canceled order leaves the rollups alone
+        client.patch(f'/api/sales/orders/{canceled[0].id}/', {'payment_method': 'card'}, format='json')
+        response = client.delete(f'/api/sales/orders/{deleted[0].id}/')
+        self.assertEqual(response.status_code, 204, response.content)
+
+        row = DailySalesRollup.objects.get(subscription=self.sub, date=timezone.localdate())
+        self.assertEqual((row.order_count, row.units, row.revenue), (1, 4, kept[0].total))
+        self.assertEqual(row.card_revenue, 0)
+        self.assertEqual(DailyProductRollup.objects.get(subscription=self.sub).units, 4)
+
+    def test_nightly_refresh_rebuilds_recent_closed_days(self):
+        today = timezone.localdate()
+        order, lines = self.sell(2)
+        record_completed_sales([(order, lines)])
+        # Backdated by hand, so the increment landed on today instead
+        Order.objects.filter(id=order.id).update(created_at=timezone.now() - timedelta(days=2))
+
+        self.assertEqual(refresh_sales_rollups(days=3, today=today), 1)
+
+        self.assertEqual(DailySalesRollup.objects.get(date=today - timedelta(days=2)).units, 2)
+        # Today belongs to the live increments
+        self.assertEqual(DailySalesRollup.objects.get(date=today).units, 2)
+
+    def test_range_report_reads_rollups(self):
+        record_completed_sales([self.sell(4)])
+        today = timezone.localdate()
+        report = SalesReport.generate_range_report(self.sub, today - timedelta(days=7), today)
+        self.assertEqual(report.total_orders, 1)
+        self.assertEqual(report.total_items_sold, 4)
+
+
+class ReportOrdersMixin:
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email='owner@example.com', password='pass',
+            first_name='Own', last_name='Er', role='owner',
+        )
+        self.sub = ClientSubscription.objects.create(owner=self.owner, business_name='Shop')
+        self.owner.subscription = self.sub
+        self.owner.save()
+        self.client.force_login(self.owner)
+        for total in ('4.00', '6.50'):
+            Order.objects.create(subscription=self.sub, status='completed',
+                                 total=Decimal(total), item_count=2)
+
+
+class SalesReportExportTests(ReportOrdersMixin, TestCase):
+
+    def test_csv_is_streamed(self):
+        response = self.client.get('/reports/sales-report/?format=csv')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[-3], 'Order ID,Date,Total,Items Count,Customer')
+        self.assertEqual(len(lines), 9)
+        self.assertTrue(lines[-1].endswith(',2,Walk-in'))
+
+    def test_excel_cells_are_numeric(self):
+        response = self.client.get('/reports/sales-report/?format=excel')
+
+        self.assertEqual(response.status_code, 200)
+        book = openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content)))
+        rows = list(book.active.iter_rows(values_only=True))
+        self.assertEqual(rows[2][1], 10.5)
+        self.assertEqual(rows[6], ('Order ID', 'Date', 'Total', 'Items Count', 'Customer'))
+        self.assertEqual(sorted(row[2] for row in rows[7:]), [4, 6.5])
+        self.assertIn('#,##0.00', book.active.cell(row=8, column=3).number_format)
+
+
+@override_settings(EXPORT_ROOT=tempfile.mkdtemp())
+class ExportJobTests(ReportOrdersMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', False)
+
+    def test_job_is_queued_polled_and_downloaded(self):
+        today = timezone.localdate().isoformat()
+        response = self.client.post('/reports/exports/', {
+            'format': 'csv', 'start_date': today, 'end_date': today,
+        })
+        self.assertEqual(response.status_code, 202)
+
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['progress'], 100)
+
+        download = self.client.get(status['download_url'])
+        lines = b''.join(download.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 9)
+        self.assertEqual(ExportJob.objects.get().total_rows, 2)
+
+    def test_expired_jobs_and_files_are_purged(self):
+        today = timezone.localdate().isoformat()
+        self.client.post('/reports/exports/', {'format': 'csv', 'start_date': today, 'end_date': today})
+        job = ExportJob.objects.get()
+        storage, name = job.file.storage, job.file.name
+        self.assertTrue(storage.exists(name))
+
+        self.assertEqual(ExportJob.purge_expired(), 0)
+        self.assertEqual(ExportJob.purge_expired(timezone.now() + timedelta(days=8)), 1)
+        self.assertFalse(ExportJob.objects.exists())
+        self.assertFalse(storage.exists(name))
+
+    def test_unknown_format_is_rejected(self):
+        response = self.client.post('/reports/exports/', {'format': 'docx'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_pdf_lists_every_order_across_pages(self):
+        Order.objects.bulk_create([
+            Order(subscription=self.sub, status='completed', total=Decimal('1.00'), item_count=1)
+            for _ in range(200)
+        ])
+        response = self.client.get('/reports/sales-report/?format=pdf')
+        self.assertEqual(response.status_code, 202)
+
+        job = ExportJob.objects.get()
+        self.assertEqual((job.status, job.total_rows), ('done', 202))
+        pdf = job.file.read()
+        self.assertGreater(len(re.findall(rb'/Type /Page\b', pdf)), 4)
+
+    def test_large_pdf_is_laid_out_in_full(self):
+        summary = {'period': '2026-01-01 to 2026-01-31', 'total_sales': 12000.0,
+                   'total_orders': 12000, 'total_items': 12000}
+        rows = ((n, date(2026, 1, 1), Decimal('1.00'), 1, 'Walk-in') for n in range(12000, 0, -1))
+        pdf = BytesIO()
+        write_pdf(pdf, summary, rows)
+
+        # Every row is placed: no page holds more than a header and 40 rows
+        self.assertGreaterEqual(len(re.findall(rb'/Type /Page\b', pdf.getvalue())), 12000 // 40)
+
+    def test_closed_period_export_is_reused(self):
+        start, end = date(2026, 1, 1), date(2026, 1, 31)
+        payload = {'format': 'excel', 'start_date': start.isoformat(), 'end_date': end.isoformat()}
+        first = self.client.post('/reports/exports/', payload)
+        second = self.client.post('/reports/exports/', payload)
+
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['id'], first.json()['id'])
+        self.assertEqual(ExportJob.objects.count(), 1)
+
+        # An offline sync backdates a sale into the closed period
+        late = Order.objects.create(subscription=self.sub, status='completed', total=Decimal('2.00'))
+        Order.objects.filter(id=late.id).update(
+            created_at=timezone.make_aware(datetime(2026, 1, 15, 12))
+        )
+        third = self.client.post('/reports/exports/', payload)
+        self.assertEqual(third.status_code, 202)
+        self.assertEqual(ExportJob.objects.get(id=third.json()['id']).total_rows, 1)
+
+        # Deleting an order from the period leaves no updated_at behind
+        self.assertEqual(self.client.post('/reports/exports/', payload).status_code, 200)
+        late.delete()
+        fourth = self.client.post('/reports/exports/', payload)
+        self.assertEqual(fourth.status_code, 202)
+        self.assertEqual(ExportJob.objects.get(id=fourth.json()['id']).total_rows, 0)
+
+class CategorySalesTests(ReportOrdersMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.electronics = Category.objects.create(name='Electronics')
+        self.phones = Category.objects.create(name='Phones', parent=self.electronics)
+        self.cases = Category.objects.create(name='Cases', parent=self.phones)
+        self.food = Category.objects.create(name='Food')
+        today = timezone.localdate()
+        for category, revenue in ((self.phones, '300.00'), (self.cases, '20.00'), (self.food, '50.00')):
+            product = Product.objects.create(
+                subscription=self.sub, name=category.name, sku=category.name.upper(),
+                category=category, price=Decimal('1.00'),
+            )
+            DailyProductRollup.objects.create(
+                subscription=self.sub, date=today, product=product,
+                revenue=Decimal(revenue), units=2,
+            )
+
+    def test_top_level_rollup_includes_subcategories(self):
+        today = timezone.localdate()
+        with self.assertNumQueries(1):
+            rows = category_sales(self.sub, today, today)
+        self.assertEqual(
+            [(row['name'], row['revenue'], row['units']) for row in rows],
+            [('Electronics', Decimal('320.00'), 4), ('Food', Decimal('50.00'), 2)],
+        )
+
+    def test_api_breaks_a_category_down(self):
+        response = self.client.get('/reports/category-sales/', {'category': self.electronics.id})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['category']['revenue'], 320.0)
+        self.assertEqual([(c['name'], c['revenue']) for c in data['categories']], [('Phones', 320.0)])
+
+    def test_api_rejects_a_malformed_category(self):
+        self.assertEqual(self.client.get('/reports/category-sales/', {'category': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/reports/category-sales/', {'category': '999999'}).status_code, 404)
+
+
+class InventoryAgingTests(ReportOrdersMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='General')
+        self.fresh, self.stale = [
+            Product.objects.create(subscription=self.sub, name=name, sku=name.upper(),
+                                   category=category, price=Decimal('5.00'))
+            for name in ('Fresh', 'Stale')
+        ]
+        RestockHistory.receive({self.fresh.id: (4, Decimal('1.00')), self.stale.id: (10, Decimal('2.00'))})
+        now = timezone.now()
+        RestockHistory.objects.filter(product=self.stale).update(restocked_at=now - timedelta(days=75))
+        RestockHistory.objects.create(product=self.stale, quantity=3, remaining=3,
+                                      unit_cost=Decimal('2.50'))
+
+    def test_buckets_are_computed_at_read_time(self):
+        with self.assertNumQueries(1):
+            buckets = inventory_aging_buckets(self.sub)
+        self.assertEqual(
+            [(b['label'], b['units'], b['value']) for b in buckets],
+            [('0-30', 7, Decimal('11.50')), ('31-60', 0, 0),
+             ('61-90', 10, Decimal('20.00')), ('90+', 0, 0)],
+        )
+
+    def test_api_is_paginated_and_filtered_by_age(self):
+        response = self.client.get('/reports/inventory-aging/data/', {'page_size': 1})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(len(data['buckets']), 4)
+        oldest = data['results'][0]
+        self.assertEqual((oldest['sku'], oldest['days_in_stock'], oldest['quantity']), ('STALE', 75, 13))
+        self.assertNotIn('buckets', self.client.get(data['next']).json())
+
+        aged = self.client.get('/reports/inventory-aging/data/', {'min_days': 60}).json()
+        self.assertEqual([r['sku'] for r in aged['results']], ['STALE'])
+        self.assertEqual(self.client.get('/reports/inventory-aging/').status_code, 200)
+
+
+@override_settings(STOCK_SNAPSHOT_DAILY_DAYS=90, STOCK_SNAPSHOT_RETENTION_DAYS=365)
+class StockSnapshotTests(ReportOrdersMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='General')
+        self.tea, self.mug, self.empty = [
+            Product.objects.create(subscription=self.sub, name=name, sku=name.upper(),
+                                   category=category, price=Decimal('5.00'), cost_price=Decimal('3.00'))
+            for name in ('Tea', 'Mug', 'Empty')
+        ]
+        RestockHistory.receive({self.tea.id: (10, Decimal('1.00')), self.mug.id: (2, Decimal('4.00'))})
+
+    def test_past_valuation_reads_one_snapshot(self):
+        day = date(2026, 5, 1)
+        self.assertEqual(take_stock_snapshots(day, self.sub), 2)
+        Product.objects.filter(id=self.tea.id).update(stock=12)  # 2 units without a cost layer
+        take_stock_snapshots(day + timedelta(days=1), self.sub)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(stock_valuation_on(self.sub, day), (day, 12, Decimal('18.00')))
+        self.assertEqual(stock_valuation_on(self.sub, day + timedelta(days=9))[1:], (14, Decimal('20.00')))
+        self.assertEqual(stock_valuation_on(self.sub, day - timedelta(days=1)), (None, 0, 0))
+
+        data = self.client.get('/reports/stock-snapshot/', {'date': '2026-05-05', 'sku': 'TEA'}).json()
+        self.assertEqual(data['snapshot_date'], '2026-05-02')
+        self.assertEqual([(r['sku'], r['stock']) for r in data['results']], [('TEA', 12)])
+
+    def test_old_days_thin_to_weekly_then_expire(self):
+        today = date(2026, 9, 1)
+        # Mon 2026-04-27 .. Sun 2026-05-10: two full weeks, long past the daily window
+        start = date(2026, 4, 27)
+        for offset in range(14):
+            take_stock_snapshots(start + timedelta(days=offset), self.sub)
+        take_stock_snapshots(date(2025, 6, 1), self.sub)
+        take_stock_snapshots(today - timedelta(days=1), self.sub)
+
+        prune_stock_snapshots(today)
+
+        self.assertEqual(
+            sorted(set(DailyStockSnapshot.objects.values_list('date', flat=True))),
+            [date(2026, 5, 3), date(2026, 5, 10), today - timedelta(days=1)],
+        )
 
-# Create your tests here.
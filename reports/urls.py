@@ -1,11 +1,22 @@
 # urls.py
 from django.urls import path
-from .views import ReportsDashboardView, SalesReportView
+from .views import (
+    CategorySalesView, ExportJobCreateView, ExportJobDownloadView, ExportJobStatusView,
+    InventoryAgingAPIView, InventoryAgingView, ReportsDashboardView, SalesReportView,
+    StockSnapshotAPIView,
+)
 
 app_name = 'reports'
 
 urlpatterns = [
     path('', ReportsDashboardView.as_view(), name='dashboard'),
     path('sales-report/', SalesReportView.as_view(), name='sales-report'),
+    path('category-sales/', CategorySalesView.as_view(), name='category-sales'),
+    path('inventory-aging/', InventoryAgingView.as_view(), name='inventory-aging'),
+    path('inventory-aging/data/', InventoryAgingAPIView.as_view(), name='inventory-aging-data'),
+    path('stock-snapshot/', StockSnapshotAPIView.as_view(), name='stock-snapshot'),
+    path('exports/', ExportJobCreateView.as_view(), name='export-create'),
+    path('exports/<int:pk>/', ExportJobStatusView.as_view(), name='export-status'),
+    path('exports/<int:pk>/download/', ExportJobDownloadView.as_view(), name='export-download'),
     
 ]
\ No newline at end of file
@@ -1,44 +1,119 @@
 import logging
-from django.views.generic import TemplateView
-from django.http import HttpResponse, JsonResponse
-from django.db.models import Sum, F
+from django.views.generic import TemplateView, View
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.db.models import Count, DateField, Sum, F
+from django.db.models.functions import TruncDate, TruncHour, TruncMonth, TruncWeek
 from django.utils import timezone
 from datetime import timedelta, datetime
 from django.core.exceptions import FieldError
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib import messages
-from django.shortcuts import redirect
-from io import BytesIO
-from core.utils import currency
+from django.shortcuts import get_object_or_404, redirect
+from django.urls import reverse
+from django.db import models
+from rest_framework import generics
+from rest_framework.pagination import PageNumberPagination
 
+from accounts.permissions import IsOwnerOrAdmin
 # For exports
-import csv
 import json
-try:
-    import openpyxl
-    from openpyxl import Workbook
-except ImportError:
-    openpyxl = None
-
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
+import tempfile
 
 from sales.models import Order, OrderItem
-from products.models import Product, Category
+from products.models import Product, Category, RestockHistory
 from customers.models import Customer
+from .exports import EXPORT_FORMATS, csv_chunks, iterate_rows, sales_report, write_csv
+from .models import (
+    DailyProductRollup, DailySalesRollup, DailyStockSnapshot, ExportJob, category_sales,
+    inventory_aging, inventory_aging_buckets, stock_snapshot_date, stock_valuation_on,
+)
+from .serializers import InventoryAgingSerializer, StockSnapshotSerializer
+from .tasks import run_export_job
 
 logger = logging.getLogger(__name__)
 
 
-def get_user_subscription(user):
+# Chart bucket -> (truncation, default label format)
+CHART_BUCKETS = {
+    'hour': (TruncHour, '%m-%d %H:00'),
+    'day': (TruncDate, '%m-%d'),
+    'week': (TruncWeek, '%m-%d'),
+    'month': (TruncMonth, '%b %Y'),
+}
+
+
+def default_chart_bucket(start_date, end_date):
     """
-    Return the ClientSubscription for this user (member or owner),
-    or None if none.
+    Pick a chart bucket that keeps the number of points readable for the range.
     """
-    sub = getattr(user, 'subscription', None)
-    if sub:
-        return sub
-    return getattr(user, 'owned_subscription', None)
+    days = (end_date - start_date).days + 1
+    if days <= 31:
+        return 'day'
+    if days <= 180:
+        return 'week'
+    return 'month'
+
+
+def chart_bucket_keys(start_date, end_date, bucket):
+    """
+    Every bucket key between start_date and end_date (inclusive), in the same
+    form the grouped query returns them.
+    """
+    if bucket == 'hour':
+        current = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
+        stop = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+        while current < stop:
+            yield current
+            current += timedelta(hours=1)
+    elif bucket == 'day':
+        current = start_date
+        while current <= end_date:
+            yield current
+            current += timedelta(days=1)
+    elif bucket == 'week':
+        current = start_date - timedelta(days=start_date.weekday())
+        while current <= end_date:
+            yield current
+            current += timedelta(days=7)
+    else:
+        current = start_date.replace(day=1)
+        while current <= end_date:
+            yield current
+            current = (current + timedelta(days=32)).replace(day=1)
+
+
+def sales_chart_series(queryset, start_date, end_date, bucket, label_format=None,
+                       date_field='created_at', value_field='total'):
+    """
+    Sum value_field per hour/day/week/month bucket with a single GROUP BY
+    query and return [{'date': label, 'sales': float}] with empty buckets as 0.
+    Works over raw orders (datetime field) or daily rollups (date field).
+    """
+    trunc, default_format = CHART_BUCKETS[bucket]
+    label_format = label_format or default_format
+    if isinstance(queryset.model._meta.get_field(date_field), models.DateTimeField):
+        if bucket in ('hour', 'day'):
+            truncated = trunc(date_field)
+        else:
+            truncated = trunc(date_field, output_field=DateField())
+    elif bucket == 'hour':
+        raise ValueError("Hourly buckets need a datetime field.")
+    elif bucket == 'day':
+        truncated = F(date_field)
+    else:
+        truncated = trunc(date_field)
+
+    totals = {
+        row['bucket']: row['sales']
+        for row in queryset.order_by()
+        .annotate(bucket=truncated)
+        .values('bucket')
+        .annotate(sales=Sum(value_field))
+    }
+    return [
+        {'date': key.strftime(label_format), 'sales': float(totals.get(key) or 0)}
+        for key in chart_bucket_keys(start_date, end_date, bucket)
+    ]
 
 
 class ReportsAccessMixin(UserPassesTestMixin):
@@ -62,7 +137,7 @@ class ReportsDashboardView(LoginRequiredMixin, ReportsAccessMixin, TemplateView)
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user = self.request.user
-        sub = get_user_subscription(user)
+        sub = self.request.subscription
 
         # Add currency settings to context
         from django.conf import settings
@@ -72,21 +147,28 @@ class ReportsDashboardView(LoginRequiredMixin, ReportsAccessMixin, TemplateView)
         # Parse date range / period
         start_date_str = self.request.GET.get('start_date')
         end_date_str = self.request.GET.get('end_date')
-        period = self.request.GET.get('period', 'today')
+        period = self.request.GET.get('period')
         today = timezone.now().date()
-        if start_date_str and end_date_str:
+        # Period buttons share the form with the date inputs, so a named
+        # period wins over the (always prefilled) dates.
+        if start_date_str and end_date_str and not period:
+            period = 'custom'
             try:
                 start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
                 end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
             except ValueError:
                 start_date = end_date = today
         else:
+            period = period or 'today'
             if period == 'week':
                 start_date = today - timedelta(days=7)
                 end_date = today
             elif period == 'month':
                 start_date = today - timedelta(days=30)
                 end_date = today
+            elif period == 'year':
+                start_date = today - timedelta(days=365)
+                end_date = today
             else:  # today or default
                 start_date = end_date = today
 
@@ -108,25 +190,25 @@ class ReportsDashboardView(LoginRequiredMixin, ReportsAccessMixin, TemplateView)
                 'product_revenues': [],
                 'category_names': [],
                 'category_sales': [],
+                'gross_margin': 0,
+                'gross_margin_pct': 0,
             })
             return context
 
-        # Base queryset: completed orders in date range and subscription
-        completed_orders = Order.objects.filter(
-            status='completed',
-            created_at__date__range=[start_date, end_date],
-            subscription=sub
+        # Metrics, chart and top lists read the daily rollups: one row per day
+        # (or per product per day) instead of every order in the range.
+        daily = DailySalesRollup.objects.filter(
+            subscription=sub,
+            date__range=[start_date, end_date]
         )
-
-        # Sales metrics
-        total_sales = completed_orders.aggregate(total=Sum('total'))['total'] or 0
-        total_orders = completed_orders.count()
-
-        # Total items sold: sum quantity from OrderItem, scoped by orders in this sub
-        order_ids = completed_orders.values_list('id', flat=True)
-        total_items_sold = OrderItem.objects.filter(
-            order_id__in=order_ids
-        ).aggregate(total=Sum('quantity'))['total'] or 0
+        totals = daily.aggregate(
+            total_sales=Sum('revenue'),
+            total_orders=Sum('order_count'),
+            total_items_sold=Sum('units'),
+        )
+        total_sales = totals['total_sales'] or 0
+        total_orders = totals['total_orders'] or 0
+        total_items_sold = totals['total_items_sold'] or 0
 
         avg_order_value = (total_sales / total_orders) if total_orders > 0 else 0
 
@@ -137,268 +219,324 @@ class ReportsDashboardView(LoginRequiredMixin, ReportsAccessMixin, TemplateView)
             'total_items_sold': total_items_sold,
         })
 
-        # Chart data
-        chart_data = []
-        if period in ('month', 'week', 'today'):
-            if period == 'month':
-                days = (end_date - start_date).days + 1
-                for i in range(days):
-                    day = start_date + timedelta(days=i)
-                    day_qs = Order.objects.filter(
-                        status='completed',
-                        created_at__date=day,
-                        subscription=sub
-                    )
-                    day_total = day_qs.aggregate(total=Sum('total'))['total'] or 0
-                    chart_data.append({
-                        'date': day.strftime('%m-%d'),
-                        'sales': float(day_total)
-                    })
-            else:
-                # week or today: for uniformity, treat today as 1-day week
-                num_days = 7 if period == 'week' else 1
-                for i in range(num_days):
-                    day = start_date + timedelta(days=i)
-                    day_qs = Order.objects.filter(
-                        status='completed',
-                        created_at__date=day,
-                        subscription=sub
-                    )
-                    day_total = day_qs.aggregate(total=Sum('total'))['total'] or 0
-                    label = day.strftime('%a') if period == 'week' else day.strftime('%m-%d')
-                    chart_data.append({
-                        'date': label,
-                        'sales': float(day_total)
-                    })
-        context['chart_data'] = chart_data
-
-        # Top products by revenue in this period & subscription
-        # Ensure Product has subscription FK
-        top_products_qs = Product.objects.filter(
+        # Chart data: one grouped query, gaps filled in Python
+        bucket = self.request.GET.get('bucket')
+        if bucket not in CHART_BUCKETS:
+            bucket = default_chart_bucket(start_date, end_date)
+        label_format = '%a' if (bucket == 'day' and period == 'week') else None
+        context['bucket'] = bucket
+        if bucket == 'hour':
+            # Rollups are daily; hourly charts still group the raw orders
+            completed_orders = Order.objects.filter(
+                status='completed',
+                created_at__date__range=[start_date, end_date],
+                subscription=sub
+            )
+            context['chart_data'] = sales_chart_series(
+                completed_orders, start_date, end_date, bucket, label_format
+            )
+        else:
+            context['chart_data'] = sales_chart_series(
+                daily, start_date, end_date, bucket, label_format,
+                date_field='date', value_field='revenue'
+            )
+
+        # Top products and categories by line revenue in this period
+        product_rollups = DailyProductRollup.objects.filter(
             subscription=sub,
-            orderitem__order__status='completed',
-            orderitem__order__created_at__date__range=[start_date, end_date],
-            orderitem__order__subscription=sub
-        ).annotate(
-            revenue=Sum(F('orderitem__quantity') * F('orderitem__price'))
+            date__range=[start_date, end_date]
+        )
+        top_products = product_rollups.values('product_id', 'product__name').annotate(
+            revenue=Sum('revenue')
         ).order_by('-revenue')[:5]
 
-        context['product_names'] = [p.name for p in top_products_qs]
-        context['product_revenues'] = [float(p.revenue or 0) for p in top_products_qs]
+        # Line revenue against FIFO cost of goods
+        margin = product_rollups.aggregate(revenue=Sum('revenue'), cost=Sum('cost'))
+        line_revenue = margin['revenue'] or 0
+        context['gross_margin'] = line_revenue - (margin['cost'] or 0)
+        context['gross_margin_pct'] = (
+            context['gross_margin'] / line_revenue * 100 if line_revenue else 0
+        )
+
+        context['product_names'] = [p['product__name'] for p in top_products]
+        context['product_revenues'] = [float(p['revenue'] or 0) for p in top_products]
 
-        # Top categories similarly
-        top_categories_qs = Category.objects.filter(
-            products__subscription=sub,
-            products__orderitem__order__status='completed',
-            products__orderitem__order__created_at__date__range=[start_date, end_date],
-            products__orderitem__order__subscription=sub
-        ).annotate(
-            total_sales=Sum(F('products__orderitem__quantity') * F('products__orderitem__price'))
-        ).order_by('-total_sales')[:5]
+        # Top-level categories, each including its sub-categories' sales
+        top_categories = category_sales(sub, start_date, end_date)[:5]
 
-        context['category_names'] = [c.name for c in top_categories_qs]
-        context['category_sales'] = [float(c.total_sales or 0) for c in top_categories_qs]
+        context['category_names'] = [c['name'] for c in top_categories]
+        context['category_sales'] = [float(c['revenue'] or 0) for c in top_categories]
 
         return context
 
 
+def parse_report_range(params):
+    """
+    Read start_date/end_date from a QueryDict in any of the accepted formats,
+    falling back to the last 30 days.
+    """
+    start_date_str = params.get('start_date')
+    end_date_str = params.get('end_date')
+    if start_date_str and end_date_str:
+        for fmt in ('%Y-%m-%d', '%B %d, %Y', '%m/%d/%Y'):
+            try:
+                return (
+                    datetime.strptime(start_date_str, fmt).date(),
+                    datetime.strptime(end_date_str, fmt).date(),
+                )
+            except Exception:
+                continue
+    end_date = timezone.now().date()
+    return end_date - timedelta(days=30), end_date
+
+
 class SalesReportView(LoginRequiredMixin, ReportsAccessMixin, TemplateView):
     # Renders or exports a detailed sales report scoped by subscription
     template_name = 'reports/dashboard.html'  # fallback if needed
 
     def get(self, request, *args, **kwargs):
-        user = request.user
-        sub = get_user_subscription(user)
-
-        # Parse start/end date
-        start_date_str = request.GET.get('start_date')
-        end_date_str = request.GET.get('end_date')
+        sub = request.subscription
+        start_date, end_date = parse_report_range(request.GET)
         export_format = request.GET.get('format', 'json')
 
-        # Determine date range
-        if start_date_str and end_date_str:
-            start_date = end_date = None
-            for fmt in ('%Y-%m-%d', '%B %d, %Y', '%m/%d/%Y'):
-                try:
-                    start_date = datetime.strptime(start_date_str, fmt).date()
-                    end_date = datetime.strptime(end_date_str, fmt).date()
-                    break
-                except Exception:
-                    continue
-            if not (start_date and end_date):
-                end_date = timezone.now().date()
-                start_date = end_date - timedelta(days=30)
-        else:
-            end_date = timezone.now().date()
-            start_date = end_date - timedelta(days=30)
+        # A full PDF is built by the export worker, never in the request
+        if export_format == 'pdf' and sub:
+            return queue_export(request, sub, export_format, start_date, end_date)
 
-        if not sub:
-            # No subscription: return empty or error
-            empty_data = {
-                'period': f"{start_date} to {end_date}",
-                'total_sales': 0,
-                'total_orders': 0,
-                'total_items': 0,
-                'orders': []
+        summary, rows = sales_report(sub, start_date, end_date)
+        if export_format in EXPORT_FORMATS:
+            return self.export(export_format, summary, rows)
+
+        summary['orders'] = [
+            {
+                'order_id': order_id,
+                'date': day.isoformat(),
+                'total': float(total),
+                'items_count': items_count,
+                'customer': customer,
             }
-            if export_format == 'csv':
-                return self.export_csv(empty_data)
-            elif export_format == 'pdf':
-                return self.export_pdf(empty_data)
-            elif export_format == 'excel':
-                return self.export_excel(empty_data)
-            else:
-                return JsonResponse(empty_data)
-
-        # Filter orders by subscription & date & completed
-        orders_qs = Order.objects.filter(
-            status='completed',
-            created_at__date__range=(start_date, end_date),
-            subscription=sub
-        ).prefetch_related('items__product')
-
-        total_sales = orders_qs.aggregate(total=Sum('total'))['total'] or 0
-        total_orders = orders_qs.count()
-        total_items = orders_qs.aggregate(total_items=Sum('items__quantity'))['total_items'] or 0
-
-        report_data = {
-            'period': f"{start_date} to {end_date}",
-            'total_sales': float(total_sales),
-            'total_orders': total_orders,
-            'total_items': total_items,
-            'orders': []
+            for order_id, day, total, items_count, customer in iterate_rows(rows)
+        ]
+        return JsonResponse(summary)
+
+    def export(self, export_format, summary, rows):
+        writer, extension, content_type = EXPORT_FORMATS[export_format]
+        filename = f'sales_report.{extension}'
+        if writer is write_csv:
+            # CSV streams straight from a server-side cursor
+            response = StreamingHttpResponse(csv_chunks(summary, rows), content_type=content_type)
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+            return response
+
+        # Other formats are built in a temp file and served from disk
+        tmp = tempfile.TemporaryFile()
+        writer(tmp, summary, rows)
+        tmp.seek(0)
+        return FileResponse(tmp, as_attachment=True, filename=filename, content_type=content_type)
+
+
+def export_job_payload(job):
+    payload = {
+        'id': job.id,
+        'format': job.export_format,
+        'status': job.status,
+        'progress': job.progress,
+        'total_rows': job.total_rows,
+        'status_url': reverse('reports:export-status', args=[job.id]),
+        'download_url': None,
+        'error': job.error,
+    }
+    if job.status == 'done':
+        payload['download_url'] = reverse('reports:export-download', args=[job.id])
+    return payload
+
+
+def queue_export(request, sub, export_format, start_date, end_date):
+    """
+    Return a JsonResponse for an export job: a cached file for a closed
+    period if one exists, otherwise a newly queued job.
+    """
+    job = ExportJob.closed_period_export(sub, export_format, start_date, end_date)
+    if job:
+        return JsonResponse(export_job_payload(job))
+
+    job = ExportJob.objects.create(
+        subscription=sub,
+        requested_by=request.user,
+        export_format=export_format,
+        start_date=start_date,
+        end_date=end_date,
+    )
+    try:
+        run_export_job.delay(job.id)
+    except Exception as e:
+        logger.exception(f"Could not queue export job #{job.id}")
+        job.status = 'failed'
+        job.error = 'Export queue unavailable.'
+        job.save(update_fields=['status', 'error'])
+        return JsonResponse(export_job_payload(job), status=503)
+    return JsonResponse(export_job_payload(job), status=202)
+
+
+class ExportJobCreateView(LoginRequiredMixin, ReportsAccessMixin, View):
+    # Queues a sales report export for a Celery worker and returns at once
+    def post(self, request, *args, **kwargs):
+        sub = request.subscription
+        if not sub:
+            return JsonResponse({'error': 'No active subscription.'}, status=400)
+
+        export_format = request.POST.get('format')
+        if export_format not in EXPORT_FORMATS:
+            return JsonResponse({'error': f"Unknown format '{export_format}'."}, status=400)
+        start_date, end_date = parse_report_range(request.POST)
+        return queue_export(request, sub, export_format, start_date, end_date)
+
+
+class CategorySalesView(LoginRequiredMixin, ReportsAccessMixin, View):
+    """
+    Sales by category for a date range, rolled up through the category tree.
+    ?category=<id> breaks that category down into its children (and gives
+    its own subtree total); without it the top-level categories are listed.
+    """
+    def get(self, request, *args, **kwargs):
+        sub = request.subscription
+        start_date, end_date = parse_report_range(request.GET)
+        payload = {
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'category': None,
+            'categories': [],
         }
+        category = None
+        category_id = request.GET.get('category')
+        if category_id:
+            if not category_id.isdigit():
+                return JsonResponse({'error': f"Invalid category '{category_id}'."}, status=400)
+            category = get_object_or_404(Category, pk=category_id)
+        if not sub:
+            return JsonResponse(payload)
+
+        if category:
+            totals = DailyProductRollup.objects.filter(
+                subscription=sub,
+                date__range=[start_date, end_date],
+                product__category_id__in=Category.subtree_ids(category.id),
+            ).aggregate(revenue=Sum('revenue'), units=Sum('units'))
+            payload['category'] = {
+                'category_id': category.id,
+                'name': category.name,
+                'revenue': float(totals['revenue'] or 0),
+                'units': totals['units'] or 0,
+            }
+        payload['categories'] = [
+            {**row, 'revenue': float(row['revenue'] or 0)}
+            for row in category_sales(sub, start_date, end_date, parent=category.id if category else None)
+        ]
+        return JsonResponse(payload)
 
-        for order in orders_qs:
-            items_count = order.items.aggregate(total=Sum('quantity'))['total'] or 0
-            customer_name = order.customer.name if order.customer else 'Walk-in'
-            report_data['orders'].append({
-                'order_id': order.id,
-                'date': order.created_at.strftime('%Y-%m-%d'),
-                'total': float(order.total),
-                'items_count': items_count,
-                'customer': customer_name,
-            })
 
-        # Export
-        if export_format == 'csv':
-            return self.export_csv(report_data)
-        elif export_format == 'pdf':
-            return self.export_pdf(report_data)
-        elif export_format == 'excel':
-            return self.export_excel(report_data)
-        else:
-            return JsonResponse(report_data)
-
-    def export_csv(self, data):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="sales_report.csv"'
-        writer = csv.writer(response)
-        writer.writerow(['Sales Report Summary'])
-        writer.writerow(['Period', data['period']])
-        writer.writerow(['Total Sales', currency(data['total_sales'])])  # Use currency formatting
-        writer.writerow(['Total Orders', data['total_orders']])
-        writer.writerow(['Total Items', data['total_items']])
-        writer.writerow([])
-        writer.writerow(['Order ID', 'Date', 'Total', 'Items Count', 'Customer'])
-        for order in data['orders']:
-            writer.writerow([
-                order['order_id'],
-                order['date'],
-                currency(order['total']),  # Use currency formatting
-                order['items_count'],
-                order['customer']
-            ])
+class InventoryAgingView(LoginRequiredMixin, ReportsAccessMixin, TemplateView):
+    # The table and bucket summary are loaded from InventoryAgingAPIView
+    template_name = 'reports/inventory_aging.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        from django.conf import settings
+        context['CURRENCY_SYMBOL'] = getattr(settings, 'CURRENCY_SYMBOL', 'P')
+        try:
+            context['aging_threshold'] = max(int(self.request.GET.get('min_days', 0)), 0)
+        except ValueError:
+            context['aging_threshold'] = 0
+        return context
+
+
+class InventoryAgingPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class InventoryAgingAPIView(generics.ListAPIView):
+    """
+    Stock on hand by age of its oldest receipt, oldest first, computed from
+    the open FIFO cost layers at read time. ?min_days=<n> keeps products
+    whose oldest units are at least n days old. The first page also carries
+    the 0-30/31-60/61-90/90+ bucket totals.
+    """
+    permission_classes = [IsOwnerOrAdmin]
+    serializer_class = InventoryAgingSerializer
+    pagination_class = InventoryAgingPagination
+
+    def get_queryset(self):
+        sub = self.request.subscription
+        if not sub:
+            return RestockHistory.objects.none()
+        try:
+            min_days = max(int(self.request.query_params.get('min_days', 0)), 0)
+        except ValueError:
+            min_days = 0
+        return inventory_aging(sub, min_days)
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        sub = request.subscription
+        if sub and not response.data.get('previous'):
+            response.data['buckets'] = inventory_aging_buckets(sub)
         return response
 
-    def export_pdf(self, data):
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="sales_report.pdf"'
-        buffer = BytesIO()
-        p = canvas.Canvas(buffer, pagesize=letter)
-        width, height = letter
-
-        # Title
-        p.setFont("Helvetica-Bold", 16)
-        p.drawString(50, height - 50, f"Sales Report: {data['period']}")
-
-        # Summary
-        p.setFont("Helvetica", 12)
-        y = height - 100
-        p.drawString(50, y, f"Total Sales: {currency(data['total_sales'])}")  # Use currency formatting
-        p.drawString(50, y - 20, f"Total Orders: {data['total_orders']:,}")
-        p.drawString(50, y - 40, f"Total Items Sold: {data['total_items']:,}")
-        avg_val = data['total_sales'] / max(data['total_orders'], 1)
-        p.drawString(50, y - 60, f"Average Order Value: {currency(avg_val)}")  # Use currency formatting
-
-        # Table header
-        y -= 100
-        p.setFont("Helvetica-Bold", 10)
-        p.drawString(50, y, "Order ID")
-        p.drawString(120, y, "Date")
-        p.drawString(200, y, "Total")
-        p.drawString(280, y, "Items")
-        p.drawString(340, y, "Customer")
-
-        # Table rows (limit to first 20)
-        p.setFont("Helvetica", 9)
-        for order in data['orders'][:20]:
-            y -= 15
-            if y < 50:
-                p.showPage()
-                y = height - 50
-                p.setFont("Helvetica-Bold", 10)
-                p.drawString(50, y, "Order ID")
-                p.drawString(120, y, "Date")
-                p.drawString(200, y, "Total")
-                p.drawString(280, y, "Items")
-                p.drawString(340, y, "Customer")
-                p.setFont("Helvetica", 9)
-                y -= 15
-            p.drawString(50, y, str(order['order_id']))
-            p.drawString(120, y, order['date'])
-            p.drawString(200, y, currency(order['total']))  # Use currency formatting
-            p.drawString(280, y, str(order['items_count']))
-            p.drawString(340, y, order['customer'])
-
-        p.save()
-        response.write(buffer.getvalue())
-        buffer.close()
+
+class StockSnapshotAPIView(generics.ListAPIView):
+    """
+    Stock on hand on ?date=YYYY-MM-DD (default yesterday), read from the
+    nearest end-of-day snapshot on or before it. ?sku= narrows it to one
+    product. The first page also carries the snapshot's total units and
+    FIFO value.
+    """
+    permission_classes = [IsOwnerOrAdmin]
+    serializer_class = StockSnapshotSerializer
+    pagination_class = InventoryAgingPagination
+
+    def get_day(self):
+        try:
+            return datetime.strptime(self.request.query_params['date'], '%Y-%m-%d').date()
+        except (KeyError, ValueError):
+            return timezone.localdate() - timedelta(days=1)
+
+    def get_queryset(self):
+        sub = self.request.subscription
+        snapshot_date = sub and stock_snapshot_date(sub, self.get_day())
+        if not snapshot_date:
+            return DailyStockSnapshot.objects.none()
+        qs = DailyStockSnapshot.objects.filter(subscription=sub, date=snapshot_date)
+        sku = self.request.query_params.get('sku')
+        if sku:
+            qs = qs.filter(product__sku=sku)
+        return qs.select_related('product').order_by('product__name', 'product_id')
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        sub = request.subscription
+        if sub and not response.data.get('previous'):
+            snapshot_date, units, value = stock_valuation_on(sub, self.get_day())
+            response.data.update({'snapshot_date': snapshot_date, 'units': units, 'value': value})
         return response
 
-    def export_excel(self, data):
-        if not openpyxl:
-            return self.export_csv(data)
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Sales Report"
-
-        # Summary
-        ws['A1'] = 'Sales Report Summary'
-        ws['A2'] = 'Period'
-        ws['B2'] = data['period']
-        ws['A3'] = 'Total Sales'
-        ws['B3'] = currency(data['total_sales'])  # Use currency formatting
-        ws['A4'] = 'Total Orders'
-        ws['B4'] = data['total_orders']
-        ws['A5'] = 'Total Items'
-        ws['B5'] = data['total_items']
-
-        # Header
-        ws.append([])
-        ws.append(['Order ID', 'Date', 'Total', 'Items Count', 'Customer'])
-        for order in data['orders']:
-            ws.append([
-                order['order_id'],
-                order['date'],
-                currency(order['total']),  # Use currency formatting
-                order['items_count'],
-                order['customer']
-            ])
-
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+class ExportJobStatusView(LoginRequiredMixin, ReportsAccessMixin, View):
+    def get(self, request, pk, *args, **kwargs):
+        job = get_object_or_404(ExportJob, pk=pk, subscription=request.subscription)
+        return JsonResponse(export_job_payload(job))
+
+
+class ExportJobDownloadView(LoginRequiredMixin, ReportsAccessMixin, View):
+    def get(self, request, pk, *args, **kwargs):
+        job = get_object_or_404(
+            ExportJob, pk=pk, status='done', subscription=request.subscription
+        )
+        _, extension, content_type = EXPORT_FORMATS[job.export_format]
+        return FileResponse(
+            job.file.open('rb'),
+            as_attachment=True,
+            filename=f'sales_report_{job.start_date}_{job.end_date}.{extension}',
+            content_type=content_type
         )
-        response['Content-Disposition'] = 'attachment; filename="sales_report.xlsx"'
-        wb.save(response)
-        return response
\ No newline at end of file
@@ -1,6 +1,7 @@
 from django.urls import path
 from .views import (
     OrderListCreate,
+    OrderSyncView,
     OrderDetail,
     generate_receipt,
     test_auth,
@@ -12,6 +13,7 @@ app_name = 'sales_api'
 
 urlpatterns = [
     path('orders/', OrderListCreate.as_view(), name='order-list'),
+    path('orders/sync/', OrderSyncView.as_view(), name='order-sync'),
     path('orders/<int:pk>/', OrderDetail.as_view(), name='order-detail'),
     path('orders/<int:order_id>/receipt/', generate_receipt, name='order-receipt'),
 
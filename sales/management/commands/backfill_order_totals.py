@@ -0,0 +1,52 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import DecimalField, F, Sum
+from sales.models import Order, OrderItem
+
+class Command(BaseCommand):
+    help = 'Backfills item_count, subtotal, discount_amount and tax_amount on orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every order, not just ones with item_count=0')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        qs = Order.objects.all() if options['all'] else Order.objects.filter(item_count=0)
+        # Historic totals stay as charged; only the breakdown is filled in
+        backfill_fields = ['item_count', 'subtotal', 'discount_amount', 'tax_amount']
+        fields = ['id', 'discount', 'tax_rate', 'total'] + backfill_fields
+
+        updated = 0
+        last_id = 0
+        while True:
+            # Keyset pagination so each chunk is an indexed range scan
+            orders = list(qs.filter(id__gt=last_id).order_by('id').only(*fields)[:chunk_size])
+            if not orders:
+                break
+            last_id = orders[-1].id
+
+            totals = {
+                row['order_id']: row
+                for row in OrderItem.objects.filter(order_id__in=[o.id for o in orders])
+                .values('order_id')
+                .annotate(
+                    item_count=Sum('quantity'),
+                    subtotal=Sum(F('price') * F('quantity'), output_field=DecimalField()),
+                )
+            }
+            for order in orders:
+                row = totals.get(order.id, {})
+                total = order.total
+                order.apply_totals(row.get('item_count') or 0, row.get('subtotal') or Decimal('0'))
+                order.total = total
+
+            with transaction.atomic():
+                Order.objects.bulk_update(orders, backfill_fields)
+            updated += len(orders)
+            self.stdout.write(f'Backfilled {updated} orders (last id {last_id})')
+
+        self.stdout.write(self.style.SUCCESS(f'Backfilled totals on {updated} orders'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from sales.models import IdempotencyKey
+
+class Command(BaseCommand):
+    help = 'Deletes expired order Idempotency-Key records'
+
+    def handle(self, *args, **options):
+        deleted = IdempotencyKey.purge_expired()
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} expired idempotency keys'
+        ))
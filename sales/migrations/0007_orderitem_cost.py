@@ -0,0 +1,30 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:32
+
+from django.db import migrations, models
+
+
+# Past lines have no recorded cost; the product's current cost_price is the
+# best estimate available
+BACKFILL_COST = """
+UPDATE sales_orderitem i
+SET cost = i.quantity * p.cost_price
+FROM products_product p
+WHERE p.id = i.product_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_restock_cost_layers'),
+        ('sales', '0006_order_denormalized_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='cost',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunSQL(BACKFILL_COST, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0007_orderitem_cost'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='stock_shortfall',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
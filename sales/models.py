@@ -5,7 +5,7 @@ from django.db import OperationalError
 from products.models import Product
 from customers.models import Customer
 from accounts.models import User
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
 from django.db.models import DecimalField
 from django.apps import apps
 from products.models import User, ClientSubscription
@@ -30,6 +30,8 @@ from django.db.utils import OperationalError
 
 
 from django.conf import settings  # Import settings for AUTH_USER_MODEL
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 
 
 
@@ -71,6 +73,12 @@ class Order(models.Model):
         null=True, blank=True
     )
 
+    # Denormalized from the order's items at checkout so reports and receipts
+    # read one row per order instead of aggregating OrderItem.
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    discount_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    tax_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='draft')
     payment_method = models.CharField(max_length=20, choices=PAYMENT_CHOICES, default='cash', blank=True)
@@ -80,6 +88,12 @@ class Order(models.Model):
     amount_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     change_given = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
+    # Set by registers that record sales offline and sync them later
+    client_id = models.UUIDField(null=True, blank=True, editable=False)
+    # Units an offline sale sold beyond the stock on hand when it synced;
+    # non-zero orders need a stock review
+    stock_shortfall = models.PositiveIntegerField(default=0, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -89,27 +103,53 @@ class Order(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['created_at']),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=['subscription', 'client_id'], name='sales_order_sub_client_id_uniq'),
+        ]
+
+    TOTAL_FIELDS = ['item_count', 'subtotal', 'discount_amount', 'tax_amount', 'total']
 
     def __str__(self):
         user_name = self.user.get_full_name() if self.user else "Unknown User"
         return f"Order #{self.id} - {user_name}"
 
+    def compute_totals(self, subtotal):
+        """
+        Return (discount_amount, tax_amount, total) for the given items subtotal,
+        using this order's discount and tax_rate percentages. Amounts are rounded
+        to cents so the stored parts add up to the total.
+        """
+        cents = Decimal('0.01')
+        subtotal = Decimal(subtotal)
+        discount_amount = (subtotal * (Decimal(self.discount) / Decimal('100'))).quantize(
+            cents, rounding=ROUND_HALF_UP
+        )
+        tax_amount = ((subtotal - discount_amount) * (Decimal(self.tax_rate) / Decimal('100'))).quantize(
+            cents, rounding=ROUND_HALF_UP
+        )
+        total = (subtotal - discount_amount) + tax_amount
+        return discount_amount, tax_amount, total
+
+    def apply_totals(self, item_count, subtotal):
+        """
+        Set item_count, subtotal, discount_amount, tax_amount and total in memory.
+        """
+        self.item_count = item_count
+        self.subtotal = Decimal(subtotal)
+        self.discount_amount, self.tax_amount, self.total = self.compute_totals(subtotal)
+
     def calculate_total(self):
         """
-        Recompute self.total = (sum of items) - discount + tax, save and return it.
+        Recompute the denormalized totals from the items, save and return self.total.
         """
         try:
             with transaction.atomic():
                 agg = self.items.aggregate(
+                    item_count=Sum('quantity'),
                     subtotal=Sum(F('price') * F('quantity'), output_field=DecimalField())
                 )
-                subtotal = agg['subtotal'] or Decimal('0')
-                discount_amount = subtotal * (self.discount / Decimal('100'))
-                tax_amount = (subtotal - discount_amount) * (self.tax_rate / Decimal('100'))
-                new_total = (subtotal - discount_amount) + tax_amount
-
-                self.total = new_total
-                self.save(update_fields=['total'])
+                self.apply_totals(agg['item_count'] or 0, agg['subtotal'] or Decimal('0'))
+                self.save(update_fields=self.TOTAL_FIELDS)
                 return self.total
 
         except Exception as e:
@@ -139,42 +179,6 @@ class Order(models.Model):
                     raise
         return self.change_given
 
-    def update_inventory(self):
-        """
-        For each OrderItem, decrement product.stock (or set to zero if insufficient),
-        with optimistic locking and retries.
-        """
-        if self.status != 'completed':
-            return
-
-        retries = 5
-        delay = 0.1
-        for i in range(retries):
-            try:
-                with transaction.atomic():
-                    for item in self.items.select_related('product').select_for_update():
-                        prod = item.product
-                        updated = prod.__class__.objects.filter(
-                            id=prod.id,
-                            stock__gte=item.quantity
-                        ).update(stock=F('stock') - item.quantity)
-                        if updated == 0:
-                            # Not enough stock, set to zero
-                            prod.__class__.objects.filter(id=prod.id).update(stock=0)
-                            logger.warning(f"Insufficient stock for {prod.name}; set to 0.")
-                return
-            except OperationalError as e:
-                if 'database is locked' in str(e).lower() and i < retries - 1:
-                    time.sleep(delay * (2 ** i))
-                    continue
-                logger.error(f"Inventory update failed: {e}")
-                if i == retries - 1:
-                    raise
-            except Exception as e:
-                logger.error(f"Unexpected error updating inventory: {e}")
-                if i == retries - 1:
-                    raise
-
     def generate_receipt(self):
         """
         Returns a plain-text receipt for this order.
@@ -191,9 +195,6 @@ class Order(models.Model):
                f"{item.quantity} × {item.product.name} @ {symbol}{item.price:.2f} = {symbol}{item.total_price:.2f}"
         )
 
-        subtotal = sum(item.total_price for item in items)
-        discount_amount = subtotal * (self.discount / Decimal('100'))
-        tax_amount = (subtotal - discount_amount) * (self.tax_rate / Decimal('100'))
 
         header = [
             f"RECEIPT #{self.id}",
@@ -206,9 +207,9 @@ class Order(models.Model):
 
         footer = [
             "",
-            f"Subtotal: {symbol}{subtotal:.2f}"
-            f"Discount ({self.discount}%): -{symbol}{discount_amount:.2f}",
-            f"Tax ({self.tax_rate}%): +{symbol}{tax_amount:.2f}",
+            f"Subtotal: {symbol}{self.subtotal:.2f}"
+            f"Discount ({self.discount}%): -{symbol}{self.discount_amount:.2f}",
+            f"Tax ({self.tax_rate}%): +{symbol}{self.tax_amount:.2f}",
             "-----------------------",
             f"TOTAL: {symbol}{self.total:.2f}",
             f"Amount Paid: {symbol}{self.amount_paid:.2f}",
@@ -234,6 +235,8 @@ class OrderItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)  # snapshot
     total_price = models.DecimalField(max_digits=12, decimal_places=2)
+    # Cost of goods for the line: FIFO cost layers consumed at checkout
+    cost = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     class Meta:
         ordering = ['-order__created_at']
@@ -253,4 +256,59 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.quantity} x {self.product.name} (Order #{self.order.id})"
-    
+
+
+class IdempotencyKey(models.Model):
+    """
+    Stored response for an order POST made with an Idempotency-Key header,
+    so a retried request replays the original result instead of selling twice.
+    """
+    subscription = models.ForeignKey(
+        ClientSubscription,
+        on_delete=models.CASCADE,
+        related_name='idempotency_keys'
+    )
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='+'
+    )
+    response_status = models.PositiveSmallIntegerField()
+    response_body = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['subscription', 'key'], name='sales_idempotency_sub_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.key} (Order #{self.order_id})"
+
+    @classmethod
+    def lookup(cls, subscription, key):
+        """
+        Return the live stored response for (subscription, key), or None.
+        An expired entry is deleted so the key can be used again.
+        """
+        entry = cls.objects.filter(subscription=subscription, key=key).first()
+        if entry and entry.expires_at <= timezone.now():
+            entry.delete()
+            return None
+        return entry
+
+    @classmethod
+    def purge_expired(cls):
+        """
+        Delete every expired key and return how many were removed.
+        """
+        deleted, _ = cls.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
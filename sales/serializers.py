@@ -1,10 +1,55 @@
 from rest_framework import serializers
 from django.db import transaction
+from decimal import Decimal
 from .models import Order, OrderItem
-from products.models import Product
+from products.models import Product, RestockHistory, StockMovement
 from customers.models import Customer
+from reports.models import record_completed_sales
+
+
+class CartProductField(serializers.PrimaryKeyRelatedField):
+    """
+    Product PK field that resolves from the batch preloaded by
+    OrderItemListSerializer instead of issuing one query per line.
+    """
+    def to_internal_value(self, data):
+        preloaded = getattr(self.parent, '_preloaded_products', None)
+        if preloaded is None:
+            return super().to_internal_value(data)
+        try:
+            return preloaded[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class OrderItemListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        # Load every product in the cart with one query before validating lines.
+        # Batch callers can share a 'product_cache' dict across many orders.
+        if isinstance(data, list):
+            cache = self.context.get('product_cache')
+            if cache is None:
+                cache = {}
+            ids = set()
+            for item in data:
+                try:
+                    ids.add(int(item.get('product')))
+                except (AttributeError, TypeError, ValueError):
+                    continue
+            missing = ids - cache.keys()
+            if missing:
+                cache.update(Product.objects.in_bulk(missing))
+            self.child._preloaded_products = cache
+        try:
+            return super().to_internal_value(data)
+        finally:
+            self.child._preloaded_products = None
+
 
 class OrderItemSerializer(serializers.ModelSerializer):
+    product = CartProductField(queryset=Product.objects.all())
     product_name = serializers.CharField(source='product.name', read_only=True)
     stock = serializers.IntegerField(source='product.stock', read_only=True)
 
@@ -12,9 +57,9 @@ class OrderItemSerializer(serializers.ModelSerializer):
         model = OrderItem
         fields = ['id', 'product', 'product_name', 'quantity', 'price', 'stock']
         extra_kwargs = {
-            'product': {'required': True},
             'quantity': {'min_value': 1}
         }
+        list_serializer_class = OrderItemListSerializer
 
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True)
@@ -38,52 +83,111 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = [
-            'id', 'customer', 'customer_name', 'user', 'total', 
+            'id', 'customer', 'customer_name', 'user', 'item_count', 'subtotal',
+            'discount_amount', 'tax_amount', 'total',
             'status', 'tax_rate', 'discount', 'items', 'created_at',
-            'payment_method', 'amount_paid', 'change_given', 'update_inventory'
+            'payment_method', 'amount_paid', 'change_given', 'update_inventory',
+            'stock_shortfall',
+        ]
+        read_only_fields = [
+            'item_count', 'subtotal', 'discount_amount', 'tax_amount',
+            'total', 'created_at', 'user', 'change_given', 'stock_shortfall'
         ]
-        read_only_fields = ['total', 'created_at', 'user', 'change_given']
         extra_kwargs = {
             'customer': {'required': False},
             'payment_method': {'required': False}
         }
 
+    @staticmethod
+    def build_lines(items_data):
+        """
+        Return unsaved OrderItems for validated item data, snapshotting each
+        product's current price. cost starts at cost_price and is replaced
+        by the FIFO cost when the sale consumes stock.
+        """
+        return [
+            OrderItem(product=item['product'], quantity=item['quantity'], price=item['product'].price,
+                      cost=item['product'].cost_price * item['quantity'])
+            for item in items_data
+        ]
+
+    @staticmethod
+    def price_order(order, lines):
+        """
+        Set the denormalized totals and change_given on an unsaved order from its lines.
+        """
+        order.apply_totals(
+            sum(line.quantity for line in lines),
+            sum((line.price * line.quantity for line in lines), Decimal('0')),
+        )
+        if order.amount_paid > 0:
+            order.change_given = max(Decimal('0'), order.amount_paid - order.total)
+
     @transaction.atomic
     def create(self, validated_data):
         items_data = validated_data.pop('items')
         update_inventory = validated_data.pop('update_inventory', True)
-        
-        # Extract amount paid for change calculation
-        amount_paid = validated_data.get('amount_paid', 0)
-        
-        order = Order.objects.create(**validated_data)
-        
-        for item_data in items_data:
-            product = item_data['product']
-            quantity = item_data['quantity']
-            
-            if product.stock < quantity:
+
+        # Build every line and the order totals in memory so checkout costs
+        # the same handful of statements however big the cart is.
+        lines = self.build_lines(items_data)
+
+        order = Order(**validated_data)
+        reserve = update_inventory and order.status == 'completed'
+
+        if reserve:
+            # Lock and decrement stock before writing the order so a shortfall
+            # fails fast and two registers can't sell the same units.
+            stock_levels, shortfalls = Product.reserve_stock(
+                {line.product_id: line.quantity for line in lines}
+            )
+            if shortfalls:
                 raise serializers.ValidationError({
-                    'error': f"Insufficient stock for {product.name}. Available: {product.stock}"
+                    'error': "; ".join(
+                        f"Insufficient stock for {p.name}. Available: {p.stock}"
+                        for p in shortfalls
+                    )
                 })
-            
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                quantity=quantity,
-                price=product.price
-            )
+            costs = RestockHistory.consume_fifo({line.product_id: line.quantity for line in lines})
+            for line in lines:
+                line.product.stock = stock_levels[line.product_id]
+                line.cost = costs[line.product_id]
+        else:
+            for line in lines:
+                if line.product.stock < line.quantity:
+                    raise serializers.ValidationError({
+                        'error': f"Insufficient stock for {line.product.name}. "
+                                 f"Available: {line.product.stock}"
+                    })
 
-        # Calculate the total first
-        order.calculate_total()
-        
-        # Calculate change if amount paid is provided
-        if amount_paid > 0:
-            order.calculate_change()
-        
-        # Update inventory if requested and order is completed
-        if update_inventory and order.status == 'completed':
-            order.update_inventory()
-            
+        self.price_order(order, lines)
+        order.save()
+
+        for line in lines:
+            line.order = order
+        OrderItem.objects.bulk_create(lines)
+        if reserve:
+            StockMovement.record('sale', [
+                (line.product_id, -line.quantity, stock_levels[line.product_id], f'order:{order.id}')
+                for line in lines
+            ], user=order.user)
+
+        if order.status == 'completed':
+            record_completed_sales([(order, lines)])
+
+        # Serve order.items from the lines we already hold
+        order._prefetched_objects_cache = {'items': lines}
         return order
-    
\ No newline at end of file
+
+
+class OfflineOrderSerializer(OrderSerializer):
+    """
+    An order recorded by a register while offline, identified by the
+    register's client UUID and stamped with the time the sale happened.
+    """
+    client_id = serializers.UUIDField()
+    recorded_at = serializers.DateTimeField(write_only=True)
+
+    class Meta(OrderSerializer.Meta):
+        fields = OrderSerializer.Meta.fields + ['client_id', 'recorded_at']
+
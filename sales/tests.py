@@ -1,3 +1,339 @@
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient, APIRequestFactory
+
+from accounts.models import ClientSubscription, User
+from products.models import Category, Product, RestockHistory, StockMovement
+from .models import IdempotencyKey, Order, OrderItem
+from .serializers import OrderSerializer
+
+
+class CheckoutTestMixin:
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='cashier@example.com', password='pass',
+            first_name='Cash', last_name='Ier', role='owner',
+        )
+        self.sub = ClientSubscription.objects.create(owner=self.user, business_name='Shop')
+        self.user.subscription = self.sub
+        self.user.save()
+        self.category = Category.objects.create(name='General')
+        self.products = [
+            Product.objects.create(
+                subscription=self.sub, name=f'Item {i}', sku=f'SKU-{i}',
+                category=self.category, price=Decimal('2.50'), stock=10,
+            )
+            for i in range(25)
+        ]
+        request = APIRequestFactory().post('/api/sales/orders/')
+        request.user = self.user
+        self.context = {'request': request}
+
+    def make_serializer(self, products, quantity=2, **extra):
+        data = {
+            'items': [
+                {'product': p.id, 'quantity': quantity, 'price': str(p.price)}
+                for p in products
+            ],
+            'tax_rate': '10',
+            'discount': '0',
+            'amount_paid': '100',
+        }
+        data.update(extra)
+        return OrderSerializer(data=data, context=self.context)
+
+
+class OrderCheckoutTests(CheckoutTestMixin, TestCase):
+    def checkout_queries(self, products):
+        serializer = self.make_serializer(products)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            serializer.save(subscription=self.sub, status='completed')
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_cart(self):
+        single = self.checkout_queries(self.products[:1])
+        full = self.checkout_queries(self.products[1:])
+        self.assertEqual(single, full)
+
+    def test_checkout_statement_bound(self):
+        serializer = self.make_serializer(self.products)
+        # product lookup, savepoint, stock lock, stock update, FIFO cost draw,
+        # order insert, items insert, stock ledger, daily rollup, product
+        # rollup, release
+        with self.assertNumQueries(11):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            serializer.save(subscription=self.sub, status='completed')
+
+    def test_totals_items_and_stock(self):
+        serializer = self.make_serializer(self.products[:3])
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        order = serializer.save(subscription=self.sub, status='completed')
+
+        order.refresh_from_db()
+        # 3 lines x 2 x 2.50 = 15.00, +10% tax
+        self.assertEqual(order.total, Decimal('16.50'))
+        self.assertEqual(order.item_count, 6)
+        self.assertEqual(order.subtotal, Decimal('15.00'))
+        self.assertEqual(order.tax_amount, Decimal('1.50'))
+        self.assertEqual(order.change_given, Decimal('83.50'))
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 3)
+        stocks = Product.objects.filter(id__in=[p.id for p in self.products[:3]]) \
+                                .values_list('stock', flat=True)
+        self.assertEqual(set(stocks), {8})
+        self.assertEqual(Product.objects.get(id=self.products[3].id).stock, 10)
+        self.assertEqual(
+            set(StockMovement.objects.filter(kind='sale').values_list('quantity', 'stock_after', 'reference')),
+            {(-2, 8, f'order:{order.id}')},
+        )
+
+    def test_shortfall_rejects_whole_order(self):
+        Product.objects.filter(id=self.products[1].id).update(stock=1)
+        serializer = self.make_serializer(self.products[:3])
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with self.assertRaises(ValidationError):
+            serializer.save(subscription=self.sub, status='completed')
+
+        self.assertEqual(Order.objects.count(), 0)
+        stocks = dict(Product.objects.filter(id__in=[p.id for p in self.products[:3]])
+                                     .values_list('id', 'stock'))
+        self.assertEqual(stocks[self.products[0].id], 10)
+        self.assertEqual(stocks[self.products[1].id], 1)
+
+    def test_reserve_stock_reports_shortfalls(self):
+        first, second = self.products[:2]
+        levels, shortfalls = Product.reserve_stock({first.id: 4, second.id: 11})
+        self.assertEqual(levels, {})
+        self.assertEqual([p.id for p in shortfalls], [second.id])
+
+        levels, shortfalls = Product.reserve_stock({first.id: 4, second.id: 10})
+        self.assertEqual(shortfalls, [])
+        self.assertEqual(levels, {first.id: 6, second.id: 0})
+
+    def test_backfill_order_totals(self):
+        serializer = self.make_serializer(self.products[:2], quantity=3)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        order = serializer.save(subscription=self.sub, status='completed')
+        Order.objects.filter(id=order.id).update(item_count=0, subtotal=0, tax_amount=0)
+
+        call_command('backfill_order_totals', chunk_size=1, stdout=StringIO())
+
+        order.refresh_from_db()
+        self.assertEqual(order.item_count, 6)
+        self.assertEqual(order.subtotal, Decimal('15.00'))
+        self.assertEqual(order.tax_amount, Decimal('1.50'))
+        self.assertEqual(order.total, Decimal('16.50'))
+
+    def test_draft_order_leaves_stock(self):
+        serializer = self.make_serializer(self.products[:1])
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save(subscription=self.sub)
+        self.assertEqual(Product.objects.get(id=self.products[0].id).stock, 10)
+
+    def test_unknown_product_is_rejected(self):
+        serializer = OrderSerializer(
+            data={'items': [{'product': 999999, 'quantity': 1, 'price': '1.00'}]},
+            context=self.context,
+        )
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('items', serializer.errors)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_api_create_completes_order(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        payload = self.make_serializer(self.products[:2]).initial_data
+        response = client.post('/api/sales/orders/', payload, format='json')
+
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data['status'], 'completed')
+        self.assertEqual(len(response.data['items']), 2)
+        self.assertEqual(response.data['items'][0]['stock'], 8)
+        self.assertEqual(Product.objects.get(id=self.products[0].id).stock, 8)
+
+
+class FifoCostTests(CheckoutTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.products[0]
+        Product.objects.filter(id=self.product.id).update(stock=0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for quantity, unit_cost in ((5, '1.00'), (10, '2.00')):
+            response = self.client.post('/api/products/receive/', {
+                'items': [{'sku': self.product.sku, 'quantity': quantity, 'unit_cost': unit_cost}],
+            }, format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+
+    def test_checkout_consumes_oldest_layers_first(self):
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.cost_price), (15, Decimal('2.00')))
+
+        serializer = self.make_serializer([self.product], quantity=7)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        order = serializer.save(subscription=self.sub, status='completed')
+
+        # 5 x 1.00 from the first delivery, 2 x 2.00 from the second
+        self.assertEqual(OrderItem.objects.get(order=order).cost, Decimal('9.00'))
+        self.assertEqual(
+            list(RestockHistory.objects.filter(product=self.product)
+                 .order_by('restocked_at', 'id').values_list('remaining', flat=True)),
+            [0, 8],
+        )
+        units, value = RestockHistory.inventory_value(self.sub)
+        self.assertEqual(units, 8 + 24 * 10)
+        self.assertEqual(value, Decimal('16.00'))
+
+    def test_units_without_layers_use_cost_price(self):
+        costs = RestockHistory.consume_fifo({self.product.id: 16})
+        self.assertEqual(costs[self.product.id], Decimal('27.00'))
+
+
+class IdempotencyKeyTests(CheckoutTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.payload = self.make_serializer(self.products[:2]).initial_data
+
+    def post(self, key, payload=None):
+        return self.client.post(
+            '/api/sales/orders/', payload or self.payload,
+            format='json', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_replay_returns_original_response(self):
+        first = self.post('register-1-abc')
+        self.assertEqual(first.status_code, 201, first.content)
+
+        with self.assertNumQueries(2):  # subscription and key lookups alone
+            second = self.post('register-1-abc')
+
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.json()['id'], first.data['id'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get(id=self.products[0].id).stock, 8)
+
+    def test_reused_key_with_different_payload(self):
+        self.post('register-1-abc')
+        other = self.make_serializer(self.products[2:3]).initial_data
+        response = self.post('register-1-abc', other)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_expired_key_can_be_reused(self):
+        self.post('register-1-abc')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        response = self.post('register-1-abc')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+
+class OrderSyncTests(CheckoutTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def entry(self, products, quantity=1, days_ago=1):
+        data = self.make_serializer(products, quantity=quantity).initial_data
+        data['client_id'] = str(uuid.uuid4())
+        data['recorded_at'] = (timezone.now() - timedelta(days=days_ago)).isoformat()
+        return data
+
+    def sync(self, entries):
+        return self.client.post('/api/sales/orders/sync/', {'orders': entries}, format='json')
+
+    def test_batch_creates_orders_in_constant_queries(self):
+        entries = [self.entry(self.products[i:i + 2]) for i in range(0, 20, 2)]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.sync(entries)
+
+        self.assertEqual(response.status_code, 200, response.content)
+        results = response.json()['results']
+        self.assertEqual({r['status'] for r in results.values()}, {'created'})
+        # subscription, products, duplicates (x2), lock,
+        # decrement, FIFO cost draw, orders, backdate, items, stock ledger,
+        # rollups (x2) + savepoints
+        self.assertLessEqual(len(ctx.captured_queries), 15)
+
+        order = Order.objects.get(client_id=entries[0]['client_id'])
+        self.assertEqual(order.status, 'completed')
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(order.created_at.date(), (timezone.now() - timedelta(days=1)).date())
+        self.assertEqual(Product.objects.get(id=self.products[0].id).stock, 9)
+
+    def test_replayed_batch_reports_duplicates(self):
+        entries = [self.entry(self.products[:1])]
+        first = self.sync(entries).json()['results']
+        second = self.sync(entries).json()['results']
+
+        key = entries[0]['client_id']
+        self.assertEqual(second[key], {'status': 'duplicate', 'order_id': first[key]['order_id']})
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get(id=self.products[0].id).stock, 9)
+
+    def test_shortfall_is_recorded_and_flagged(self):
+        first = self.entry(self.products[:1], quantity=6, days_ago=2)
+        second = self.entry(self.products[:1], quantity=6, days_ago=1)
+        invalid = {'client_id': str(uuid.uuid4()), 'items': []}
+        results = self.sync([second, first, invalid]).json()['results']
+
+        self.assertEqual(results[first['client_id']]['status'], 'created')
+        self.assertNotIn('stock_shortfall', results[first['client_id']])
+        self.assertEqual(results[second['client_id']]['status'], 'created')
+        self.assertEqual(results[second['client_id']]['stock_shortfall'], 2)
+        self.assertEqual(results[invalid['client_id']]['status'], 'error')
+
+        order = Order.objects.get(client_id=second['client_id'])
+        self.assertEqual((order.item_count, order.stock_shortfall), (6, 2))
+        self.assertEqual(Product.objects.get(id=self.products[0].id).stock, 0)
+        self.assertEqual(
+            list(StockMovement.objects.filter(kind='sale').order_by('id')
+                 .values_list('quantity', 'stock_after')),
+            [(-6, 4), (-4, 0)],
+        )
+
+    def test_concurrent_sync_reports_duplicate(self):
+        raced, other = self.entry(self.products[:1]), self.entry(self.products[1:2])
+        lookup = IdempotencyKey.objects.filter
+
+        def concurrent_commit(*args, **kwargs):
+            # Another request commits the same client_id after the duplicate check
+            Order.objects.create(subscription=self.sub, client_id=raced['client_id'], status='completed')
+            return lookup(*args, **kwargs)
+
+        with mock.patch.object(IdempotencyKey.objects, 'filter', side_effect=concurrent_commit):
+            response = self.sync([raced, other])
+
+        self.assertEqual(response.status_code, 200, response.content)
+        results = response.json()['results']
+        winner = Order.objects.get(client_id=raced['client_id'])
+        self.assertEqual(results[raced['client_id']], {'status': 'duplicate', 'order_id': winner.id})
+        self.assertEqual(results[other['client_id']]['status'], 'created')
+        self.assertEqual(Product.objects.get(id=self.products[0].id).stock, 10)
+        self.assertEqual(Product.objects.get(id=self.products[1].id).stock, 9)
+
+    def test_order_posted_online_is_not_synced_twice(self):
+        entry = self.entry(self.products[:1])
+        online = self.client.post(
+            '/api/sales/orders/', entry, format='json',
+            HTTP_IDEMPOTENCY_KEY=entry['client_id'],
+        )
+        results = self.sync([entry]).json()['results']
 
-# Create your tests here.
+        self.assertEqual(results[entry['client_id']],
+                         {'status': 'duplicate', 'order_id': online.data['id']})
+        self.assertEqual(Order.objects.count(), 1)
@@ -1,4 +1,9 @@
+import hashlib
+import json
 import logging
+import uuid
+from collections import defaultdict
+from datetime import timedelta
 from django.shortcuts import get_object_or_404
 from rest_framework import generics, status
 from rest_framework.response import Response
@@ -7,7 +12,8 @@ from rest_framework.permissions import IsAuthenticated
 from django.http import HttpResponse, JsonResponse
 from django.views.generic import TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DateTimeField, Value, When
 from django.contrib.auth.decorators import login_required
 from django.template.loader import render_to_string
 from django.utils.html import escape
@@ -15,24 +21,25 @@ from rest_framework.authentication import SessionAuthentication
 from decimal import Decimal
 from django.core.exceptions import FieldError
 from django.conf import settings
+from django.utils import timezone
 
-from .models import Order, OrderItem
-from .serializers import OrderSerializer
-from products.models import Product
+from .models import IdempotencyKey, Order, OrderItem
+from .serializers import OfflineOrderSerializer, OrderSerializer
+from products.models import Product, RestockHistory, StockMovement
 from customers.models import Customer
 from core.utils import currency
+from reports.models import record_completed_sales, remove_completed_sales
+from accounts.middleware import subscription_for
 
 logger = logging.getLogger(__name__)
 
-def get_user_subscription(user):
+
+def hash_request_data(data):
     """
-    Return the ClientSubscription for this user (member or owner),
-    or None if they have no subscription.
+    Stable SHA-256 of a parsed request payload, used to match Idempotency-Key replays.
     """
-    sub = getattr(user, 'subscription', None)
-    if sub:
-        return sub
-    return getattr(user, 'owned_subscription', None)
+    payload = json.dumps(data, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
 
 # ──────────────────────────────────────────────────────────────────────────────
 # REST API: Orders
@@ -43,31 +50,273 @@ class OrderListCreate(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        sub = get_user_subscription(self.request.user)
+        sub = self.request.subscription
         if not sub:
             return Order.objects.none()
         return Order.objects.filter(user__subscription=sub)
 
-    @transaction.atomic
     def create(self, request, *args, **kwargs):
-        sub = get_user_subscription(request.user)
+        sub = request.subscription
         if not sub:
             return Response({"detail": "No active subscription."},
                             status=status.HTTP_403_FORBIDDEN)
 
+        # Retried POSTs carrying the same Idempotency-Key replay the stored
+        # response without touching orders or inventory.
+        idem_key = request.headers.get('Idempotency-Key')
+        request_hash = None
+        if idem_key:
+            if len(idem_key) > 255:
+                return Response({"detail": "Idempotency-Key must be at most 255 characters."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            request_hash = hash_request_data(request.data)
+            replay = self.replay_idempotent(sub, idem_key, request_hash)
+            if replay:
+                return replay
+
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        order = serializer.save(user=request.user, subscription=sub)
-
-        order.status = 'completed'
-        order.calculate_total()
-        order.calculate_change()
-        order.update_inventory()
-        order.save(update_fields=['status', 'total', 'change_given'])
+        try:
+            with transaction.atomic():
+                order = serializer.save(user=request.user, subscription=sub, status='completed')
+                data = self.get_serializer(order).data
+                if idem_key:
+                    IdempotencyKey.objects.create(
+                        subscription=sub,
+                        key=idem_key,
+                        request_hash=request_hash,
+                        order=order,
+                        response_status=status.HTTP_201_CREATED,
+                        response_body=data,
+                        expires_at=timezone.now() + timedelta(
+                            hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24)
+                        ),
+                    )
+        except IntegrityError:
+            # A concurrent request with the same key committed first
+            replay = idem_key and self.replay_idempotent(sub, idem_key, request_hash)
+            if not replay:
+                raise
+            return replay
 
         logger.info(f"Order #{order.id} completed for subscription={sub}.")
-        return Response(self.get_serializer(order).data,
-                        status=status.HTTP_201_CREATED)
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    def replay_idempotent(self, sub, idem_key, request_hash):
+        """
+        Return the stored Response for this key, a 422 if the key was used
+        with a different payload, or None if the key is unused.
+        """
+        entry = IdempotencyKey.lookup(sub, idem_key)
+        if entry is None:
+            return None
+        if entry.request_hash != request_hash:
+            return Response({"detail": "Idempotency-Key was already used with a different request."},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        logger.info(f"Replaying order #{entry.order_id} for Idempotency-Key {idem_key}.")
+        response = Response(entry.response_body, status=entry.response_status)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+
+class OrderSyncView(generics.GenericAPIView):
+    """
+    Accepts a queue of orders recorded offline by a register:
+    {"orders": [{"client_id": <uuid>, "recorded_at": <iso datetime>, ...order fields}]}.
+    Orders are validated and written in chunks, one transaction per chunk, and
+    the response maps each client_id to 'created', 'duplicate' or 'error'.
+    Created orders that sold more than was in stock also carry the number of
+    uncovered units under 'stock_shortfall'.
+    """
+    serializer_class = OfflineOrderSerializer
+    permission_classes = [IsAuthenticated]
+    chunk_size = 100
+    max_orders = 1000
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['product_cache'] = self.product_cache
+        return context
+
+    def post(self, request, *args, **kwargs):
+        sub = request.subscription
+        if not sub:
+            return Response({"detail": "No active subscription."},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        entries = request.data.get('orders') if isinstance(request.data, dict) else None
+        if not isinstance(entries, list):
+            return Response({"detail": "Expected a list under 'orders'."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(entries) > self.max_orders:
+            return Response({"detail": f"At most {self.max_orders} orders per request."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        self.product_cache = {}
+        results = {}
+        for start in range(0, len(entries), self.chunk_size):
+            self.sync_chunk(sub, entries[start:start + self.chunk_size], start, results)
+
+        created = sum(1 for r in results.values() if r['status'] == 'created')
+        logger.info(f"Synced {created}/{len(entries)} offline orders for subscription={sub}.")
+        return Response({'results': results})
+
+    def sync_chunk(self, sub, entries, offset, results):
+        # Preload every product referenced by the chunk with one query
+        product_ids = set()
+        for entry in entries:
+            for item in (entry.get('items') if isinstance(entry, dict) else None) or []:
+                try:
+                    product_ids.add(int(item.get('product')))
+                except (AttributeError, TypeError, ValueError):
+                    continue
+        missing = product_ids - self.product_cache.keys()
+        if missing:
+            self.product_cache.update(Product.objects.in_bulk(missing))
+
+        pending = []
+        for index, entry in enumerate(entries, start=offset):
+            serializer = self.get_serializer(data=entry)
+            if not serializer.is_valid():
+                key = str(entry.get('client_id') or f"#{index}") if isinstance(entry, dict) else f"#{index}"
+                results[key] = {'status': 'error', 'errors': serializer.errors}
+                continue
+            key = str(serializer.validated_data['client_id'])
+            if key in results:
+                results[key] = {'status': 'error', 'errors': {'client_id': ['Repeated in this batch.']}}
+                continue
+            results[key] = None
+            pending.append(serializer.validated_data)
+
+        client_ids = [data['client_id'] for data in pending]
+        existing = dict(
+            Order.objects.filter(subscription=sub, client_id__in=client_ids)
+            .values_list('client_id', 'id')
+        )
+        # The POS reuses the client_id as its Idempotency-Key, so an order whose
+        # online POST landed before the connection dropped is also a duplicate.
+        existing.update(
+            (uuid.UUID(key), order_id)
+            for key, order_id in IdempotencyKey.objects.filter(
+                subscription=sub, key__in=[str(cid) for cid in client_ids]
+            ).values_list('key', 'order_id')
+        )
+        fresh = []
+        for data in pending:
+            if data['client_id'] in existing:
+                results[str(data['client_id'])] = {
+                    'status': 'duplicate', 'order_id': existing[data['client_id']]
+                }
+            else:
+                fresh.append(data)
+        if not fresh:
+            return
+
+        # Earliest sales claim stock first
+        fresh.sort(key=lambda data: data['recorded_at'])
+
+        try:
+            created = self.write_orders(sub, fresh)
+        except IntegrityError:
+            # A concurrent sync of the same queue committed some of these
+            # client_ids after the duplicate check above
+            taken = dict(
+                Order.objects.filter(subscription=sub, client_id__in=[d['client_id'] for d in fresh])
+                .values_list('client_id', 'id')
+            )
+            if not taken:
+                raise
+            for client_id, order_id in taken.items():
+                results[str(client_id)] = {'status': 'duplicate', 'order_id': order_id}
+            created = self.write_orders(sub, [d for d in fresh if d['client_id'] not in taken])
+
+        for order in created:
+            result = {'status': 'created', 'order_id': order.id}
+            if order.stock_shortfall:
+                result['stock_shortfall'] = order.stock_shortfall
+            results[str(order.client_id)] = result
+
+    def write_orders(self, sub, fresh):
+        """
+        Write validated offline orders in one transaction and return them.
+        The sales already happened at the till, so a line short on stock is
+        still recorded: stock drops to zero and the order's stock_shortfall
+        counts the uncovered units for review.
+        """
+        if not fresh:
+            return []
+
+        with transaction.atomic():
+            wanted = {
+                item['product'].id
+                for data in fresh if data.get('update_inventory', True)
+                for item in data['items']
+            }
+            available = {pk: p.stock for pk, p in Product.lock_stock(wanted).items()}
+
+            orders, order_lines, recorded = [], [], {}
+            sold = defaultdict(int)
+            decrement = defaultdict(int)
+            stock_lines = []
+            for data in fresh:
+                data = dict(data)
+                items_data = data.pop('items')
+                update_inventory = data.pop('update_inventory', True)
+                recorded_at = data.pop('recorded_at')
+                data.pop('status', None)
+
+                lines = OfflineOrderSerializer.build_lines(items_data)
+                order = Order(subscription=sub, status='completed', **data)
+                if update_inventory:
+                    for line in lines:
+                        taken = min(line.quantity, available.get(line.product_id, 0))
+                        order.stock_shortfall += line.quantity - taken
+                        available[line.product_id] -= taken
+                        decrement[line.product_id] += taken
+                        sold[line.product_id] += line.quantity
+                        stock_lines.append((line, taken, available[line.product_id]))
+
+                OfflineOrderSerializer.price_order(order, lines)
+                orders.append(order)
+                order_lines.append(lines)
+                recorded[data['client_id']] = recorded_at
+
+            Product.apply_stock_decrement({pk: qty for pk, qty in decrement.items() if qty})
+            # One FIFO draw per product for the batch, shared out by quantity;
+            # units beyond the layers are costed at cost_price
+            costs = RestockHistory.consume_fifo(sold)
+            for line, _, _ in stock_lines:
+                line.cost = (
+                    costs[line.product_id] * line.quantity / sold[line.product_id]
+                ).quantize(Decimal('0.01'))
+            Order.objects.bulk_create(orders)
+            # created_at is auto_now_add; backdate to when each sale happened
+            Order.objects.filter(id__in=[o.id for o in orders]).update(
+                created_at=Case(
+                    *[When(id=o.id, then=Value(recorded[o.client_id])) for o in orders],
+                    output_field=DateTimeField(),
+                )
+            )
+            items = []
+            for order, lines in zip(orders, order_lines):
+                order.created_at = recorded[order.client_id]
+                for line in lines:
+                    line.order = order
+                    items.append(line)
+            OrderItem.objects.bulk_create(items)
+            StockMovement.record('sale', [
+                (line.product_id, -taken, stock_after, f'order:{line.order.id}')
+                for line, taken, stock_after in stock_lines if taken
+            ], user=self.request.user)
+            record_completed_sales(zip(orders, order_lines))
+
+        short = [o for o in orders if o.stock_shortfall]
+        if short:
+            logger.warning(
+                f"{len(short)} offline order(s) for subscription={sub} sold beyond stock on hand: "
+                + ", ".join(f"#{o.id} ({o.stock_shortfall})" for o in short)
+            )
+        return orders
 
 
 class OrderDetail(generics.RetrieveUpdateDestroyAPIView):
@@ -75,11 +324,24 @@ class OrderDetail(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        sub = get_user_subscription(self.request.user)
+        sub = self.request.subscription
         if not sub:
             return Order.objects.none()
         return Order.objects.filter(user__subscription=sub)
 
+    @transaction.atomic
+    def perform_update(self, serializer):
+        order = serializer.instance
+        if order.status == 'completed' and serializer.validated_data.get('status', 'completed') != 'completed':
+            # Leaving completed (e.g. canceled): take the sale out of the rollups
+            remove_completed_sales([(order, list(order.items.all()))])
+        serializer.save()
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        remove_completed_sales([(instance, list(instance.items.all()))])
+        instance.delete()
+
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Browser views: POS & Orders
@@ -90,13 +352,17 @@ class POSView(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        sub = get_user_subscription(self.request.user)
+        sub = self.request.subscription
         
         # Add currency settings to context
         context['CURRENCY_SYMBOL'] = getattr(settings, 'CURRENCY_SYMBOL', 'P')
         context['CURRENCY'] = getattr(settings, 'CURRENCY', 'BWP')
 
         if sub:
+            # Version first, so deltas from it cover anything that changes
+            # while the grid renders
+            _, context['catalog_version'] = Product.catalog_state(sub)
+
             # Products scoped to subscription
             context['products'] = Product.objects.filter(
                 subscription=sub,
@@ -124,7 +390,7 @@ class OrdersView(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        sub = get_user_subscription(self.request.user)
+        sub = self.request.subscription
         
         # Add currency settings to context
         context['CURRENCY_SYMBOL'] = getattr(settings, 'CURRENCY_SYMBOL', 'P')
@@ -180,13 +446,13 @@ def generate_receipt(request, order_id):
             return JsonResponse({"detail": f"Order {order_id} not found."}, status=404)
 
         # 2) Check subscription access for requesting user
-        sub_req = get_user_subscription(request.user)
+        sub_req = request.subscription
         if not sub_req:
             logger.error(f"User {request.user} has no subscription")
             return JsonResponse({"detail": "No active subscription."}, status=403)
 
         # Determine subscription of the order owner
-        sub_order_owner = get_user_subscription(order_obj.user)
+        sub_order_owner = subscription_for(order_obj.user)
         if sub_order_owner != sub_req:
             logger.error(
                 f"User {request.user} (sub: {sub_req}) cannot access order {order_id} "
@@ -194,11 +460,8 @@ def generate_receipt(request, order_id):
             )
             return JsonResponse({"detail": "Access denied."}, status=403)
 
-        # 3) Gather items and compute totals
+        # 3) Gather items; totals are stored on the order
         items_qs = order_obj.items.select_related('product').all()
-        subtotal = sum(item.total_price for item in items_qs)
-        discount_amount = subtotal * (order_obj.discount / Decimal('100'))
-        tax_amount = (subtotal - discount_amount) * (order_obj.tax_rate / Decimal('100'))
 
         # 4) Determine business name from subscription
         if sub_order_owner and getattr(sub_order_owner, 'business_name', None):
@@ -211,9 +474,9 @@ def generate_receipt(request, order_id):
             'business_name': business_name,
             'order': order_obj,
             'items': items_qs,
-            'subtotal': format_currency(subtotal),
-            'discount_amount': format_currency(discount_amount),
-            'tax_amount': format_currency(tax_amount),
+            'subtotal': format_currency(order_obj.subtotal),
+            'discount_amount': format_currency(order_obj.discount_amount),
+            'tax_amount': format_currency(order_obj.tax_amount),
             'total': format_currency(order_obj.total),
             'amount_paid': format_currency(order_obj.amount_paid) if order_obj.amount_paid else None,
             'change_given': format_currency(order_obj.change_given) if order_obj.change_given else None,
@@ -268,14 +531,14 @@ def test_auth(request):
     return Response({
         'authenticated': True,
         'user': request.user.email,
-        'subscription': str(get_user_subscription(request.user))
+        'subscription': str(request.subscription)
     })
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def debug_orders(request):
-    sub = get_user_subscription(request.user)
+    sub = request.subscription
     if not sub:
         return Response({'orders': []})
     orders = Order.objects.filter(user__subscription=sub) \
@@ -60,6 +60,10 @@ document.addEventListener('DOMContentLoaded', () => {
   let cart = [];
   const defaultTax = 8; // Hardcode tax rate for simplicity
 
+  // One Idempotency-Key per checkout attempt; reused on retry so the server
+  // replays the original order instead of creating a duplicate.
+  let pendingOrderKey = null;
+
   // Unified API configuration
   const API_BASE_URL = '/api/sales/';
   console.log('Using API base URL:', API_BASE_URL);
@@ -67,12 +71,57 @@ document.addEventListener('DOMContentLoaded', () => {
   // Format product prices on page load
   formatProductPrices();
 
-  document.getElementById('productSearch').addEventListener('input', (e) => {
-    const searchTerm = e.target.value.toLowerCase();
+  // Product search: ranked, typo-tolerant matches from the server, shown in
+  // rank order. Falls back to filtering names on the page if the call fails.
+  let searchTimer = null;
+  let searchController = null;
+
+  function filterCardsLocally(searchTerm) {
     document.querySelectorAll('.product-card').forEach(card => {
       const name = card.dataset.name.toLowerCase();
       card.style.display = name.includes(searchTerm) ? 'block' : 'none';
     });
+  }
+
+  function showSearchResults(ids) {
+    const rank = new Map(ids.map((id, index) => [String(id), index]));
+    document.querySelectorAll('.product-card').forEach(card => {
+      const column = card.parentElement;
+      const position = rank.get(card.dataset.id);
+      card.style.display = position === undefined ? 'none' : 'block';
+      column.style.order = position === undefined ? '' : position;
+    });
+  }
+
+  async function searchProducts(searchTerm) {
+    if (searchController) {
+      searchController.abort();
+    }
+    if (!searchTerm) {
+      filterCardsLocally('');
+      document.querySelectorAll('#productGrid > div').forEach(column => column.style.order = '');
+      return;
+    }
+    searchController = new AbortController();
+    try {
+      const response = await fetch(`/api/products/search/?q=${encodeURIComponent(searchTerm)}&limit=50`, {
+        credentials: 'same-origin',
+        signal: searchController.signal
+      });
+      if (!response.ok) throw new Error(response.status);
+      const data = await response.json();
+      showSearchResults(data.results.map(product => product.id));
+    } catch (error) {
+      if (error.name !== 'AbortError') {
+        filterCardsLocally(searchTerm.toLowerCase());
+      }
+    }
+  }
+
+  document.getElementById('productSearch').addEventListener('input', (e) => {
+    clearTimeout(searchTimer);
+    const searchTerm = e.target.value.trim();
+    searchTimer = setTimeout(() => searchProducts(searchTerm), 150);
   });
 
   document.querySelectorAll('.product-card').forEach(card => {
@@ -278,15 +327,33 @@ document.addEventListener('DOMContentLoaded', () => {
         'X-CSRFToken': getCSRFToken()
       };
 
+      if (!pendingOrderKey) {
+        pendingOrderKey = crypto.randomUUID();
+      }
+
       console.log('Sending order data:', orderData);
 
       // Create order using session authentication
-      const createResponse = await fetch(`${API_BASE_URL}orders/`, {
-        method: 'POST',
-        headers: headers,
-        credentials: 'same-origin',  // Use same-origin for session auth
-        body: JSON.stringify(orderData)
-      });
+      let createResponse;
+      try {
+        createResponse = await fetch(`${API_BASE_URL}orders/`, {
+          method: 'POST',
+          headers: { ...headers, 'Idempotency-Key': pendingOrderKey },
+          credentials: 'same-origin',  // Use same-origin for session auth
+          body: JSON.stringify(orderData)
+        });
+      } catch (networkError) {
+        // Offline: keep the sale locally and sync it when the connection returns
+        console.warn('Network unavailable, queueing order offline:', networkError);
+        queueOfflineOrder(orderData, pendingOrderKey);
+        pendingOrderKey = null;
+        cart = [];
+        updateCartDisplay();
+        document.getElementById('amountPaidInput').value = '';
+        document.getElementById('discountInput').value = '';
+        showAlert('Offline: order saved on this register and will sync automatically.', 'warning', 5000);
+        return;
+      }
 
       console.log('Create order response status:', createResponse.status);
 
@@ -298,6 +365,7 @@ document.addEventListener('DOMContentLoaded', () => {
       }
 
       const order = await createResponse.json();
+      pendingOrderKey = null;
       console.log('Order created successfully:', order);
       
       // Generate receipt - use the same headers
@@ -337,21 +405,31 @@ document.addEventListener('DOMContentLoaded', () => {
     }
   };
   
+  // Catalog version the product grid reflects; refreshes fetch only the
+  // products changed since then.
+  let catalogVersion = window.CATALOG_VERSION || 0;
+  let catalogETag = null;
+
   async function reloadProductInfo() {
     try {
-      const response = await fetch('/api/products/', {
+      const headers = { 'Accept': 'application/json' };
+      if (catalogETag) {
+        headers['If-None-Match'] = catalogETag;
+      }
+      const response = await fetch(`/api/products/?since=${catalogVersion}`, {
         method: 'GET',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-CSRFToken': getCSRFToken()
-        },
+        headers: headers,
         credentials: 'same-origin'
       });
-      
+
+      if (response.status === 304) {
+        return;
+      }
       if (response.ok) {
-        const products = await response.json();
+        const catalog = await response.json();
+        catalogETag = response.headers.get('ETag');
         
-        products.forEach(product => {
+        catalog.products.forEach(product => {
           const card = document.querySelector(`.product-card[data-id="${product.id}"]`);
           if (card) {
             card.dataset.stock = product.stock;
@@ -372,8 +450,17 @@ document.addEventListener('DOMContentLoaded', () => {
             }
           }
         });
-        
-        console.log('Product info reloaded successfully');
+
+        // Deleted or deactivated products leave the grid
+        catalog.deleted.forEach(productId => {
+          const card = document.querySelector(`.product-card[data-id="${productId}"]`);
+          if (card) {
+            card.parentElement.remove();
+          }
+        });
+
+        catalogVersion = catalog.version;
+        console.log(`Product info reloaded: ${catalog.products.length} changed, ${catalog.deleted.length} removed`);
       } else {
         console.error('Failed to reload product data:', response.status);
         showAlert('Failed to update product info. Please refresh the page.', 'warning');
@@ -384,6 +471,114 @@ document.addEventListener('DOMContentLoaded', () => {
     }
   }
 
+  // Orders recorded while offline wait in localStorage until the batch sync
+  // endpoint accepts them. The checkout Idempotency-Key doubles as client_id.
+  const OFFLINE_QUEUE_KEY = 'pos.offlineOrders';
+  const SYNC_BATCH_SIZE = 100;
+  let isSyncing = false;
+
+  function loadOfflineQueue() {
+    try {
+      return JSON.parse(localStorage.getItem(OFFLINE_QUEUE_KEY)) || [];
+    } catch (error) {
+      return [];
+    }
+  }
+
+  function saveOfflineQueue(queue) {
+    localStorage.setItem(OFFLINE_QUEUE_KEY, JSON.stringify(queue));
+  }
+
+  function queueOfflineOrder(orderData, clientId) {
+    const queue = loadOfflineQueue();
+    queue.push({ ...orderData, client_id: clientId, recorded_at: new Date().toISOString() });
+    saveOfflineQueue(queue);
+  }
+
+  function describeSyncErrors(errors) {
+    const messages = [];
+    const collect = value => {
+      if (Array.isArray(value)) value.forEach(collect);
+      else if (value && typeof value === 'object') Object.values(value).forEach(collect);
+      else if (value) messages.push(String(value));
+    };
+    collect(errors);
+    const text = document.createElement('span');
+    text.textContent = messages.join(' ') || 'Rejected by the server.';
+    return text.innerHTML;
+  }
+
+  async function syncOfflineOrders() {
+    if (isSyncing || !navigator.onLine) return;
+    const queue = loadOfflineQueue();
+    if (queue.length === 0) return;
+
+    isSyncing = true;
+    let synced = 0;
+    let offset = 0;
+    const rejected = [];
+    const short = [];
+    try {
+      while (offset < queue.length) {
+        const batch = queue.slice(offset, offset + SYNC_BATCH_SIZE);
+        const response = await fetch(`${API_BASE_URL}orders/sync/`, {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': getCSRFToken()
+          },
+          credentials: 'same-origin',
+          body: JSON.stringify({ orders: batch.map(({ sync_errors, ...order }) => order) })
+        });
+        if (!response.ok) {
+          console.error('Offline order sync failed:', response.status);
+          break;
+        }
+
+        const { results } = await response.json();
+        const kept = [];
+        batch.forEach(order => {
+          const result = results[order.client_id];
+          if (!result || result.status === 'error') {
+            // Keep rejected sales queued so the cashier can see and act on them
+            kept.push({ ...order, sync_errors: result ? result.errors : null });
+            rejected.push(kept[kept.length - 1]);
+          } else {
+            synced++;
+            if (result.stock_shortfall) short.push(result);
+          }
+        });
+        queue.splice(offset, batch.length, ...kept);
+        offset += kept.length;
+        saveOfflineQueue(queue);
+      }
+    } catch (error) {
+      console.warn('Offline order sync interrupted:', error);
+    } finally {
+      isSyncing = false;
+    }
+
+    if (synced) {
+      showAlert(`Synced ${synced} offline order(s).`, 'success');
+      await reloadProductInfo();
+    }
+    if (short.length) {
+      const orders = short.map(r => `#${r.order_id} (${r.stock_shortfall} unit(s))`).join(', ');
+      showAlert(`Offline sales sold more than was in stock: ${orders}. Please check stock levels.`, 'warning', 0);
+    }
+    if (rejected.length) {
+      const details = rejected.map(order =>
+        `<li>${new Date(order.recorded_at).toLocaleString()}: ${describeSyncErrors(order.sync_errors)}</li>`
+      ).join('');
+      showAlert(
+        `${rejected.length} offline order(s) were rejected and are still queued on this register:<ul class="mb-0">${details}</ul>`,
+        'danger', 0
+      );
+    }
+  }
+
+  window.addEventListener('online', syncOfflineOrders);
+
   window.printReceipt = () => {
     const receiptContent = document.getElementById('receiptContent').innerHTML;
     const printWindow = window.open('', '_blank');
@@ -513,4 +708,5 @@ document.addEventListener('DOMContentLoaded', () => {
 
   // Initialize display
   updateCartDisplay();
+  syncOfflineOrders();
 });
\ No newline at end of file
@@ -27,7 +27,7 @@ class SubscriptionRequiredMiddleware:
             return self.get_response(request)
         
         # Check if user has active subscription
-        if not hasattr(request.user, 'subscription') or not request.user.subscription.active:
+        if not request.subscription or not request.subscription.active:
             return redirect('subscriptions:subscription_options')
         
         return self.get_response(request)
\ No newline at end of file
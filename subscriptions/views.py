@@ -12,7 +12,7 @@ stripe.api_key = settings.STRIPE_SECRET_KEY
 
 @login_required
 def subscription_options(request):
-    if hasattr(request.user, 'subscription') and request.user.subscription.active and not request.user.is_superuser:
+    if request.subscription and request.subscription.active and not request.user.is_superuser:
         return redirect('dashboard')
     
     tiers = [